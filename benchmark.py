@@ -0,0 +1,271 @@
+"""
+Benchmarks do bot de pagamentos, com dados sintéticos e sem conectar ao Discord
+nem ao Google Drive.
+
+Uso:
+    python benchmark.py memoria [--membros 5000] [--meses 60]
+    python benchmark.py carga [--membros 1000,10000] [--anos 1,5] [--repeticoes 200]
+    python benchmark.py --json resultados.json carga ...
+
+memoria: compara o uso de memória do modelo antigo de membros (dicionário com
+histórico {"YYYY-MM": bool}) com o modelo compacto (Member com bitsets).
+
+carga: gera workbooks sintéticos (membros, histórico mensal, vínculos de contas e
+pagamento automático) e mede tempo e pico de memória de load_data, save_data,
+register_payment, unregister_payment, get_payment_status e dos comandos !status e
+!historico, executados com um ctx falso.
+
+Com --json, os resultados são gravados em formato legível por máquina para
+comparação entre versões.
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import main
+from main import Member, month_label, month_offset
+
+
+def synthetic_history(members, months, seed=0, last_month=None):
+    """
+    Gera (user_id, username, {mês: pago}) para membros com `months` meses de histórico,
+    terminando em `last_month` (padrão: dezembro de 2024).
+    """
+    rng = random.Random(seed)
+    end = month_offset(last_month or "2024-12")
+    labels = [month_label(end - months + 1 + i) for i in range(months)]
+    for index in range(members):
+        user_id = str(100000000000000000 + index)
+        yield user_id, f"membro{index}", {month: rng.random() < 0.8 for month in labels}
+
+
+def measure(build):
+    """Memória (bytes) retida pela estrutura retornada por build()."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        data = build()
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return after - before, data
+
+
+def bench_memory(members, months):
+    history = list(synthetic_history(members, months))
+
+    legacy_bytes, legacy = measure(lambda: {
+        # Chaves novas por membro, como as criadas por parse_payments ao ler o workbook
+        user_id: {"username": username, "payments": {month[:4] + month[4:]: paid for month, paid in payments.items()}}
+        for user_id, username, payments in history
+    })
+    compact_bytes, compact = measure(lambda: {
+        user_id: Member(username, payments) for user_id, username, payments in history
+    })
+
+    # As duas representações devem expor o mesmo conteúdo
+    sample = history[len(history) // 2][0]
+    assert dict(compact[sample]["payments"]) == legacy[sample]["payments"]
+
+    entries = members * months
+    print(f"📊 {members} membros × {months} meses ({entries} registros)")
+    print(f"   dicionários: {legacy_bytes / 1024 / 1024:8.2f} MiB ({legacy_bytes / entries:.1f} B/registro)")
+    print(f"   Member:      {compact_bytes / 1024 / 1024:8.2f} MiB ({compact_bytes / entries:.1f} B/registro)")
+    print(f"   redução:     {legacy_bytes / max(compact_bytes, 1):.1f}x")
+    return {"members": members, "months": months, "legacy_bytes": legacy_bytes, "compact_bytes": compact_bytes}
+
+
+# Carga sintética
+class FakeMember:
+    def __init__(self, user_id, name):
+        self.id = int(user_id)
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+
+
+class FakeGuild:
+    def __init__(self, guild_id, members):
+        self.id = guild_id
+        self.name = f"benchmark-{guild_id}"
+        self.members = members
+
+
+class FakeContext:
+    """ctx mínimo para chamar os comandos diretamente: guarda as mensagens enviadas."""
+
+    def __init__(self, guild, author):
+        self.guild = guild
+        self.author = author
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+
+
+def write_synthetic_workbook(path, members, years, seed=0):
+    """Gera um workbook no formato do bot com histórico terminando no mês de cobrança atual."""
+    rng = random.Random(seed)
+    last_month = main.billing_month(15)
+    history = {
+        user_id: {"username": username, "payments": payments, "late": []}
+        for user_id, username, payments in synthetic_history(members, years * 12, seed, last_month)
+    }
+    user_ids = list(history)
+    # ~5% de contas secundárias vinculadas e ~2% com pagamento automático
+    secondary = rng.sample(user_ids, members // 20)
+    account_links = {user_id: rng.choice(user_ids) for user_id in secondary}
+    auto_paid = rng.sample(user_ids, members // 50)
+    snapshot = {
+        "members": history,
+        "account_links": account_links,
+        "auto_paid_members": auto_paid,
+        "payment_day": 15,
+        "notification_channel": None,
+    }
+    writer = main.PaymentManager.__new__(main.PaymentManager)
+    writer.filename = path
+    with contextlib.redirect_stdout(io.StringIO()):
+        writer._write_workbook(snapshot)
+    return user_ids
+
+
+def run_timed(func, repeat=1):
+    """Executa func `repeat` vezes; retorna o resultado da última chamada, o tempo total e o pico de memória."""
+    gc.collect()
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = func()
+        seconds = time.perf_counter() - started
+
+        # Segunda execução com tracemalloc, só para o pico de memória (o rastreamento distorce o tempo)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, {
+        "calls": repeat,
+        "seconds": seconds,
+        "ms_per_call": seconds * 1000 / repeat,
+        "peak_bytes": peak,
+    }
+
+
+def bench_load(members, years, repeat, workdir):
+    path = os.path.join(workdir, f"payments_{members}_{years}.xlsx")
+    user_ids = write_synthetic_workbook(path, members, years)
+    results = {"members": members, "years": years, "file_bytes": os.path.getsize(path), "operations": {}}
+    operations = results["operations"]
+    rng = random.Random(1)
+    sample = [rng.choice(user_ids) for _ in range(repeat)]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Intervalo longo: nenhuma gravação em segundo plano durante as medições
+        manager = main.PaymentManager(path, save_interval=3600, storage=main.WorkbookStorage())
+
+    _, operations["load_data"] = run_timed(manager.load_data)
+    _, operations["save_data"] = run_timed(manager.save_data)
+
+    calls = iter(sample * 2)
+    _, operations["register_payment"] = run_timed(
+        lambda: manager.register_payment(next(calls), "benchmark"), repeat
+    )
+    calls = iter(sample * 2)
+    _, operations["unregister_payment"] = run_timed(lambda: manager.unregister_payment(next(calls)), repeat)
+    _, operations["get_payment_status"] = run_timed(manager.get_payment_status, max(1, repeat // 20))
+
+    # Comandos: o gerenciador é registrado diretamente no GuildRegistry (sem Drive)
+    guild = FakeGuild(members * 100 + years, [FakeMember(user_id, f"membro{user_id}") for user_id in sample[:10]])
+    registry = main.guild_managers
+    registry._managers[guild.id] = main.AsyncPaymentManager(manager, registry.drive_pool, registry.disk_pool)
+    registry._last_used[guild.id] = time.monotonic()
+    loop = asyncio.new_event_loop()
+    try:
+        target = FakeMember(sample[0], "membro")
+        ctx = FakeContext(guild, target)
+        _, operations["!status"] = run_timed(
+            lambda: loop.run_until_complete(main.payment_status.callback(ctx)), max(1, repeat // 20)
+        )
+        results["status_message_chars"] = len(ctx.sent[-1])
+        _, operations["!historico"] = run_timed(
+            lambda: loop.run_until_complete(main.payment_history.callback(ctx, target)), repeat
+        )
+    finally:
+        loop.close()
+        registry._managers.pop(guild.id, None)
+        registry._last_used.pop(guild.id, None)
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager.close()
+
+    print(f"📊 {members} membros × {years} anos ({results['file_bytes'] / 1024 / 1024:.1f} MiB)")
+    for name, stats in operations.items():
+        print(
+            f"   {name:<20} {stats['ms_per_call']:10.3f} ms/chamada"
+            f"  ({stats['calls']} chamadas, pico {stats['peak_bytes'] / 1024 / 1024:.2f} MiB)"
+        )
+    return results
+
+
+def parse_sizes(value):
+    return [int(size) for size in value.split(",") if size]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmarks do bot de pagamentos")
+    parser.add_argument("--json", help="grava os resultados neste arquivo JSON")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    memory = subparsers.add_parser("memoria", help="memória do modelo de membros")
+    memory.add_argument("--membros", type=int, default=5000)
+    memory.add_argument("--meses", type=int, default=60)
+    load = subparsers.add_parser("carga", help="tempo e memória das operações e comandos")
+    load.add_argument("--membros", type=parse_sizes, default=[1000, 10000], help="ex.: 1000,10000,100000")
+    load.add_argument("--anos", type=parse_sizes, default=[1, 5], help="anos de histórico, ex.: 1,10")
+    load.add_argument("--repeticoes", type=int, default=200, help="chamadas por operação")
+    args = parser.parse_args()
+
+    results = {
+        "benchmark": args.benchmark,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "storage_backend": "workbook",
+        "results": [],
+    }
+    if args.benchmark == "memoria":
+        results["results"].append(bench_memory(args.membros, args.meses))
+    elif args.benchmark == "carga":
+        workdir = tempfile.mkdtemp(prefix="bot-benchmark-")
+        try:
+            for members in args.membros:
+                for years in args.anos:
+                    results["results"].append(bench_load(members, years, args.repeticoes, workdir))
+        finally:
+            main.guild_managers.close()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+        print(f"✅ Resultados gravados em {args.json}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main_cli()
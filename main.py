@@ -1,396 +1,4027 @@
+import time
+STARTED_AT = time.perf_counter()  # início do processo, para medir o tempo até o primeiro comando
+
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from dotenv import load_dotenv
-from openpyxl import Workbook, load_workbook
-from googleapiclient.discovery import build
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
-from google.oauth2.credentials import Credentials
+# openpyxl e as bibliotecas do Google são importadas no primeiro uso: a inicialização
+# não paga por elas quando os dados vêm do snapshot local (ou do backend sqlite)
 import os
-import requests
+import io
+import re
+import ast
+import json
+import hashlib
+import sqlite3
+import atexit
+import asyncio
+import functools
+import threading
+import queue
+import tempfile
+import mimetypes
+import calendar
+import csv
+import heapq
+import bisect
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
 from datetime import datetime, timedelta
 
+try:
+    from PIL import Image  # Opcional: recompressão de comprovantes grandes
+except ImportError:
+    Image = None
+
+try:
+    import fcntl  # Opcional: lock entre processos do FakeDrive (indisponível no Windows)
+except ImportError:
+    fcntl = None
+
+
+load_dotenv()
+
+TOKEN = os.getenv("DISCORD_TOKEN")
+GOOGLE_CREDENTIALS = 'credentials.json'
+DRIVE_SCOPES = ['https://www.googleapis.com/auth/drive']
+NOTIFICATION_CHANNEL = int(os.getenv("NOTIFICATION_CHANNEL", "0"))  # canal padrão; cada servidor pode definir o seu
+SUBSCRIPTION_PRICE_USD = 20  # preço mensal da assinatura, em dólares
+SUBSCRIPTION_SPLIT = 5       # número de pessoas que dividem a assinatura
+PIX_KEY = "146.980.396-81"
+folder_id = "xxxxxxxxxxxxxxxx"
+SAVE_INTERVAL = float(os.getenv("SAVE_INTERVAL", "5"))  # segundos entre gravações em lote
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "workbook")  # "workbook", "journal" ou "sqlite"
+COMPACT_INTERVAL = float(os.getenv("COMPACT_INTERVAL", "300"))  # segundos entre compactações do journal
+DRIVE_BACKEND = os.getenv("DRIVE_BACKEND", "google")  # "google" ou "fake" (pasta local, para testes offline)
+FAKE_DRIVE_DIR = os.getenv("FAKE_DRIVE_DIR", "fake_drive")  # pasta usada pelo DRIVE_BACKEND=fake
+SYNC_ATTEMPTS = 3  # tentativas de envio ao Drive quando o arquivo remoto muda durante a sincronização
+DRIVE_WORKERS = int(os.getenv("DRIVE_WORKERS", "4"))  # threads para chamadas ao Google Drive
+EXCHANGE_RATE_TTL = float(os.getenv("EXCHANGE_RATE_TTL", "600"))  # segundos de validade da cotação em cache
+EXCHANGE_RATE_TIMEOUT = float(os.getenv("EXCHANGE_RATE_TIMEOUT", "5"))  # timeout da API de cotação
+UPLOAD_DEBOUNCE = float(os.getenv("UPLOAD_DEBOUNCE", "10"))  # segundos agrupando pedidos de sincronização
+DISK_WORKERS = int(os.getenv("DISK_WORKERS", "4"))  # threads para gravação/leitura dos dados dos servidores
+GUILD_FILE_TEMPLATE = os.getenv("GUILD_FILE_TEMPLATE", "payments_{guild_id}.xlsx")  # arquivo de dados por servidor
+LEGACY_GUILD_ID = os.getenv("LEGACY_GUILD_ID")  # servidor que continua usando o payments.xlsx original
+MAX_RESIDENT_GUILDS = int(os.getenv("MAX_RESIDENT_GUILDS", "20"))  # servidores mantidos em memória
+GUILD_IDLE_TIMEOUT = float(os.getenv("GUILD_IDLE_TIMEOUT", "1800"))  # segundos sem uso até descarregar um servidor
+RECEIPT_SPILL_SIZE = int(os.getenv("RECEIPT_SPILL_SIZE", str(5 * 1024 * 1024)))  # bytes em memória antes de ir para disco
+RECEIPT_TTL = float(os.getenv("RECEIPT_TTL", "3600"))  # segundos que um comprovante aguarda o !paguei
+RECEIPT_MAX_PENDING = int(os.getenv("RECEIPT_MAX_PENDING", "200"))  # comprovantes pendentes em memória
+RECEIPT_UPLOAD_CONCURRENCY = int(os.getenv("RECEIPT_UPLOAD_CONCURRENCY", "3"))  # uploads de comprovantes simultâneos
+RECEIPT_EXTENSIONS = ('jpg', 'jpeg', 'png', 'pdf')
+RECEIPT_INDEX = os.getenv("RECEIPT_INDEX", "receipts_index.json")  # índice hash -> ID no Drive
+RECEIPT_COMPRESS_SIZE = int(os.getenv("RECEIPT_COMPRESS_SIZE", str(1024 * 1024)))  # bytes a partir dos quais recomprime
+RECEIPT_MAX_DIMENSION = int(os.getenv("RECEIPT_MAX_DIMENSION", "2000"))  # maior lado (px) após redimensionar
+REMINDER_HOUR = int(os.getenv("REMINDER_HOUR", "9"))  # hora do dia em que os lembretes são enviados
+REMINDER_DAYS = (2, 0)  # dias antes do vencimento em que o lembrete é enviado
+SCHEDULE_FILE = os.getenv("SCHEDULE_FILE", "schedule.json")  # próximos disparos das tarefas agendadas
+SCHEDULE_GRACE = float(os.getenv("SCHEDULE_GRACE", "21600"))  # atraso máximo (s) para executar um disparo perdido
+REMINDER_DM = os.getenv("REMINDER_DM", "1") == "1"  # envia o lembrete por mensagem direta aos pendentes
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "10"))  # mensagens diretas enviadas simultaneamente
+MESSAGE_LIMIT = 2000  # limite de caracteres de uma mensagem do Discord
+METRICS_FILE = os.getenv("METRICS_FILE", "metrics.prom")  # métricas no formato Prometheus ("" desativa)
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "60"))  # segundos entre gravações do METRICS_FILE
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "12"))  # meses mantidos em memória (0 = sem arquivamento)
+HISTORY_PAGE_SIZE = 12  # meses por página do !historico
+IMPORT_EXTENSIONS = ('.csv', '.xlsx')  # arquivos aceitos pelo !importar
+FAST_START = os.getenv("FAST_START", "1") == "1"  # atende comandos com os dados locais enquanto o Drive sincroniza
+LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", "0.25"))  # atraso (s) do event loop considerado travamento
+
+
+intents = discord.Intents.all()
+intents.message_content = True
+intents.members = True
+
+# Métricas
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # segundos
+
+
+class Histogram:
+    """Histograma de durações com buckets fixos (METRIC_BUCKETS), no formato do Prometheus."""
+
+    __slots__ = ("buckets", "count", "sum", "errors")
+
+    def __init__(self):
+        self.buckets = [0] * (len(METRIC_BUCKETS) + 1)  # o último é o +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def observe(self, seconds, error=False):
+        self.buckets[bisect.bisect_left(METRIC_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if error:
+            self.errors += 1
+
+    def quantile(self, q):
+        """Estimativa do quantil pelo limite superior do bucket em que ele cai."""
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(METRIC_BUCKETS + (float("inf"),), self.buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    Instrumentação do bot: histogramas de latência dos comandos e das operações de I/O
+    (Google Drive, HTTP, workbook, Discord), travamentos do event loop acima de
+    LOOP_STALL_THRESHOLD e os contadores (stats) dos componentes. Os dados são exibidos
+    no !metrics e gravados periodicamente em METRICS_FILE no formato do Prometheus.
+    """
+
+    def __init__(self, path=METRICS_FILE, interval=METRICS_INTERVAL, stall_threshold=LOOP_STALL_THRESHOLD):
+        self.path = path
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self._lock = threading.Lock()
+        self.histograms = {}  # (tipo, nome) -> Histogram; tipo "command" ou o tipo de I/O
+        self.components = {}  # nome -> dicionário de stats do componente
+        self.stalls = {"count": 0, "max_seconds": 0.0, "recent": deque(maxlen=10)}
+        self.started_at = time.time()
+        self._tasks = []
+        self.executor = None  # pool de threads de disco usado para gravar o arquivo de métricas
+
+    def observe(self, kind, name, seconds, error=False):
+        with self._lock:
+            histogram = self.histograms.get((kind, name))
+            if histogram is None:
+                histogram = self.histograms[(kind, name)] = Histogram()
+            histogram.observe(seconds, error)
+
+    @contextmanager
+    def timer(self, kind, name):
+        started = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(kind, name, time.perf_counter() - started, error)
+
+    def instrument(self, kind, name=None):
+        """Decorador que mede cada chamada da função (síncrona ou assíncrona)."""
+        def decorator(func):
+            label = name or func.__name__
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.timer(kind, label):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(kind, label):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def register(self, component, stats):
+        """Inclui os stats (contadores numéricos) de um componente nas métricas."""
+        self.components[component] = stats
+
+    def unregister(self, component):
+        """Remove um componente das métricas (por exemplo, um servidor descarregado)."""
+        self.components.pop(component, None)
+
+    def start(self):
+        """Inicia o detector de travamentos do event loop e a gravação do arquivo de métricas."""
+        if self._tasks and not all(task.done() for task in self._tasks):
+            return
+        self._tasks = [asyncio.create_task(self._watch_loop())]
+        if self.path:
+            self._tasks.append(asyncio.create_task(self._export_loop()))
+
+    async def _watch_loop(self, interval=0.5):
+        """Dorme `interval` segundos e mede quanto o event loop demorou a acordar a tarefa."""
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            lag = loop.time() - expected
+            if lag >= self.stall_threshold:
+                with self._lock:
+                    self.stalls["count"] += 1
+                    self.stalls["max_seconds"] = max(self.stalls["max_seconds"], lag)
+                    self.stalls["recent"].append((datetime.now().strftime("%d/%m %H:%M:%S"), lag))
+                print(f"⚠️ Event loop travado por {lag:.2f}s.")
+
+    async def _export_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.write_prometheus)
+            except Exception as e:
+                print(f"❌ Erro ao gravar as métricas em {self.path}: {e}")
+
+    @staticmethod
+    def _label(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+    def render_prometheus(self):
+        """Métricas no formato de texto do Prometheus."""
+        with self._lock:
+            histograms = {key: (list(h.buckets), h.count, h.sum, h.errors) for key, h in self.histograms.items()}
+            stalls = dict(self.stalls)
+        lines = []
+        families = [
+            ("bot_command_duration_seconds", "Latência dos comandos do bot", "command",
+             lambda kind, name: f'command="{self._label(name)}"'),
+            ("bot_io_duration_seconds", "Duração das operações de I/O", None,
+             lambda kind, name: f'kind="{self._label(kind)}",operation="{self._label(name)}"'),
+        ]
+        for metric, description, family, labels in families:
+            selected = sorted(
+                (key, values) for key, values in histograms.items() if (key[0] == "command") == (family == "command")
+            )
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} histogram")
+            for (kind, name), (buckets, count, total, _) in selected:
+                label = labels(kind, name)
+                cumulative = 0
+                for bound, bucket in zip(METRIC_BUCKETS, buckets):
+                    cumulative += bucket
+                    lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {count}')
+                lines.append(f"{metric}_sum{{{label}}} {total:.6f}")
+                lines.append(f"{metric}_count{{{label}}} {count}")
+            errors_metric = metric.replace("_duration_seconds", "_errors_total")
+            lines.append(f"# TYPE {errors_metric} counter")
+            for (kind, name), (_, _, _, errors) in selected:
+                lines.append(f"{errors_metric}{{{labels(kind, name)}}} {errors}")
+
+        lines.append("# HELP bot_event_loop_stalls_total Travamentos do event loop acima do limite")
+        lines.append("# TYPE bot_event_loop_stalls_total counter")
+        lines.append(f"bot_event_loop_stalls_total {stalls['count']}")
+        lines.append("# TYPE bot_event_loop_stall_max_seconds gauge")
+        lines.append(f"bot_event_loop_stall_max_seconds {stalls['max_seconds']:.6f}")
+
+        lines.append("# HELP bot_component_stat Contadores internos dos componentes")
+        lines.append("# TYPE bot_component_stat gauge")
+        for component, stats in sorted(self.components.items()):
+            for stat, value in sorted(stats.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(
+                        f'bot_component_stat{{component="{self._label(component)}",stat="{self._label(stat)}"}} {value}'
+                    )
+        lines.append(f"bot_uptime_seconds {time.time() - self.started_at:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(self.render_prometheus())
+        os.replace(temp_path, self.path)
+
+    def summary_lines(self):
+        """Linhas do !metrics: latência por comando, I/O por tipo, travamentos e componentes."""
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            stalls = dict(self.stalls, recent=list(self.stalls["recent"]))
+        lines = ["⌨️ **Comandos** (chamadas · p50 · p95 · erros)"]
+        for (kind, name), histogram in histograms:
+            if kind == "command":
+                lines.append(
+                    f"`!{name}` {histogram.count} · ≤{histogram.quantile(0.5) * 1000:.0f}ms · "
+                    f"≤{histogram.quantile(0.95) * 1000:.0f}ms · {histogram.errors}"
+                )
+        lines.append("💾 **I/O** (chamadas · tempo total · médio · erros)")
+        for (kind, name), histogram in histograms:
+            if kind != "command":
+                lines.append(
+                    f"`{kind}.{name}` {histogram.count} · {histogram.sum:.2f}s · "
+                    f"{histogram.sum / histogram.count * 1000:.0f}ms · {histogram.errors}"
+                )
+        lines.append(
+            f"🐢 **Event loop**: {stalls['count']} travamentos ≥ {self.stall_threshold:.2f}s "
+            f"(máximo {stalls['max_seconds']:.2f}s)"
+        )
+        lines.extend(f"• {moment}: {lag:.2f}s" for moment, lag in stalls["recent"])
+        lines.append("📦 **Componentes**")
+        for component, stats in sorted(self.components.items()):
+            values = ", ".join(
+                f"{stat}={value}" for stat, value in stats.items()
+                if isinstance(value, (int, float)) and not isinstance(value, bool)
+            )
+            lines.append(f"`{component}` {values}")
+        return lines
+
+
+metrics = Metrics()
+
+# Marcos da inicialização, em segundos desde o início do processo
+startup = {"imports_seconds": round(time.perf_counter() - STARTED_AT, 3)}
+metrics.register("startup", startup)
+
+
+def mark_startup(milestone):
+    """Registra um marco da inicialização (apenas a primeira ocorrência) e o exibe no log."""
+    if milestone not in startup:
+        startup[milestone] = round(time.perf_counter() - STARTED_AT, 3)
+        print(f"⏱️ Inicialização: {milestone} em {startup[milestone]:.2f}s")
+
+
+@metrics.instrument("http", "exchange_rate")
+async def fetch_dollar_exchange_rate():
+    """Obtém a cotação atual do dólar em relação ao BRL."""
+    API_URL = "https://api.exchangerate-api.com/v4/latest/USD"
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=EXCHANGE_RATE_TIMEOUT)) as session:
+        async with session.get(API_URL) as response:
+            response.raise_for_status()
+            data = await response.json()
+            return data["rates"]["BRL"]
+
+
+def fixed_rate_source(rate):
+    """Fonte de cotação fixa, para testes locais sem acesso à API."""
+    async def source():
+        return rate
+    return source
+
+
+class ExchangeRateProvider:
+    """
+    Cotação do dólar com cache em memória (TTL). Chamadas simultâneas compartilham a
+    mesma busca em andamento e, se a API falhar ou estourar o timeout, a última cotação
+    conhecida continua sendo usada. A fonte é plugável (ex.: fixed_rate_source nos testes).
+    """
+
+    def __init__(self, source=None, ttl=EXCHANGE_RATE_TTL, timeout=EXCHANGE_RATE_TIMEOUT):
+        self.source = source or fetch_dollar_exchange_rate
+        self.ttl = ttl
+        self.timeout = timeout
+        self._rate = None
+        self._fetched_at = None
+        self._inflight = None
+        self.stats = {"hits": 0, "fetches": 0, "coalesced": 0, "errors": 0, "stale_served": 0}
+
+    async def get(self):
+        """Retorna a cotação atual, ou None se nunca foi possível obtê-la."""
+        if self._rate is not None and time.monotonic() - self._fetched_at < self.ttl:
+            self.stats["hits"] += 1
+            return self._rate
+
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+        else:
+            self.stats["coalesced"] += 1
+        try:
+            return await asyncio.shield(self._inflight)
+        except Exception as e:
+            if self._rate is not None:
+                self.stats["stale_served"] += 1
+                print(f"❌ Erro ao buscar cotação do dólar, usando a última cotação conhecida: {e!r}")
+                return self._rate
+            print(f"❌ Erro ao buscar cotação do dólar: {e!r}")
+            return None
+
+    async def _refresh(self):
+        try:
+            self.stats["fetches"] += 1
+            rate = float(await asyncio.wait_for(self.source(), self.timeout))
+            self._rate = rate
+            self._fetched_at = time.monotonic()
+            return rate
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self._inflight = None
+
+
+exchange_rates = ExchangeRateProvider(
+    source=fixed_rate_source(float(os.environ["EXCHANGE_RATE_FIXED"])) if os.getenv("EXCHANGE_RATE_FIXED") else None
+)
+metrics.register("exchange_rate", exchange_rates.stats)
+
+# Inicializar o bot
+bot = commands.Bot(
+    command_prefix="!",
+    intents=intents,
+    description="Bot para gerenciamento de pagamentos",
+    help_command=commands.DefaultHelpCommand()
+)
+
+# Campos usados para detectar se o arquivo no Drive mudou desde a última sincronização
+DRIVE_VERSION_FIELDS = 'id, md5Checksum, modifiedTime, headRevisionId'
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+SQLITE_MIMETYPE = 'application/x-sqlite3'
+
+
+def remote_version(metadata):
+    """Identificador da versão de um arquivo do Drive a partir dos seus metadados."""
+    return (metadata.get('md5Checksum'), metadata.get('modifiedTime'), metadata.get('headRevisionId'))
+
+
+def unique_temp_path(path, suffix=".tmp"):
+    """
+    Caminho de um arquivo temporário novo no diretório de `path` (para os.replace atômico),
+    único por chamada para que threads gravando o mesmo destino não se sobrescrevam.
+    """
+    handle, temp_path = tempfile.mkstemp(
+        prefix=f"{os.path.basename(path)}.", suffix=suffix, dir=os.path.dirname(os.path.abspath(path))
+    )
+    os.close(handle)
+    return temp_path
+
+
+def write_json(path, data):
+    """Grava `data` em JSON de forma atômica (arquivo temporário único + os.replace)."""
+    temp_path = unique_temp_path(path)
+    try:
+        with open(temp_path, "w", encoding="utf-8") as json_file:
+            json.dump(data, json_file)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class DriveConflict(Exception):
+    """O arquivo no Drive mudou desde a versão esperada; `metadata` é a versão atual."""
+
+    def __init__(self, metadata):
+        super().__init__(f"Arquivo {metadata.get('id')} alterado no Google Drive desde a última sincronização")
+        self.metadata = metadata
+
+
+# Cliente compartilhado do Google Drive
+class DriveClient:
+    """
+    Mantém um único serviço do Google Drive (credenciais lidas e documento de discovery
+    processado uma vez) e um pool de conexões HTTP autenticadas reaproveitadas entre
+    threads. O token é renovado antes de expirar e as chamadas são contabilizadas.
+    """
+
+    REFRESH_MARGIN = timedelta(minutes=5)
+
+    def __init__(self, credentials_file=GOOGLE_CREDENTIALS, scopes=DRIVE_SCOPES, pool_size=DRIVE_WORKERS):
+        self.credentials_file = credentials_file
+        self.scopes = scopes
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._credentials = None
+        self._service = None
+        self._pool = queue.LifoQueue()
+        self._connections = 0
+        self.stats = {"calls": 0, "errors": 0, "token_refreshes": 0, "connections": 0, "conflicts": 0}
+
+    @property
+    def credentials(self):
+        with self._lock:
+            if self._credentials is None:
+                from google.oauth2.credentials import Credentials
+                self._credentials = Credentials.from_authorized_user_file(self.credentials_file, self.scopes)
+            return self._credentials
+
+    @property
+    def service(self):
+        """Serviço do Drive construído uma única vez (discovery estático, sem cache em disco)."""
+        credentials = self.credentials
+        with self._lock:
+            if self._service is None:
+                from googleapiclient.discovery import build
+                self._service = build('drive', 'v3', credentials=credentials, cache_discovery=False)
+            return self._service
+
+    def _refresh_if_needed(self):
+        """Renova o token de acesso antes de expirar, evitando um 401 no meio de uma chamada."""
+        credentials = self.credentials
+        with self._lock:
+            expiring = credentials.expiry is not None and credentials.expiry - self.REFRESH_MARGIN <= datetime.utcnow()
+            if not credentials.valid or expiring:
+                from google.auth.transport.requests import Request as GoogleAuthRequest
+                credentials.refresh(GoogleAuthRequest())
+                self.stats["token_refreshes"] += 1
+
+    @contextmanager
+    def connection(self):
+        """Empresta uma conexão HTTP autenticada do pool (httplib2 não é thread-safe)."""
+        self._refresh_if_needed()
+        try:
+            http = self._pool.get_nowait()
+        except queue.Empty:
+            import httplib2
+            from google_auth_httplib2 import AuthorizedHttp
+            http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+            with self._lock:
+                self.stats["connections"] += 1
+        try:
+            yield http
+        finally:
+            if self._pool.qsize() < self.pool_size:
+                self._pool.put(http)
+
+    @metrics.instrument("drive")
+    def execute(self, request):
+        """Executa uma requisição da API do Drive usando uma conexão do pool."""
+        with self._lock:
+            self.stats["calls"] += 1
+        try:
+            with self.connection() as http:
+                return request.execute(http=http)
+        except Exception:
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+
+    def create_file(self, stream, name, mimetype, parents=None, chunksize=1024 * 1024, fields='id'):
+        """Cria um arquivo no Drive com upload resumable, em partes, a partir de um stream."""
+        metadata = {'name': name}
+        if parents:
+            metadata['parents'] = parents
+        from googleapiclient.http import MediaIoBaseUpload
+        stream.seek(0)
+        media = MediaIoBaseUpload(stream, mimetype=mimetype, chunksize=chunksize, resumable=True)
+        return self.upload(self.service.files().create(body=metadata, media_body=media, fields=fields))
+
+    # Arquivos de dados dos servidores
+    def find_file(self, name, parent=None):
+        """ID do primeiro arquivo com o nome informado (opcionalmente dentro da pasta `parent`), ou None."""
+        query = f"name='{name}'"
+        if parent:
+            query += f" and '{parent}' in parents"
+        response = self.execute(self.service.files().list(q=query, spaces='drive', fields='files(id, name)'))
+        files = response.get('files', [])
+        return files[0]['id'] if files else None
+
+    def _not_found(self, error):
+        from googleapiclient.errors import HttpError
+        return isinstance(error, HttpError) and error.resp.status == 404
+
+    def metadata(self, file_id):
+        """Metadados de versão (DRIVE_VERSION_FIELDS); FileNotFoundError se o arquivo foi apagado."""
+        try:
+            return self.execute(self.service.files().get(fileId=file_id, fields=DRIVE_VERSION_FIELDS))
+        except Exception as e:
+            if self._not_found(e):
+                raise FileNotFoundError(file_id) from e
+            raise
+
+    def fetch(self, file_id, fd):
+        """Baixa o conteúdo do arquivo para o stream informado."""
+        self.download(self.service.files().get_media(fileId=file_id), fd)
+
+    def create_from_path(self, path, name, mimetype, parents=None):
+        """Cria um arquivo a partir de um arquivo local; retorna os metadados de versão."""
+        with open(path, "rb") as stream:
+            return self.create_file(stream, name, mimetype, parents, fields=DRIVE_VERSION_FIELDS)
+
+    def update_file(self, file_id, path, mimetype, expected=None):
+        """
+        Substitui o conteúdo do arquivo pelo arquivo local e retorna os metadados da nova
+        versão. Com `expected`, levanta DriveConflict se a versão remota for outra. A API
+        v3 do Drive não aceita pré-condições no update, então a versão é conferida logo
+        antes do envio (a janela de corrida fica restrita a essa requisição).
+        """
+        from googleapiclient.http import MediaFileUpload
+        if expected is not None:
+            metadata = self.metadata(file_id)
+            if remote_version(metadata) != expected:
+                with self._lock:
+                    self.stats["conflicts"] += 1
+                raise DriveConflict(metadata)
+        media = MediaFileUpload(path, mimetype=mimetype)
+        try:
+            return self.execute(
+                self.service.files().update(fileId=file_id, media_body=media, fields=DRIVE_VERSION_FIELDS)
+            )
+        except Exception as e:
+            if self._not_found(e):
+                raise FileNotFoundError(file_id) from e
+            raise
+
+    @metrics.instrument("drive")
+    def upload(self, request):
+        """Executa um upload resumable em partes, reaproveitando uma conexão do pool."""
+        with self._lock:
+            self.stats["calls"] += 1
+        try:
+            with self.connection() as http:
+                response = None
+                while response is None:
+                    status, response = request.next_chunk(http=http)
+                return response
+        except Exception:
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+
+    @metrics.instrument("drive")
+    def download(self, request, fd):
+        """Baixa o conteúdo de uma requisição de mídia para o arquivo/stream informado."""
+        from googleapiclient.http import MediaIoBaseDownload
+        with self._lock:
+            self.stats["calls"] += 1
+        try:
+            with self.connection() as http:
+                request.http = http
+                downloader = MediaIoBaseDownload(fd, request)
+                done = False
+                while not done:
+                    status, done = downloader.next_chunk()
+        except Exception:
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+
+
+class FakeDrive:
+    """
+    Backend do Google Drive em uma pasta local (DRIVE_BACKEND=fake), com a interface de
+    DriveClient usada pelo bot. Cada gravação gera uma nova revisão e o update confere a
+    versão esperada de forma atômica, então sincronização e conflitos podem ser testados
+    offline, por exemplo com duas instâncias do bot apontando para a mesma pasta.
+    """
+
+    def __init__(self, root=FAKE_DRIVE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "errors": 0, "conflicts": 0}
+
+    @contextmanager
+    def _index(self):
+        """Índice id -> metadados, lido e regravado com lock (entre threads e, com fcntl, entre processos)."""
+        path = os.path.join(self.root, "index.json")
+        with self._lock, open(os.path.join(self.root, ".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.stats["calls"] += 1
+            index = {}
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as index_file:
+                    index = json.load(index_file)
+            yield index
+            with open(f"{path}.tmp", "w", encoding="utf-8") as index_file:
+                json.dump(index, index_file, indent=1)
+            os.replace(f"{path}.tmp", path)
+
+    def _write(self, index, file_id, content, **fields):
+        """Grava uma nova revisão do arquivo e retorna os metadados de versão."""
+        with open(os.path.join(self.root, file_id), "wb") as stored:
+            stored.write(content)
+        entry = index.setdefault(file_id, {"id": file_id, "headRevisionId": "0"})
+        entry.update(fields)
+        entry["headRevisionId"] = str(int(entry["headRevisionId"]) + 1)
+        entry["md5Checksum"] = hashlib.md5(content).hexdigest()
+        entry["modifiedTime"] = datetime.utcnow().isoformat(timespec="milliseconds") + "Z"
+        return dict(entry)
+
+    def _entry(self, index, file_id):
+        if file_id not in index:
+            self.stats["errors"] += 1
+            raise FileNotFoundError(file_id)
+        return index[file_id]
+
+    def create_file(self, stream, name, mimetype, parents=None, chunksize=None, fields='id'):
+        stream.seek(0)
+        with self._index() as index:
+            return self._write(
+                index, os.urandom(8).hex(), stream.read(), name=name, mimeType=mimetype, parents=parents or []
+            )
+
+    def find_file(self, name, parent=None):
+        with self._index() as index:
+            for file_id, entry in index.items():
+                if entry["name"] == name and (parent is None or parent in entry["parents"]):
+                    return file_id
+        return None
+
+    def metadata(self, file_id):
+        with self._index() as index:
+            return dict(self._entry(index, file_id))
+
+    def fetch(self, file_id, fd):
+        with self._index() as index:
+            self._entry(index, file_id)
+            with open(os.path.join(self.root, file_id), "rb") as stored:
+                fd.write(stored.read())
+
+    def create_from_path(self, path, name, mimetype, parents=None):
+        with open(path, "rb") as stream:
+            return self.create_file(stream, name, mimetype, parents)
+
+    def update_file(self, file_id, path, mimetype, expected=None):
+        with open(path, "rb") as local:
+            content = local.read()
+        with self._index() as index:
+            entry = self._entry(index, file_id)
+            if expected is not None and remote_version(entry) != tuple(expected):
+                self.stats["conflicts"] += 1
+                raise DriveConflict(dict(entry))
+            return self._write(index, file_id, content)
+
+
+drive_client = FakeDrive() if DRIVE_BACKEND == "fake" else DriveClient()
+metrics.register("drive", drive_client.stats)
+
+
+# Merge de três vias dos dados sincronizados com o Drive
+EMPTY_SNAPSHOT = {
+    "members": {}, "account_links": {}, "auto_paid_members": [], "payment_day": None, "notification_channel": None,
+}
+
+
+def merge_value(base, local, remote):
+    """
+    Combina um valor alterado nos dois lados desde a base. Retorna (valor, conflito):
+    vale o lado que mudou; se os dois mudaram para valores diferentes, vale o local.
+    """
+    if local == remote or remote == base:
+        return local, False
+    if local == base:
+        return remote, False
+    return local, True
+
+
+def merge_payments(base, local, remote):
+    """
+    Merge mês a mês de um membro ({"payments": {mês: pago}, "late": [meses]}). Em um
+    conflito prevalece o mês pago: um pagamento registrado em qualquer réplica não se perde.
+    """
+    def status(info, month):
+        if month not in info["payments"]:
+            return None
+        return bool(info["payments"][month]), month in info["late"]
+
+    payments, late, conflicts = {}, [], 0
+    for month in sorted(set(base["payments"]) | set(local["payments"]) | set(remote["payments"])):
+        b, l, r = status(base, month), status(local, month), status(remote, month)
+        value, conflict = merge_value(b, l, r)
+        if conflict:
+            conflicts += 1
+            value = max((side for side in (l, r) if side is not None), key=lambda side: side[0])
+        if value is not None:
+            payments[month] = value[0]
+            if value[1]:
+                late.append(month)
+    return payments, late, conflicts
+
+
+def merge_snapshots(base, local, remote):
+    """
+    Merge de três vias entre o snapshot da última sincronização (`base`), os dados
+    locais e o arquivo atual do Drive, membro a membro e mês a mês. Cada lado mantém
+    as alterações que fez; quando os dois mudaram o mesmo item, vale o pagamento
+    registrado (meses) ou o valor local (demais campos), e um membro removido de um
+    lado e alterado do outro é mantido. Retorna (snapshot combinado, conflitos).
+    """
+    base = base or EMPTY_SNAPSHOT
+    conflicts = 0
+    members = {}
+    for user_id in {**base["members"], **local["members"], **remote["members"]}:
+        b, l, r = (side["members"].get(user_id) for side in (base, local, remote))
+        if l is None or r is None:
+            if l == r or (l if l is not None else r) == b:
+                continue  # removido em um lado e não alterado no outro (ou removido nos dois)
+            members[user_id] = l if l is not None else r
+            conflicts += b is not None
+            continue
+        b = b or {"username": None, "payments": {}, "late": []}
+        username, conflict = merge_value(b["username"], l["username"], r["username"])
+        payments, late, month_conflicts = merge_payments(b, l, r)
+        members[user_id] = {"username": username, "payments": payments, "late": late}
+        conflicts += conflict + month_conflicts
+
+    account_links = {}
+    for secondary_id in {**base["account_links"], **local["account_links"], **remote["account_links"]}:
+        value, conflict = merge_value(*(side["account_links"].get(secondary_id) for side in (base, local, remote)))
+        conflicts += conflict
+        if value is not None:
+            account_links[secondary_id] = value
+
+    base_auto, local_auto, remote_auto = (set(side["auto_paid_members"]) for side in (base, local, remote))
+    removed = (base_auto - local_auto) | (base_auto - remote_auto)
+    auto_paid_members = [
+        user_id for user_id in dict.fromkeys(local["auto_paid_members"] + remote["auto_paid_members"])
+        if user_id not in removed
+    ]
+
+    settings = {}
+    for name in ("payment_day", "notification_channel"):
+        settings[name], conflict = merge_value(base[name], local[name], remote[name])
+        conflicts += conflict
+
+    merged = {"members": members, "account_links": account_links, "auto_paid_members": auto_paid_members, **settings}
+    return merged, conflicts
+
+
+class DriveUploadScheduler:
+    """
+    Agrupa pedidos de sincronização com o Google Drive: pedidos feitos dentro da janela
+    de debounce viram um único upload (no máximo max_delay segundos após o primeiro).
+    Falhas são repetidas com backoff exponencial.
+    """
+
+    def __init__(self, upload, debounce=UPLOAD_DEBOUNCE, max_delay=None, retries=3, backoff=2.0):
+        self.upload = upload
+        self.debounce = debounce
+        self.max_delay = max_delay if max_delay is not None else debounce * 6
+        self.retries = retries
+        self.backoff = backoff
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._first_request = None
+        self._last_request = None
+        self._closed = False
+        self._thread = None
+        self.stats = {
+            "requests": 0,
+            "uploads": 0,
+            "coalesced": 0,
+            "retries": 0,
+            "failures": 0,
+            "last_upload_seconds": None,
+            "last_sync_latency": None,
+            "queue_depth": 0,
+        }
+
+    @property
+    def queue_depth(self):
+        """Pedidos de sincronização aguardando o próximo upload."""
+        return self._pending
+
+    def request(self):
+        """Registra um pedido de sincronização e inicia o worker se necessário."""
+        with self._cond:
+            now = time.monotonic()
+            self._pending += 1
+            self.stats["requests"] += 1
+            self.stats["queue_depth"] = self._pending
+            self._last_request = now
+            if self._first_request is None:
+                self._first_request = now
+            if self._thread is None or not self._thread.is_alive():
+                self._closed = False
+                self._thread = threading.Thread(target=self._run, name="drive-uploader", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # Espera a janela de debounce sem novos pedidos (ou o limite máximo)
+                while not self._closed:
+                    deadline = min(self._last_request + self.debounce, self._first_request + self.max_delay)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, 0
+                self.stats["queue_depth"] = 0
+                requested_at, self._first_request = self._first_request, None
+            self.stats["coalesced"] += batch - 1
+            self._upload_with_retry(requested_at)
+
+    def _upload_with_retry(self, requested_at):
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            started = time.monotonic()
+            try:
+                uploaded = self.upload()
+            except Exception as e:
+                print(f"❌ Erro na sincronização com o Google Drive: {e}")
+                uploaded = False
+            if uploaded:
+                finished = time.monotonic()
+                self.stats["uploads"] += 1
+                self.stats["last_upload_seconds"] = round(finished - started, 3)
+                self.stats["last_sync_latency"] = round(finished - requested_at, 3)
+                return True
+            if attempt < self.retries:
+                self.stats["retries"] += 1
+                time.sleep(delay)
+                delay *= 2
+        self.stats["failures"] += 1
+        print(f"❌ Sincronização com o Google Drive falhou após {self.retries + 1} tentativas.")
+        return False
+
+    def close(self):
+        """Envia imediatamente o que estiver pendente e encerra o worker."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+
+# Comprovantes de pagamento
+RECEIPT_CHUNK_SIZE = 1024 * 1024  # tamanho das partes do upload resumable (múltiplo de 256 KiB)
+
+
+def upload_receipt(drive, stream, name, mimetype):
+    """Envia um comprovante para a pasta do Google Drive e retorna o ID do arquivo."""
+    # Nome do arquivo no formato username - datapagamento
+    file = drive.create_file(stream, name, mimetype, parents=[folder_id], chunksize=RECEIPT_CHUNK_SIZE)
+    print(f"✅ Comprovante enviado para o Google Drive: {name}")
+    return file.get('id')
+
+
+class Receipt:
+    """Comprovante recebido aguardando o !paguei; o conteúdo vai para disco acima do limite."""
+
+    def __init__(self, filename, mimetype, spill_size=RECEIPT_SPILL_SIZE):
+        self.filename = filename
+        self.mimetype = mimetype
+        self.received_at = time.monotonic()
+        self.stream = tempfile.SpooledTemporaryFile(max_size=spill_size)
+
+    @property
+    def extension(self):
+        return os.path.splitext(self.filename)[1].lower()
+
+    def close(self):
+        self.stream.close()
+
+
+class ReceiptStore:
+    """
+    Envia comprovantes ao Google Drive sem duplicatas: o conteúdo é identificado pelo
+    SHA-256 e um índice local (hash -> ID no Drive) evita reenviar o mesmo arquivo.
+    Com o Pillow instalado, imagens PNG/JPEG grandes são reduzidas antes do envio.
+    """
+
+    def __init__(self, manager, index_path=RECEIPT_INDEX, compress_size=RECEIPT_COMPRESS_SIZE,
+                 max_dimension=RECEIPT_MAX_DIMENSION):
+        self.manager = manager
+        self.index_path = index_path
+        self.compress_size = compress_size
+        self.max_dimension = max_dimension
+        self._inflight = {}
+        self.stats = {"uploaded": 0, "duplicates": 0, "bytes_uploaded": 0, "bytes_saved": 0}
+        self.index = {}
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as index_file:
+                self.index = json.load(index_file)
+
+    @staticmethod
+    def digest(stream):
+        """SHA-256 do conteúdo do stream, lido em blocos."""
+        sha256 = hashlib.sha256()
+        stream.seek(0)
+        for block in iter(lambda: stream.read(1024 * 1024), b""):
+            sha256.update(block)
+        return sha256.hexdigest()
+
+    def compress(self, receipt):
+        """
+        Reduz imagens PNG/JPEG acima do limite (redimensiona e regrava otimizada).
+        Retorna o stream a enviar, que só é trocado se ficar menor que o original.
+        """
+        stream = receipt.stream
+        size = stream.seek(0, os.SEEK_END)
+        if Image is None or size < self.compress_size or receipt.mimetype not in ("image/png", "image/jpeg"):
+            return stream
+        stream.seek(0)
+        try:
+            with Image.open(stream) as image:
+                image.thumbnail((self.max_dimension, self.max_dimension))
+                compressed = io.BytesIO()
+                if receipt.mimetype == "image/jpeg":
+                    image.convert("RGB").save(compressed, format="JPEG", quality=85, optimize=True)
+                else:
+                    image.save(compressed, format="PNG", optimize=True)
+        except Exception as e:
+            print(f"❌ Não foi possível recomprimir o comprovante {receipt.filename}: {e}")
+            return stream
+        if compressed.tell() >= size:
+            return stream
+        self.stats["bytes_saved"] += size - compressed.tell()
+        return compressed
+
+    def _save_index(self):
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as index_file:
+            json.dump(self.index, index_file)
+        os.replace(temp_path, self.index_path)
+
+    async def save(self, receipt, name):
+        """Envia o comprovante (se ainda não foi enviado) e retorna o ID do arquivo no Drive."""
+        content_hash = await self.manager.run_on_disk(self.digest, receipt.stream)
+        if content_hash in self.index:
+            self.stats["duplicates"] += 1
+            self.stats["bytes_saved"] += receipt.stream.seek(0, os.SEEK_END)
+            print(f"♻️ Comprovante {name} já enviado anteriormente, upload ignorado.")
+            return self.index[content_hash]
+        if content_hash in self._inflight:
+            # O mesmo arquivo está sendo enviado agora (ex.: anexado duas vezes)
+            self.stats["duplicates"] += 1
+            self.stats["bytes_saved"] += receipt.stream.seek(0, os.SEEK_END)
+            return await asyncio.shield(self._inflight[content_hash])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[content_hash] = future
+        try:
+            stream = await self.manager.run_on_disk(self.compress, receipt)
+            file_id = await self.manager.upload_receipt(stream, name, receipt.mimetype)
+            self.stats["uploaded"] += 1
+            self.stats["bytes_uploaded"] += stream.seek(0, os.SEEK_END)
+            self.index[content_hash] = file_id
+            await self.manager.run_on_disk(self._save_index)
+            future.set_result(file_id)
+            return file_id
+        except Exception as e:
+            future.set_exception(e)
+            # Evita o aviso de exceção não consumida quando ninguém mais aguarda o envio
+            future.exception()
+            raise
+        finally:
+            del self._inflight[content_hash]
+
+
+class ReceiptPipeline:
+    """
+    Guarda os comprovantes enviados no chat até o membro usar o !paguei no mesmo
+    servidor e os envia ao Google Drive em paralelo (com limite de uploads simultâneos). Comprovantes
+    esquecidos expiram pelo TTL e, acima do limite, os mais antigos são descartados.
+    """
+
+    def __init__(self, store, ttl=RECEIPT_TTL, max_pending=RECEIPT_MAX_PENDING,
+                 concurrency=RECEIPT_UPLOAD_CONCURRENCY):
+        self.store = store
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._pending = OrderedDict()  # (guild_id, user_id) -> [Receipt], do mais antigo ao mais recente
+        self._count = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.stats = {"received": 0, "uploaded": 0, "failed": 0, "expired": 0, "evicted": 0}
+
+    @staticmethod
+    def accepts(attachment):
+        return attachment.filename.lower().endswith(RECEIPT_EXTENSIONS)
+
+    async def add(self, guild_id, user_id, attachment):
+        """Lê o anexo (em memória ou em arquivo temporário) e guarda como comprovante pendente do membro no servidor."""
+        mimetype = attachment.content_type or mimetypes.guess_type(attachment.filename)[0] or 'application/octet-stream'
+        receipt = Receipt(attachment.filename, mimetype.split(';')[0])
+        # Attachment.save só aceita caminhos ou io.BufferedIOBase; SpooledTemporaryFile não é
+        # um deles, então o conteúdo é copiado aqui (e vai para disco acima de RECEIPT_SPILL_SIZE)
+        receipt.stream.write(await attachment.read())
+        receipt.stream.seek(0)
+
+        self._evict_expired()
+        key = (guild_id, user_id)
+        self._pending.setdefault(key, []).append(receipt)
+        self._pending.move_to_end(key)
+        self._count += 1
+        self.stats["received"] += 1
+        while self._count > self.max_pending:
+            # Descarta o comprovante mais antigo do membro usado há mais tempo
+            oldest = next(iter(self._pending))
+            self._pending[oldest].pop(0).close()
+            if not self._pending[oldest]:
+                del self._pending[oldest]
+            self._count -= 1
+            self.stats["evicted"] += 1
+        return receipt
+
+    def take(self, guild_id, user_id):
+        """Remove e retorna os comprovantes pendentes de um membro no servidor."""
+        self._evict_expired()
+        receipts = self._pending.pop((guild_id, user_id), [])
+        self._count -= len(receipts)
+        return receipts
+
+    def _drop(self, key, reason):
+        receipts = self._pending.pop(key)
+        self._count -= len(receipts)
+        self.stats[reason] += len(receipts)
+        for receipt in receipts:
+            receipt.close()
+
+    def _evict_expired(self):
+        cutoff = time.monotonic() - self.ttl
+        # O dict está em ordem de uso: basta olhar os mais antigos
+        while self._pending:
+            key, receipts = next(iter(self._pending.items()))
+            if receipts[-1].received_at >= cutoff:
+                break
+            self._drop(key, "expired")
+
+    async def upload(self, receipts, name):
+        """Envia os comprovantes em paralelo; retorna quantos foram enviados com sucesso."""
+        async def send(index, receipt):
+            suffix = f" ({index + 1})" if len(receipts) > 1 else ""
+            async with self._semaphore:
+                try:
+                    await self.store.save(receipt, f"{name}{suffix}{receipt.extension}")
+                    self.stats["uploaded"] += 1
+                    return True
+                except Exception as e:
+                    self.stats["failed"] += 1
+                    print(f"❌ Falha ao enviar o comprovante {receipt.filename}: {e}")
+                    return False
+                finally:
+                    receipt.close()
+
+        results = await asyncio.gather(*(send(index, receipt) for index, receipt in enumerate(receipts)))
+        return sum(results)
+
+
+# Classe para gerenciamento de pagamentos
+
+# Formato legado da coluna Payments: repr de um dict, ex. "{'2025-01': True, '2025-02': False}"
+PAYMENT_ENTRY = re.compile(r"'(\d{4}-\d{2})'\s*:\s*(True|False)")
+
+
+def parse_payments(value):
+    """Converte a célula de pagamentos em dict sem usar eval()."""
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        return value
+    value = str(value)
+    entries = PAYMENT_ENTRY.findall(value)
+    if len(entries) != value.count(":"):
+        # Formato inesperado: recorre ao parser seguro de literais do Python
+        payments = ast.literal_eval(value)
+        if not isinstance(payments, dict):
+            raise ValueError(f"Histórico de pagamentos inválido: {value!r}")
+        return {str(month): bool(paid) for month, paid in payments.items()}
+    return {month: paid == "True" for month, paid in entries}
+
+
+def parse_late_months(value):
+    """Lê a coluna Late da aba Payments: meses pagos após o vencimento, separados por vírgula."""
+    if not value:
+        return ()
+    return [month.strip() for month in str(value).split(",") if month.strip()]
+
+
+# Período de cobrança
+def billing_month(payment_day, today=None):
+    """
+    Mês de cobrança vigente ("YYYY-MM"): até o dia do vencimento é o mês atual;
+    depois do vencimento, os pagamentos já contam para o mês seguinte.
+    """
+    today = today or datetime.now()
+    if today.day > payment_day:
+        year, month = (today.year + 1, 1) if today.month == 12 else (today.year, today.month + 1)
+        return f"{year:04d}-{month:02d}"
+    return today.strftime("%Y-%m")
+
+
+def due_date(payment_day, today=None):
+    """
+    Data de vencimento do mês de cobrança vigente. Em meses mais curtos o dia é
+    ajustado para o último dia do mês (ex.: vencimento dia 31 em fevereiro).
+    """
+    return month_due_date(billing_month(payment_day, today), payment_day)
+
+
+def month_due_date(month, payment_day):
+    """Data de vencimento de um mês "YYYY-MM", com o dia limitado ao último dia do mês."""
+    year, number = map(int, month.split("-"))
+    day = min(int(payment_day), calendar.monthrange(year, number)[1])
+    return datetime(year, number, day)
+
+
+def _months_from(moment, count=3):
+    """Os `count` meses ("YYYY-MM") a partir do mês de `moment`."""
+    for step in range(count):
+        year, number = divmod(moment.month - 1 + step, 12)
+        yield f"{moment.year + year:04d}-{number + 1:02d}"
+
+
+def next_reminder(payment_day, after, hour=REMINDER_HOUR):
+    """Próximo horário de lembrete (REMINDER_DAYS antes do vencimento, na hora indicada) depois de `after`."""
+    return min(
+        moment
+        for month in _months_from(after)
+        for days_before in REMINDER_DAYS
+        for moment in [month_due_date(month, payment_day).replace(hour=hour) - timedelta(days=days_before)]
+        if moment > after
+    )
+
+
+def next_rollover(payment_day, after):
+    """Próxima virada do mês de cobrança (o dia seguinte ao vencimento, à meia-noite) depois de `after`."""
+    for month in _months_from(after):
+        year, number = map(int, month.split("-"))
+        if payment_day < calendar.monthrange(year, number)[1]:
+            moment = datetime(year, number, payment_day + 1)
+        else:
+            # Vencimento no último dia do mês: a virada é no dia 1º do mês seguinte
+            moment = datetime(year, number, 1) + timedelta(days=calendar.monthrange(year, number)[1])
+        if moment > after:
+            return moment
+
+
+# Modelo compacto de membros
+MONTH_EPOCH = 2000  # os meses são guardados como deslocamentos inteiros a partir de janeiro deste ano
+
+
+def month_offset(month):
+    """Converte "YYYY-MM" em um inteiro (meses desde MONTH_EPOCH-01)."""
+    year, number = month.split("-")
+    number = int(number)
+    if len(year) != 4 or not 1 <= number <= 12:
+        raise ValueError(f"Mês inválido: {month!r}")
+    return (int(year) - MONTH_EPOCH) * 12 + number - 1
+
+
+def month_label(offset):
+    """Converte um deslocamento de month_offset de volta para "YYYY-MM"."""
+    year, number = divmod(offset, 12)
+    return f"{year + MONTH_EPOCH:04d}-{number + 1:02d}"
+
+
+def months_between(start, end):
+    """Meses de `start` a `end` ("YYYY-MM"), inclusive, em ordem cronológica."""
+    return [month_label(offset) for offset in range(month_offset(start), month_offset(end) + 1)]
+
+
+# Operações em lote
+IMPORT_COLUMNS = {
+    "user_id": ("user_id", "userid", "id", "usuario_id"),
+    "username": ("username", "usuario", "usuário", "nome"),
+    "month": ("month", "mes", "mês"),
+    "paid": ("paid", "pago", "status"),
+}
+PAID_VALUES = {"1", "sim", "s", "true", "x", "pago", "✅"}
+UNPAID_VALUES = {"0", "nao", "não", "n", "false", "pendente", "nao pago", "não pago", "❌"}
+
+
+def validate_payment_entries(entries, lines=None):
+    """
+    Valida em lote entradas (user_id, username, mês, pago) antes de qualquer alteração:
+    cada mês distinto é conferido uma única vez e o mesmo membro/mês com status
+    diferentes é recusado. `lines` identifica cada entrada nas mensagens (ex.: linha
+    do arquivo importado). Retorna a lista de erros (vazia se tudo for válido).
+    """
+    invalid_months = set()
+    for month in {entry[2] for entry in entries}:
+        try:
+            month_offset(month)
+        except (ValueError, TypeError, AttributeError):
+            invalid_months.add(month)
+
+    errors = []
+    seen = {}
+    for index, (user_id, username, month, paid) in enumerate(entries):
+        label = f"linha {lines[index]}" if lines else f"entrada {index + 1}"
+        if not user_id.isdigit():
+            errors.append(f"{label}: ID de usuário inválido {user_id!r}")
+        if month in invalid_months:
+            errors.append(f"{label}: mês inválido {month!r} (use YYYY-MM)")
+        elif seen.setdefault((user_id, month), paid) != paid:
+            errors.append(f"{label}: status conflitante para {user_id} em {month}")
+    return errors
+
+
+def _import_rows(filename, content):
+    """Linhas (listas de valores) de um CSV (separado por vírgula, ponto e vírgula ou tab) ou XLSX."""
+    if filename.lower().endswith(".xlsx"):
+        from openpyxl import load_workbook
+        workbook = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        try:
+            return [list(row) for row in workbook.worksheets[0].iter_rows(values_only=True)]
+        finally:
+            workbook.close()
+    text = content.decode("utf-8-sig")
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    return list(csv.reader(io.StringIO(text), dialect))
+
+
+def _import_cell(value):
+    """Normaliza uma célula: datas viram "YYYY-MM", números inteiros perdem o ".0"."""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m")
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return "" if value is None else str(value).strip()
+
+
+def read_payment_import(filename, content):
+    """
+    Lê um arquivo de importação de pagamentos (CSV ou XLSX) com cabeçalho e as colunas
+    user_id e mes (obrigatórias), pago e username (opcionais; sem "pago" a linha conta
+    como paga). Retorna (entradas, linhas, erros), com entradas no formato de
+    PaymentManager.bulk_set_payments (username None quando ausente).
+    """
+    rows = _import_rows(filename, content)
+    if not rows:
+        return [], [], ["arquivo vazio"]
+    header = [_import_cell(cell).lower() for cell in rows[0]]
+    columns = {
+        name: next((header.index(alias) for alias in aliases if alias in header), None)
+        for name, aliases in IMPORT_COLUMNS.items()
+    }
+    missing = [name for name in ("user_id", "month") if columns[name] is None]
+    if missing:
+        return [], [], [f"colunas obrigatórias ausentes: {', '.join(missing)}"]
+
+    def cell(row, name):
+        index = columns[name]
+        return _import_cell(row[index]) if index is not None and index < len(row) else ""
+
+    entries, lines, errors = [], [], []
+    for line, row in enumerate(rows[1:], start=2):
+        if not any(_import_cell(value) for value in row):
+            continue
+        paid = cell(row, "paid").lower()
+        if paid and paid not in PAID_VALUES and paid not in UNPAID_VALUES:
+            errors.append(f"linha {line}: status de pagamento inválido {paid!r}")
+            continue
+        month = cell(row, "month")
+        try:
+            month = month_label(month_offset(month))  # "2025-1" -> "2025-01"
+        except (ValueError, TypeError):
+            pass  # o mês inválido é reportado por validate_payment_entries
+        entries.append((cell(row, "user_id"), cell(row, "username") or None, month, paid not in UNPAID_VALUES))
+        lines.append(line)
+    return entries, lines, errors + validate_payment_entries(entries, lines)
+
+
+def bulk_summary_lines(summary):
+    """Linhas do resumo de uma operação em lote (contadores de PaymentManager.bulk_set_payments)."""
+    return [
+        f"✅ {summary['paid']} meses marcados como pagos",
+        f"🔄 {summary['unpaid']} meses marcados como pendentes",
+        f"➖ {summary['unchanged']} meses já estavam com o status informado",
+        f"👤 {summary['members_added']} membros novos",
+    ]
+
+
+class Member:
+    """
+    Registro de um membro com __slots__: o histórico de pagamentos fica em dois
+    bitsets inteiros (meses registrados e meses pagos), relativos ao primeiro mês
+    do histórico do membro. Um terceiro bitset marca os pagamentos feitos depois do
+    vencimento. Para o código existente, o registro se comporta como o antigo
+    dicionário {"username": ..., "payments": {"YYYY-MM": bool}}.
+    """
+
+    __slots__ = ("username", "base", "known", "paid", "late")
+
+    def __init__(self, username, payments=None, late=()):
+        self.username = username
+        self.base = 0    # deslocamento do mês representado pelo bit 0
+        self.known = 0   # bit ligado = mês com status registrado
+        self.paid = 0    # bit ligado = mês pago
+        self.late = 0    # bit ligado = mês pago após o vencimento
+        late = set(late)
+        for month, paid in (payments or {}).items():
+            self.set_payment(month, paid, month in late)
+
+    def _bit(self, offset):
+        """Máscara do mês no bitset, deslocando o histórico se o mês for anterior à base."""
+        if not self.known:
+            self.base = offset
+        elif offset < self.base:
+            shift = self.base - offset
+            self.known <<= shift
+            self.paid <<= shift
+            self.late <<= shift
+            self.base = offset
+        return 1 << (offset - self.base)
+
+    def set_payment(self, month, paid, late=False):
+        bit = self._bit(month_offset(month))
+        self.known |= bit
+        if paid:
+            self.paid |= bit
+        else:
+            self.paid &= ~bit
+        if paid and late:
+            self.late |= bit
+        else:
+            self.late &= ~bit
+
+    def get_payment(self, month):
+        """Retorna True/False para meses registrados e None para os demais."""
+        index = month_offset(month) - self.base
+        if index < 0 or not self.known >> index & 1:
+            return None
+        return bool(self.paid >> index & 1)
+
+    def status(self, month):
+        """Retorna (pago, atrasado) para meses registrados e None para os demais."""
+        paid = self.get_payment(month)
+        if paid is None:
+            return None
+        return paid, bool(self.late >> (month_offset(month) - self.base) & 1)
+
+    def remove_payment(self, month):
+        if self.get_payment(month) is None:
+            raise KeyError(month)
+        bit = 1 << (month_offset(month) - self.base)
+        self.known &= ~bit
+        self.paid &= ~bit
+        self.late &= ~bit
+
+    def snapshot(self):
+        """Registro no formato dos snapshots: {"username", "payments": {mês: pago}, "late": [meses]}."""
+        return {"username": self.username, "payments": dict(self.payments), "late": list(self.late_months())}
+
+    def drop_before(self, offset):
+        """
+        Remove do histórico os meses anteriores ao deslocamento `offset` e retorna os
+        bitsets removidos (registrados, pagos, atrasados).
+        """
+        count = offset - self.base
+        if count <= 0 or not self.known:
+            return 0, 0, 0
+        mask = (1 << count) - 1
+        removed = (self.known & mask, self.paid & mask, self.late & mask)
+        self.known >>= count
+        self.paid >>= count
+        self.late >>= count
+        self.base = offset
+        return removed
+
+    def _labels(self, bits):
+        offset = self.base
+        while bits:
+            low = bits & -bits
+            yield month_label(offset + low.bit_length() - 1)
+            bits ^= low
+
+    def months(self):
+        """Meses registrados em ordem cronológica."""
+        return self._labels(self.known)
+
+    def late_months(self):
+        """Meses pagos após o vencimento, em ordem cronológica."""
+        return self._labels(self.late)
+
+    def streak(self):
+        """Meses pagos consecutivos terminando no mês mais recente do histórico."""
+        top = self.known.bit_length()
+        unpaid = ~self.paid & ((1 << top) - 1)
+        if not unpaid:
+            return top
+        return top - unpaid.bit_length()
+
+    @property
+    def payments(self):
+        return PaymentHistory(self)
+
+    # Compatibilidade com o formato de dicionário
+    def __getitem__(self, key):
+        if key == "username":
+            return self.username
+        if key == "payments":
+            return self.payments
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return repr({"username": self.username, "payments": dict(self.payments)})
+
+
+class PaymentHistory(MutableMapping):
+    """Visão de dicionário ("YYYY-MM" -> bool) sobre os bitsets de um Member."""
+
+    __slots__ = ("_member",)
+
+    def __init__(self, member):
+        self._member = member
+
+    def __getitem__(self, month):
+        paid = self._member.get_payment(month)
+        if paid is None:
+            raise KeyError(month)
+        return paid
+
+    def __setitem__(self, month, paid):
+        self._member.set_payment(month, paid)
+
+    def __delitem__(self, month):
+        self._member.remove_payment(month)
+
+    def __contains__(self, month):
+        try:
+            return self._member.get_payment(month) is not None
+        except ValueError:
+            return False
+
+    def __iter__(self):
+        return self._member.months()
+
+    def __len__(self):
+        return bin(self._member.known).count("1")
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def popcount(bits):
+    return bin(bits).count("1")
+
+
+class PaymentAnalytics:
+    """
+    Agregados do histórico de pagamentos mantidos a cada mutação do PaymentManager:
+    registros pagos/pendentes, pagamentos em dia/atrasados e a sequência atual de
+    meses pagos de cada membro. Os relatórios leem esses totais sem varrer o histórico.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.paid_entries = 0
+        self.unpaid_entries = 0
+        self.on_time = 0
+        self.late = 0
+        self.streaks = {}  # user_id -> meses pagos consecutivos
+        # Totais dos meses arquivados, lidos do arquivo só quando um relatório pede
+        # (o arquivo é a fonte: após uma recarga eles são lidos de novo)
+        self.archived = None
+
+    def _count(self, member, sign):
+        """Soma (sign=1) ou subtrai (sign=-1) todo o histórico de um membro, por contagem de bits."""
+        self.paid_entries += sign * popcount(member.paid)
+        self.unpaid_entries += sign * popcount(member.known & ~member.paid)
+        self.late += sign * popcount(member.late)
+        self.on_time += sign * popcount(member.paid & ~member.late)
+
+    def _count_status(self, status, sign):
+        paid, late = status
+        if not paid:
+            self.unpaid_entries += sign
+        elif late:
+            self.paid_entries += sign
+            self.late += sign
+        else:
+            self.paid_entries += sign
+            self.on_time += sign
+
+    def add_member(self, user_id, member):
+        self._count(member, 1)
+        self.streaks[user_id] = member.streak()
+
+    def archive(self, known, paid, late):
+        """Move os contadores de meses arquivados (bitsets removidos do Member) para os totais do arquivo."""
+        counts = {
+            "paid_entries": popcount(paid),
+            "unpaid_entries": popcount(known & ~paid),
+            "late": popcount(late),
+            "on_time": popcount(paid & ~late),
+        }
+        for name, value in counts.items():
+            setattr(self, name, getattr(self, name) - value)
+            if self.archived is not None:
+                self.archived[name] += value
+
+    def totals(self):
+        """Contadores do histórico completo (memória + arquivo, se carregado)."""
+        totals = {name: getattr(self, name) for name in ("paid_entries", "unpaid_entries", "on_time", "late")}
+        for name, value in (self.archived or {}).items():
+            totals[name] += value
+        return totals
+
+    def remove_member(self, user_id, member):
+        self._count(member, -1)
+        self.streaks.pop(user_id, None)
+
+    def update(self, user_id, member, previous, current):
+        """Troca o status anterior de um mês (ou None) pelo novo."""
+        if previous is not None:
+            self._count_status(previous, -1)
+        self._count_status(current, 1)
+        self.streaks[user_id] = member.streak()
+
+    def rebuild(self, members):
+        self.reset()
+        for user_id, member in members.items():
+            self.add_member(user_id, member)
+
+    def top_streaks(self, count=5):
+        """Os membros com as maiores sequências atuais de meses pagos."""
+        return heapq.nlargest(count, self.streaks.items(), key=lambda item: item[1])
+
+
+class AccountGraph:
+    """
+    Vínculos entre contas: o índice direto (secundária -> principal) é o próprio
+    data["account_links"] e o reverso (principal -> secundárias) é mantido junto.
+    A conta que paga (raiz da cadeia A -> B -> C) é memorizada e, a cada alteração,
+    só os caches da subárvore afetada são invalidados.
+    """
+
+    def __init__(self, links):
+        self.forward = links
+        self.reverse = {}
+        self._roots = {}
+        for secondary_id, main_id in links.items():
+            self.reverse.setdefault(main_id, set()).add(secondary_id)
+
+    def root(self, user_id):
+        """Conta principal final de um usuário (ele mesmo se não houver vínculo)."""
+        root = self._roots.get(user_id)
+        if root is not None:
+            return root
+        path = [user_id]
+        seen = {user_id}
+        current = user_id
+        while current in self.forward:
+            current = self.forward[current]
+            if current in seen:
+                # Ciclo em dados antigos: cada conta do ciclo responde por si mesma
+                print(f"❌ Ciclo nos vínculos de contas envolvendo {current}.")
+                return user_id
+            seen.add(current)
+            path.append(current)
+        for node in path:
+            self._roots[node] = current
+        return current
+
+    def would_cycle(self, secondary_id, main_id):
+        """True se vincular secondary_id a main_id fecharia um ciclo."""
+        current = main_id
+        seen = set()
+        while current is not None and current not in seen:
+            if current == secondary_id:
+                return True
+            seen.add(current)
+            current = self.forward.get(current)
+        return False
+
+    def _subtree(self, user_id):
+        """O usuário e todas as contas vinculadas (direta ou indiretamente) a ele."""
+        nodes = [user_id]
+        index = 0
+        while index < len(nodes):
+            nodes.extend(self.reverse.get(nodes[index], ()))
+            index += 1
+        return nodes
+
+    def _invalidate(self, user_id):
+        for node in self._subtree(user_id):
+            self._roots.pop(node, None)
+
+    def link(self, secondary_id, main_id):
+        self.unlink(secondary_id)
+        self.forward[secondary_id] = main_id
+        self.reverse.setdefault(main_id, set()).add(secondary_id)
+        self._invalidate(secondary_id)
+
+    def unlink(self, secondary_id):
+        main_id = self.forward.pop(secondary_id, None)
+        if main_id is None:
+            return False
+        secondaries = self.reverse.get(main_id)
+        if secondaries is not None:
+            secondaries.discard(secondary_id)
+            if not secondaries:
+                del self.reverse[main_id]
+        self._invalidate(secondary_id)
+        return True
+
+    def detach_secondaries(self, main_id):
+        """Desfaz os vínculos diretos em que main_id é a principal."""
+        for secondary_id in list(self.reverse.get(main_id, ())):
+            self.unlink(secondary_id)
+
+    def accounts(self, user_id):
+        """Todas as contas do mesmo pagador (a principal primeiro)."""
+        return self._subtree(self.root(user_id))
+
+
+# Backends de armazenamento do PaymentManager
+class WorkbookStorage:
+    """Armazenamento padrão: cada gravação reescreve o workbook completo."""
+
+    def load(self, manager):
+        """Os dados vêm do workbook, carregado pelo próprio PaymentManager."""
+        return False
+
+    def open(self, manager):
+        """Chamado após carregar o snapshot; nada a reaplicar."""
+
+    def record(self, op, payload):
+        """Mutações não são registradas individualmente neste backend."""
+
+    def commit(self, manager):
+        manager.save_data()
+
+    def reset(self, manager):
+        """Nada a descartar quando o snapshot é substituído."""
+
+    def close(self):
+        pass
+
+
+class JournalStorage:
+    """
+    Armazenamento em journal append-only: cada mutação vira uma linha JSON no arquivo
+    de journal (O(1) por escrita) e o workbook passa a ser um snapshot compactado,
+    gerado periodicamente. Na inicialização o journal é reaplicado sobre o snapshot.
+    """
+
+    def __init__(self, path, fsync_batch=32, compact_interval=COMPACT_INTERVAL, compact_records=1000):
+        self.path = path
+        self.fsync_batch = fsync_batch
+        self.compact_interval = compact_interval
+        self.compact_records = compact_records
+        self._lock = threading.Lock()
+        self._file = None
+        self._unsynced = 0
+        self._records_since_compact = 0
+        self._last_compact = time.monotonic()
+
+    def load(self, manager):
+        """O snapshot vem do workbook; o journal é reaplicado em open()."""
+        return False
+
+    def _segments(self):
+        """Segmentos existentes em ordem de aplicação (o rotacionado vem antes do atual)."""
+        return [p for p in (f"{self.path}.old", self.path) if os.path.exists(p)]
+
+    def open(self, manager):
+        """Reaplica o journal sobre o snapshot carregado e abre o arquivo para append."""
+        replayed = 0
+        for segment in self._segments():
+            with open(segment, "r", encoding="utf-8") as journal:
+                for line in journal:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Linha truncada por uma queda no meio da escrita: ignora o restante
+                        print(f"❌ Registro inválido no journal {segment}, ignorando o restante.")
+                        break
+                    manager._apply(entry.pop("op"), entry)
+                    replayed += 1
+        with self._lock:
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._records_since_compact = replayed
+        if replayed:
+            print(f"✅ {replayed} registros do journal reaplicados sobre {manager.filename}.")
+
+    def record(self, op, payload):
+        """Anexa uma mutação ao journal; o fsync é feito em lotes."""
+        line = json.dumps({"op": op, **payload}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._unsynced += 1
+            self._records_since_compact += 1
+            if self._unsynced >= self.fsync_batch:
+                self._sync()
+
+    def _sync(self):
+        """Força os registros pendentes para o disco (deve ser chamada com o lock)."""
+        if self._file is None or not self._unsynced:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def commit(self, manager):
+        """Garante durabilidade do journal e compacta quando o limite for atingido."""
+        with self._lock:
+            self._sync()
+            due = (
+                self._records_since_compact >= self.compact_records
+                or time.monotonic() - self._last_compact >= self.compact_interval
+            )
+        if due and self._records_since_compact:
+            self.compact(manager)
+
+    def compact(self, manager):
+        """
+        Grava um novo snapshot do workbook e descarta o journal já incorporado.
+        O journal é rotacionado antes do snapshot; como as operações são idempotentes,
+        registros que caírem nos dois segmentos são reaplicados sem efeito colateral.
+        """
+        with self._lock:
+            self._sync()
+            self._file.close()
+            if os.path.exists(f"{self.path}.old"):
+                # Uma compactação anterior falhou: mantém os dois segmentos no .old
+                with open(f"{self.path}.old", "a", encoding="utf-8") as rotated, \
+                        open(self.path, "r", encoding="utf-8") as current:
+                    rotated.write(current.read())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, f"{self.path}.old")
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._records_since_compact = 0
+            self._last_compact = time.monotonic()
+        manager.save_data()
+        os.remove(f"{self.path}.old")
+        print(f"✅ Journal compactado em {manager.filename}.")
+
+    def reset(self, manager):
+        """Descarta o journal (o snapshot foi substituído por uma versão mais nova)."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            for segment in self._segments():
+                os.remove(segment)
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._unsynced = 0
+            self._records_since_compact = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+
+class SqliteStorage:
+    """
+    Armazenamento em SQLite (modo WAL) com tabelas normalizadas.
+    Cada mutação vira um upsert de uma linha; o workbook só é gerado para exportação
+    (Google Drive). Na primeira execução os dados do payments.xlsx são migrados.
+    As consultas de status e vínculos são atendidas pelos índices em memória do
+    PaymentManager e o banco só é lido na carga; os índices das tabelas servem às
+    remoções por mês (arquivamento) e por conta principal (remoção de membros).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS members (
+            user_id TEXT PRIMARY KEY,
+            username TEXT
+        );
+        CREATE TABLE IF NOT EXISTS payments (
+            user_id TEXT NOT NULL,
+            month TEXT NOT NULL,
+            paid INTEGER NOT NULL,
+            late INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month)
+        );
+        CREATE INDEX IF NOT EXISTS idx_payments_month_paid ON payments (month, paid);
+        CREATE TABLE IF NOT EXISTS account_links (
+            secondary_id TEXT PRIMARY KEY,
+            main_id TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_account_links_main_id ON account_links (main_id);
+        CREATE TABLE IF NOT EXISTS auto_paid (
+            user_id TEXT PRIMARY KEY,
+            position INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS config (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(payments)")]
+        if "late" not in columns:
+            # Bancos criados antes da coluna de atraso
+            self._conn.execute("ALTER TABLE payments ADD COLUMN late INTEGER NOT NULL DEFAULT 0")
+
+    def _migrated(self):
+        row = self._conn.execute("SELECT value FROM config WHERE key = 'migrated'").fetchone()
+        return row is not None
+
+    def load(self, manager):
+        """Carrega os dados do banco; retorna False se ainda for preciso migrar o workbook."""
+        with self._lock:
+            if not self._migrated():
+                return False
+            members = {
+                user_id: Member(username)
+                for user_id, username in self._conn.execute("SELECT user_id, username FROM members")
+            }
+            for user_id, month, paid, late in self._conn.execute("SELECT user_id, month, paid, late FROM payments"):
+                if user_id in members:
+                    members[user_id].set_payment(month, bool(paid), bool(late))
+            links = dict(self._conn.execute("SELECT secondary_id, main_id FROM account_links"))
+            auto_paid = [
+                row[0] for row in self._conn.execute("SELECT user_id FROM auto_paid ORDER BY position")
+            ]
+            config = dict(self._conn.execute("SELECT key, value FROM config"))
+        with manager._lock:
+            manager.data["members"] = members
+            manager.data["account_links"] = links
+            manager.data["auto_paid_members"] = auto_paid
+            if "payment_day" in config:
+                manager.payment_day = int(config["payment_day"])
+            if config.get("notification_channel"):
+                manager.notification_channel = int(config["notification_channel"])
+            manager._rebuild_index()
+        print(f"✅ Dados carregados do banco SQLite: {self.path}")
+        return True
+
+    def open(self, manager):
+        """Na primeira execução, migra para o banco os dados lidos do payments.xlsx."""
+        with self._lock:
+            migrated = self._migrated()
+        if not migrated:
+            self.migrate_from_workbook(manager)
+
+    def migrate_from_workbook(self, manager):
+        """
+        Copia para o banco os dados das abas Payments/Config/AutoPaid/AccountLinks
+        já carregadas pelo PaymentManager.load_data, substituindo o conteúdo atual.
+        """
+        with manager._lock:
+            snapshot = manager._snapshot()
+        with self._lock, self._conn:
+            for table in ("members", "payments", "account_links", "auto_paid", "config"):
+                self._conn.execute(f"DELETE FROM {table}")
+            self._conn.executemany(
+                "INSERT INTO members (user_id, username) VALUES (?, ?)",
+                [(user_id, info["username"]) for user_id, info in snapshot["members"].items()],
+            )
+            self._conn.executemany(
+                "INSERT INTO payments (user_id, month, paid, late) VALUES (?, ?, ?, ?)",
+                [
+                    (user_id, month, int(bool(paid)), int(month in info["late"]))
+                    for user_id, info in snapshot["members"].items()
+                    for month, paid in info["payments"].items()
+                ],
+            )
+            self._conn.executemany(
+                "INSERT INTO account_links (secondary_id, main_id) VALUES (?, ?)",
+                list(snapshot["account_links"].items()),
+            )
+            self._conn.executemany(
+                "INSERT INTO auto_paid (user_id, position) VALUES (?, ?)",
+                [(user_id, position) for position, user_id in enumerate(snapshot["auto_paid_members"])],
+            )
+            self._conn.execute(
+                "INSERT INTO config (key, value) VALUES ('payment_day', ?)", (str(snapshot["payment_day"]),)
+            )
+            if snapshot["notification_channel"]:
+                self._conn.execute(
+                    "INSERT INTO config (key, value) VALUES ('notification_channel', ?)",
+                    (str(snapshot["notification_channel"]),),
+                )
+            self._conn.execute("INSERT INTO config (key, value) VALUES ('migrated', ?)", (datetime.now().isoformat(),))
+        print(f"✅ {len(snapshot['members'])} membros migrados de {manager.filename} para {self.path}.")
+
+    def record(self, op, payload):
+        """Aplica a mutação como upsert de uma linha; o commit acontece no flush."""
+        with self._lock:
+            if op == "payment":
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO members (user_id, username) VALUES (?, ?)",
+                    (payload["user_id"], payload["username"]),
+                )
+                self._conn.execute(
+                    "INSERT INTO payments (user_id, month, paid, late) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (user_id, month) DO UPDATE SET paid = excluded.paid, late = excluded.late",
+                    (payload["user_id"], payload["month"], int(payload["paid"]), int(payload.get("late", False))),
+                )
+            elif op == "member_add":
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO members (user_id, username) VALUES (?, ?)",
+                    (payload["user_id"], payload["username"]),
+                )
+            elif op == "member_remove":
+                self._conn.execute("DELETE FROM members WHERE user_id = ?", (payload["user_id"],))
+                self._conn.execute("DELETE FROM payments WHERE user_id = ?", (payload["user_id"],))
+                self._conn.execute("DELETE FROM account_links WHERE main_id = ?", (payload["user_id"],))
+            elif op == "link":
+                self._conn.execute(
+                    "INSERT INTO account_links (secondary_id, main_id) VALUES (?, ?) "
+                    "ON CONFLICT (secondary_id) DO UPDATE SET main_id = excluded.main_id",
+                    (payload["secondary_id"], payload["main_id"]),
+                )
+            elif op == "unlink":
+                self._conn.execute("DELETE FROM account_links WHERE secondary_id = ?", (payload["secondary_id"],))
+            elif op == "archive":
+                self._conn.execute("DELETE FROM payments WHERE month < ?", (payload["before"],))
+            elif op == "auto_paid_add":
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO auto_paid (user_id, position) "
+                    "VALUES (?, (SELECT COALESCE(MAX(position), -1) + 1 FROM auto_paid))",
+                    (payload["user_id"],),
+                )
+            elif op == "payment_day":
+                self._conn.execute(
+                    "INSERT INTO config (key, value) VALUES ('payment_day', ?) "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                    (str(payload["day"]),),
+                )
+            elif op == "notification_channel":
+                self._conn.execute(
+                    "INSERT INTO config (key, value) VALUES ('notification_channel', ?) "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                    (str(payload["channel_id"]),),
+                )
+
+    def commit(self, manager):
+        with self._lock:
+            self._conn.commit()
+
+    def reset(self, manager):
+        """O workbook baixado substitui o conteúdo do banco."""
+        self.migrate_from_workbook(manager)
+
+    def close(self):
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.commit()
+            self._conn.close()
+            self._conn = None
+
+
+def create_storage(backend, filename):
+    """Cria o backend de armazenamento configurado para o arquivo de dados."""
+    if backend == "journal":
+        return JournalStorage(f"{os.path.splitext(filename)[0]}.journal")
+    if backend == "sqlite":
+        return SqliteStorage(f"{os.path.splitext(filename)[0]}.db")
+    if backend == "workbook":
+        return WorkbookStorage()
+    raise ValueError(f"Backend de armazenamento desconhecido: {backend}")
+
+
+class PaymentArchive:
+    """
+    Arquivo do histórico antigo: meses fora da janela HISTORY_WINDOW saem do
+    armazenamento principal (e da memória) e ficam em um banco SQLite separado,
+    consultado só quando necessário (páginas do !historico, totais do !relatorio).
+    A conexão é aberta no primeiro uso.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS archived_payments (
+            user_id TEXT NOT NULL,
+            month TEXT NOT NULL,
+            paid INTEGER NOT NULL,
+            late INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month)
+        );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self, create=False):
+        """Conexão com o arquivo (deve ser chamada com o lock); None se ele ainda não existe."""
+        if self._conn is None:
+            if not create and not os.path.exists(self.path):
+                return None
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+
+    def _bump(self, conn):
+        """Incrementa a geração do arquivo (PRAGMA user_version), na mesma transação da escrita."""
+        generation = conn.execute("PRAGMA user_version").fetchone()[0] + 1
+        conn.execute(f"PRAGMA user_version = {generation}")
+
+    def store(self, rows):
+        """Grava (user_id, month, paid, late) no arquivo; meses já arquivados são substituídos."""
+        with self._lock:
+            conn = self._connection(create=True)
+            with conn:
+                conn.executemany(
+                    "INSERT INTO archived_payments (user_id, month, paid, late) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (user_id, month) DO UPDATE SET paid = excluded.paid, late = excluded.late",
+                    rows,
+                )
+                self._bump(conn)
+
+    def merge(self, rows):
+        """Acrescenta os meses arquivados em outra réplica; os já presentes aqui são mantidos. Retorna quantos entraram."""
+        with self._lock:
+            conn = self._connection(create=bool(rows))
+            if conn is None:
+                return 0
+            with conn:
+                before = conn.total_changes
+                conn.executemany(
+                    "INSERT INTO archived_payments (user_id, month, paid, late) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (user_id, month) DO NOTHING",
+                    rows,
+                )
+                added = conn.total_changes - before
+                if added:
+                    self._bump(conn)
+            return added
+
+    def generation(self):
+        """Contador de alterações do arquivo (0 se ele ainda não existe)."""
+        with self._lock:
+            conn = self._connection()
+            return conn.execute("PRAGMA user_version").fetchone()[0] if conn else 0
+
+    def rows(self):
+        """Todos os registros arquivados (user_id, month, paid, late)."""
+        with self._lock:
+            conn = self._connection()
+            return conn.execute("SELECT user_id, month, paid, late FROM archived_payments").fetchall() if conn else []
+
+    def export(self, path):
+        """Copia consistente do arquivo para `path` (para envio ao Drive). Retorna a geração copiada."""
+        with self._lock:
+            conn = self._connection(create=True)
+            target = sqlite3.connect(path)
+            try:
+                conn.backup(target)
+            finally:
+                target.close()
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def totals(self):
+        """Contadores agregados de todo o arquivo, no formato de PaymentAnalytics.totals()."""
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT COALESCE(SUM(paid), 0), COALESCE(SUM(1 - paid), 0), "
+                "COALESCE(SUM(paid * late), 0), COALESCE(SUM(paid * (1 - late)), 0) FROM archived_payments"
+            ).fetchone() if conn else (0, 0, 0, 0)
+        return dict(zip(("paid_entries", "unpaid_entries", "late", "on_time"), row))
+
+    def count(self, user_ids):
+        """Quantidade de meses arquivados (das contas informadas, juntas)."""
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return 0
+            placeholders = ", ".join("?" * len(user_ids))
+            return conn.execute(
+                f"SELECT COUNT(DISTINCT month) FROM archived_payments WHERE user_id IN ({placeholders})",
+                list(user_ids),
+            ).fetchone()[0]
+
+    def page(self, user_ids, offset, limit):
+        """[(month, paid)] das contas informadas, do mês mais recente ao mais antigo."""
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return []
+            placeholders = ", ".join("?" * len(user_ids))
+            return [
+                (month, bool(paid)) for month, paid in conn.execute(
+                    f"SELECT month, MAX(paid) FROM archived_payments WHERE user_id IN ({placeholders}) "
+                    "GROUP BY month ORDER BY month DESC LIMIT ? OFFSET ?",
+                    [*user_ids, limit, offset],
+                )
+            ]
+
+    def close(self):
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.close()
+            self._conn = None
+
+
+class PaymentManager:
+    def __init__(self, filename="payments.xlsx", save_interval=SAVE_INTERVAL, storage=None, drive=None):
+        self.filename = filename
+        self.drive = drive or drive_client
+        # Estado da última sincronização com o Drive (ID do arquivo e versão remota), em
+        # _sync_path, e o snapshot correspondente (base do merge de três vias), em _base_path.
+        # A base só fica em disco: é lida quando o Drive muda e há o que combinar
+        self._sync_path = f"{os.path.splitext(filename)[0]}.sync.json"
+        self._base_path = f"{os.path.splitext(filename)[0]}.sync-base.json"
+        # Serializa as sincronizações (thread de upload e downloads no pool do Drive) e todo
+        # acesso a esse estado; é adquirido antes de _save_lock, _batch_lock e _lock, nunca depois
+        self._sync_lock = threading.RLock()
+        self._drive_file_id = None
+        self._remote_version = None
+        # Os meses arquivados vão ao Drive em um arquivo próprio (a cópia do .archive.db),
+        # enviado só quando a geração do arquivo local muda
+        self._archive_file_id = None
+        self._archive_version = None
+        self._archive_generation = 0
+        self.uploader = DriveUploadScheduler(self.upload_to_google_drive)
+        self.payment_day = 15
+        self.notification_channel = None  # canal de lembretes deste servidor (None = padrão do .env)
+        self.data = {"members": {}, "account_links": {}, "auto_paid_members": []}
+        # Índice por mês: "YYYY-MM" -> {"paid": {user_id, ...}, "unpaid": {user_id, ...}},
+        # mantido a cada mutação para que status e lembretes não varram todo o histórico
+        self._month_index = {}
+        self.analytics = PaymentAnalytics()
+        self.links = AccountGraph(self.data["account_links"])
+        self.archive = PaymentArchive(f"{os.path.splitext(filename)[0]}.archive.db")
+        self.history_window = HISTORY_WINDOW
+        self.storage = storage or create_storage(STORAGE_BACKEND, filename)
+
+        # Persistência write-behind: as mutações só marcam o gerenciador como "sujo"
+        # e uma thread em segundo plano grava o arquivo no máximo uma vez por intervalo.
+        self.save_interval = save_interval
+        self._lock = threading.RLock()
+        self._save_lock = threading.RLock()
+        self._dirty = False
+        self._stop_flusher = threading.Event()
+        self._flusher = None
+        self._batch = None  # mutações acumuladas dentro de batch()
+        # Mantido durante o corpo de batch() (em vez de _lock, para não bloquear as leituras):
+        # exclui outras transações e as gravações/exportações de um estado parcial
+        self._batch_lock = threading.RLock()
+        self._batch_owner = None
+        self._batch_foreign = []  # mutações de outras threads durante a transação
+        # Mutações feitas enquanto um snapshot do Drive é gravado fora do lock; são
+        # registradas no backend depois que ele é reiniciado com o novo snapshot
+        self._deferred = None
+        self._generation = 0  # incrementado a cada alteração dos dados em memória
+
+        if not self.storage.load(self):
+            if not os.path.exists(self.filename):
+                self.create_empty_file()
+            self.load_data()
+        self.storage.open(self)
+        self._load_sync_state()
+        atexit.register(self.close)
+
+    def mark_dirty(self):
+        """Marca os dados como alterados; a gravação acontece no próximo ciclo do flusher."""
+        with self._lock:
+            self._dirty = True
+        self._start_flusher()
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+    @metrics.instrument("storage")
+    def flush(self):
+        """Grava imediatamente as alterações pendentes. Retorna True se algo foi salvo."""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return False
+                self._dirty = False
+            try:
+                self.storage.commit(self)
+            except Exception:
+                self._dirty = True
+                raise
+        return True
+
+    def _start_flusher(self):
+        """Inicia a thread de gravação em segundo plano, se ainda não estiver rodando."""
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        self._stop_flusher.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, name="payments-flusher", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        """Agrupa rajadas de mutações em uma única gravação por intervalo."""
+        while not self._stop_flusher.wait(self.save_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Erro ao salvar dados em segundo plano: {e}")
+
+    def close(self):
+        """Para o flusher e grava o que estiver pendente (usado no desligamento)."""
+        atexit.unregister(self.close)
+        self._stop_flusher.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        self._flusher = None
+        self.uploader.close()
+        self.flush()
+        self.storage.close()
+        self.archive.close()
+
+    def _mutate(self, op, **payload):
+        """Aplica uma mutação em memória, registra no backend e agenda a gravação."""
+        with self._lock:
+            self._apply(op, payload)
+            if self._batch is not None:
+                if self._batch_owner == threading.get_ident():
+                    # Dentro de batch(): o registro e a gravação acontecem no commit
+                    self._batch.append((op, payload))
+                    return
+                # Mutação de outra thread durante a transação: é mantida se ela for desfeita
+                self._batch_foreign.append((op, payload))
+            self._record(op, payload)
+        self.mark_dirty()
+
+    def _record(self, op, payload):
+        """Registra a mutação no backend, ou a adia enquanto um snapshot é gravado (deve ser chamada com o lock)."""
+        if self._deferred is not None:
+            self._deferred.append((op, payload))
+        else:
+            self.storage.record(op, payload)
+
+    @contextmanager
+    def batch(self):
+        """
+        Transação: as mutações feitas dentro do bloco são aplicadas em memória e
+        confirmadas no fim com uma única gravação e uma única sincronização com o Drive.
+        Se o bloco levantar uma exceção, os dados voltam ao estado anterior.
+        Blocos aninhados fazem parte da transação externa. O _lock só é mantido para abrir,
+        confirmar ou desfazer a transação; durante o bloco as leituras continuam livres e
+        vale _batch_lock, que impede gravar ou enviar ao Drive um estado parcial.
+        """
+        with self._batch_lock:
+            if self._batch is not None:
+                yield self
+                return
+            with self._lock:
+                backup = self._snapshot()
+                self._batch = []
+                self._batch_owner = threading.get_ident()
+            try:
+                yield self
+            except BaseException:
+                with self._lock:
+                    self._restore(backup)
+                    for op, payload in self._batch_foreign:
+                        self._apply(op, payload)
+                    self._end_batch()
+                raise
+            with self._lock:
+                operations = self._batch
+                for op, payload in operations:
+                    self._record(op, payload)
+                self._end_batch()
+        if operations:
+            self.mark_dirty()
+            self.flush()
+            self.schedule_upload()
+
+    def _end_batch(self):
+        """Encerra a transação atual (deve ser chamada com o lock)."""
+        self._batch, self._batch_owner, self._batch_foreign = None, None, []
+
+    def _restore(self, snapshot):
+        """Restaura os dados a partir de um snapshot (deve ser chamada com o lock)."""
+        self.data["members"] = {
+            user_id: Member(info["username"], info["payments"], info["late"])
+            for user_id, info in snapshot["members"].items()
+        }
+        # Cópias: o snapshot pode continuar em uso (por exemplo, como base do merge com o Drive)
+        self.data["account_links"] = dict(snapshot["account_links"])
+        self.data["auto_paid_members"] = list(snapshot["auto_paid_members"])
+        self.payment_day = snapshot["payment_day"]
+        self.notification_channel = snapshot["notification_channel"]
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        """Reconstrói o índice por mês, os agregados e os vínculos a partir dos dados (deve ser chamada com o lock)."""
+        self._generation += 1
+        self._month_index = {}
+        for user_id, member in self.data["members"].items():
+            for month, paid in member.payments.items():
+                self._index_payment(user_id, month, paid)
+        self.analytics.rebuild(self.data["members"])
+        self.links = AccountGraph(self.data["account_links"])
+
+    def _index_payment(self, user_id, month, paid):
+        """Atualiza o índice com o status de um membro em um mês."""
+        entry = self._month_index.setdefault(month, {"paid": set(), "unpaid": set()})
+        entry["unpaid" if paid else "paid"].discard(user_id)
+        entry["paid" if paid else "unpaid"].add(user_id)
+
+    def _unindex_member(self, user_id, payments):
+        """Remove um membro de todos os meses do seu histórico no índice."""
+        for month in payments:
+            entry = self._month_index.get(month)
+            if entry is not None:
+                entry["paid"].discard(user_id)
+                entry["unpaid"].discard(user_id)
+
+    def _apply(self, op, payload):
+        """Aplica uma mutação aos dados em memória (também usado ao reaplicar o journal)."""
+        self._generation += 1
+        members = self.data["members"]
+        if op == "payment":
+            member = members.get(payload["user_id"])
+            if member is None:
+                member = members[payload["user_id"]] = Member(payload["username"])
+            previous = member.status(payload["month"])
+            late = payload.get("late", False)
+            member.set_payment(payload["month"], payload["paid"], late)
+            self._index_payment(payload["user_id"], payload["month"], payload["paid"])
+            self.analytics.update(payload["user_id"], member, previous, (payload["paid"], late))
+        elif op == "member_add":
+            if payload["user_id"] not in members:
+                members[payload["user_id"]] = Member(payload["username"])
+                self.analytics.add_member(payload["user_id"], members[payload["user_id"]])
+        elif op == "member_remove":
+            user_id = payload["user_id"]
+            removed = members.pop(user_id, None)
+            if removed is not None:
+                self._unindex_member(user_id, removed.months())
+                self.analytics.remove_member(user_id, removed)
+            # Remove links relacionados a este membro (se houver)
+            self.links.detach_secondaries(user_id)
+        elif op == "link":
+            self.links.link(payload["secondary_id"], payload["main_id"])
+        elif op == "unlink":
+            self.links.unlink(payload["secondary_id"])
+        elif op == "archive":
+            # Os meses já foram gravados no arquivo; aqui só saem da memória
+            before = month_offset(payload["before"])
+            for user_id, member in members.items():
+                removed = member.drop_before(before)
+                if removed[0]:
+                    self.analytics.archive(*removed)
+                    self.analytics.streaks[user_id] = member.streak()
+            for month in [month for month in self._month_index if month < payload["before"]]:
+                del self._month_index[month]
+        elif op == "auto_paid_add":
+            if payload["user_id"] not in self.data["auto_paid_members"]:
+                self.data["auto_paid_members"].append(payload["user_id"])
+        elif op == "payment_day":
+            self.payment_day = payload["day"]
+        elif op == "notification_channel":
+            self.notification_channel = payload["channel_id"]
+        else:
+            raise ValueError(f"Operação desconhecida: {op}")
+
+    def link_account(self, secondary_id, main_id):
+        """Vincula uma conta secundária a uma principal. Retorna False se o vínculo formaria um ciclo."""
+        secondary_id, main_id = str(secondary_id), str(main_id)
+        with self._lock:
+            if self.links.would_cycle(secondary_id, main_id):
+                print(f"❌ Vincular {secondary_id} a {main_id} formaria um ciclo de contas.")
+                return False
+            self._mutate("link", secondary_id=secondary_id, main_id=main_id)
+        return True
+
+    def unlink_account(self, secondary_id):
+        """Desfaz o vínculo de uma conta secundária. Retorna False se ela não estava vinculada."""
+        secondary_id = str(secondary_id)
+        with self._lock:
+            if secondary_id not in self.data["account_links"]:
+                return False
+            self._mutate("unlink", secondary_id=secondary_id)
+        return True
+
+    def get_main_account(self, user_id):
+        """Retorna a conta que paga por um usuário (seguindo toda a cadeia de vínculos), ou o próprio ID"""
+        with self._lock:
+            return self.links.root(str(user_id))
+
+    def linked_accounts(self, user_id):
+        """Todas as contas do mesmo pagador, começando pela principal"""
+        with self._lock:
+            return self.links.accounts(str(user_id))
+
+    def set_payment_day(self, day: int):
+        """Define o dia de pagamento e salva no arquivo"""
+        if day < 1 or day > 31:
+            print("❌ O dia de pagamento deve ser entre 1 e 31.")
+            return
+        self._mutate("payment_day", day=day)
+        print(f"✅ Dia de pagamento atualizado para {day}.")
+
+    def set_notification_channel(self, channel_id):
+        """Define o canal onde os lembretes de pagamento deste servidor são enviados"""
+        self._mutate("notification_channel", channel_id=int(channel_id))
+
+
+
+    def create_empty_file(self):
+        """Cria um arquivo Excel vazio"""
+        from openpyxl import Workbook
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(["UserID", "Username", "Payments"])  
+        workbook.save(self.filename)
+        print(f"✅ Arquivo vazio criado localmente: {self.filename}")
+
+
+    def _read_workbook(self, source):
+        """
+        Lê as abas Payments/Config/AutoPaid/AccountLinks de um workbook (caminho ou stream).
+        As linhas são lidas em modo streaming (read_only) e o histórico de pagamentos é
+        interpretado por parse_payments, sem eval(). Retorna os membros (Member) e as
+        demais configurações; payment_day é None em arquivos antigos sem a aba Config.
+        """
+        from openpyxl import load_workbook
+        workbook = load_workbook(source, read_only=True, data_only=True)
+        try:
+            started = time.perf_counter()
+            sheet = workbook["Payments"] if "Payments" in workbook.sheetnames else workbook.worksheets[0]
+            members = {
+                str(row[0]): Member(row[1], parse_payments(row[2]), parse_late_months(row[3]))
+                for row in sheet.iter_rows(min_row=2, max_col=4, values_only=True)
+                if row and row[0] is not None
+            }
+            print(f"⏱️ Aba {sheet.title}: {len(members)} membros em {time.perf_counter() - started:.3f}s")
+
+            payment_day = None
+            notification_channel = None
+            if "Config" in workbook.sheetnames:
+                started = time.perf_counter()
+                for row in workbook["Config"].iter_rows(min_row=2, max_row=2, max_col=2, values_only=True):
+                    payment_day = int(row[0])
+                    if len(row) > 1 and row[1]:
+                        notification_channel = int(row[1])
+                print(f"⏱️ Aba Config em {time.perf_counter() - started:.3f}s")
+
+            auto_paid_members = []
+            if "AutoPaid" in workbook.sheetnames:
+                started = time.perf_counter()
+                auto_paid_members = [
+                    str(row[0])
+                    for row in workbook["AutoPaid"].iter_rows(min_row=2, max_col=1, values_only=True)
+                    if row and row[0]
+                ]
+                print(f"⏱️ Aba AutoPaid: {len(auto_paid_members)} membros em {time.perf_counter() - started:.3f}s")
+
+            account_links = {}
+            if "AccountLinks" in workbook.sheetnames:
+                started = time.perf_counter()
+                account_links = {
+                    str(row[0]): str(row[1])
+                    for row in workbook["AccountLinks"].iter_rows(min_row=2, max_col=2, values_only=True)
+                    if row and row[0] and row[1]
+                }
+                print(f"⏱️ Aba AccountLinks: {len(account_links)} vínculos em {time.perf_counter() - started:.3f}s")
+        finally:
+            workbook.close()
+        return {
+            "members": members,
+            "account_links": account_links,
+            "auto_paid_members": auto_paid_members,
+            "payment_day": payment_day,
+            "notification_channel": notification_channel,
+        }
+
+    @metrics.instrument("workbook")
+    def load_data(self, source=None):
+        """
+        Carrega dados do arquivo Excel, incluindo o dia de pagamento.
+        `source` pode ser um caminho ou um stream em memória (padrão: o arquivo local).
+        """
+        source = source if source is not None else self.filename
+        if not isinstance(source, str) or os.path.exists(source):
+            loaded = self._read_workbook(source)
+            with self._lock:
+                # Os dados do arquivo substituem alterações ainda não gravadas
+                self._dirty = False
+                self.data["members"] = loaded["members"]
+                self.data["auto_paid_members"] = loaded["auto_paid_members"]
+                self.data["account_links"] = loaded["account_links"]
+                if loaded["payment_day"] is not None:
+                    self.payment_day = loaded["payment_day"]
+                self.notification_channel = loaded["notification_channel"]
+                self._rebuild_index()
+
+            if loaded["payment_day"] is None:
+                # Arquivo antigo sem a aba Config: ela é criada na próxima gravação
+                self.mark_dirty()
+        else:
+            self.save_data()
+
+    # Sincronização com o Google Drive
+    def _load_sync_state(self):
+        """Lê o estado da última sincronização (ID do arquivo e versões remotas)."""
+        with self._sync_lock:
+            self._read_sync_state()
+
+    def _read_sync_state(self):
+        if not os.path.exists(self._sync_path):
+            return
+        try:
+            with open(self._sync_path, "r", encoding="utf-8") as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError) as e:
+            print(f"❌ Estado de sincronização {self._sync_path} ilegível, o próximo download substitui os dados locais: {e}")
+            return
+        self._drive_file_id = state.get("file_id")
+        self._remote_version = tuple(state["version"]) if state.get("version") else None
+        if state.get("base") is not None:
+            # Estado antigo, com a base embutida: passa para o arquivo próprio e sai da memória
+            write_json(self._base_path, state.pop("base"))
+            write_json(self._sync_path, state)
+        archive = state.get("archive")
+        if archive is None:
+            # Estado anterior ao envio separado do arquivo: os meses arquivados ainda não estão no Drive
+            self._archive_generation = -1
+        else:
+            self._archive_file_id = archive.get("file_id")
+            self._archive_version = tuple(archive["version"]) if archive.get("version") else None
+            self._archive_generation = archive.get("generation", 0)
+
+    def _save_sync_state(self):
+        """Grava o estado da sincronização em _sync_path (deve ser chamada com _sync_lock)."""
+        write_json(self._sync_path, {
+            "file_id": self._drive_file_id,
+            "version": self._remote_version,
+            "archive": {
+                "file_id": self._archive_file_id,
+                "version": self._archive_version,
+                "generation": self._archive_generation,
+            },
+        })
+
+    def _read_sync_base(self):
+        """Snapshot da última sincronização, lido do disco; None se ainda não houve uma."""
+        if not os.path.exists(self._base_path):
+            return None
+        try:
+            with open(self._base_path, "r", encoding="utf-8") as base_file:
+                return json.load(base_file)
+        except (OSError, ValueError) as e:
+            print(f"❌ Base de sincronização {self._base_path} ilegível, a versão do Drive substitui os dados locais: {e}")
+            return None
+
+    def _mark_synced(self, metadata, snapshot):
+        """
+        Registra a versão remota que corresponde a `snapshot`, a base do próximo merge
+        (deve ser chamada com _sync_lock).
+        """
+        self._drive_file_id = metadata.get('id') or self._drive_file_id
+        self._remote_version = remote_version(metadata)
+        write_json(self._base_path, snapshot)
+        self._save_sync_state()
+
+    def _pull_archive(self):
+        """
+        Incorpora ao arquivo local os meses arquivados por outras réplicas, se o arquivo
+        de meses arquivados no Drive mudou desde a última sincronização (deve ser chamada
+        com _sync_lock). Retorna quantos registros entraram.
+        """
+        file_id = self._archive_file_id or self.drive.find_file(os.path.basename(self.archive.path))
+        if file_id is None:
+            return 0
+        try:
+            metadata = self.drive.metadata(file_id)
+        except FileNotFoundError:
+            self._archive_file_id = None
+            return 0
+        if remote_version(metadata) == self._archive_version:
+            return 0
+        path = unique_temp_path(self.archive.path, ".download")
+        try:
+            with open(path, "wb") as stream:
+                self.drive.fetch(file_id, stream)
+            remote = PaymentArchive(path)
+            try:
+                rows = remote.rows()
+            finally:
+                remote.close()
+        finally:
+            for leftover in (path, f"{path}-wal", f"{path}-shm"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        clean = self.archive.generation() == self._archive_generation
+        added = self.archive.merge(rows)
+        if clean:
+            # Nada local a enviar: o arquivo local passa a corresponder à versão remota
+            self._archive_generation = self.archive.generation()
+        self._archive_file_id = file_id
+        self._archive_version = remote_version(metadata)
+        self._save_sync_state()
+        if added:
+            print(f"🗄️ {added} registros arquivados recebidos do Google Drive em {self.archive.path}.")
+        return added
+
+    def _push_archive(self):
+        """
+        Envia o arquivo de meses arquivados ao Drive se ele mudou desde o último envio
+        (deve ser chamada com _sync_lock). Se outra réplica o alterou antes, os registros
+        dela são incorporados e o envio é repetido. Retorna True se o Drive está em dia.
+        """
+        name = os.path.basename(self.archive.path)
+        for _ in range(SYNC_ATTEMPTS):
+            if self.archive.generation() == self._archive_generation:
+                return True
+            path = unique_temp_path(self.archive.path, ".upload")
+            try:
+                generation = self.archive.export(path)
+                file_id = self._archive_file_id or self.drive.find_file(name, folder_id)
+                if file_id is None:
+                    file = self.drive.create_from_path(path, name, SQLITE_MIMETYPE, [folder_id])
+                else:
+                    try:
+                        file = self.drive.update_file(
+                            file_id, path, SQLITE_MIMETYPE, expected=self._archive_version or ()
+                        )
+                    except FileNotFoundError:
+                        self._archive_file_id = None
+                        continue
+                    except DriveConflict:
+                        self._pull_archive()
+                        continue
+            finally:
+                os.remove(path)
+            self._archive_file_id = file.get('id') or file_id
+            self._archive_version = remote_version(file)
+            self._archive_generation = generation
+            self._save_sync_state()
+            print(f"🗄️ Meses arquivados enviados ao Google Drive: {name}")
+            return True
+        print(f"❌ {name} mudou no Google Drive durante {SYNC_ATTEMPTS} tentativas de envio.")
+        return False
+
+    def _download_snapshot(self, file_id):
+        """Baixa o arquivo do Drive para a memória e o converte em snapshot, sem alterar os dados locais."""
+        buffer = io.BytesIO()
+        self.drive.fetch(file_id, buffer)
+        buffer.seek(0)
+        loaded = self._read_workbook(buffer)
+        loaded["members"] = {user_id: member.snapshot() for user_id, member in loaded["members"].items()}
+        if loaded["payment_day"] is None:
+            loaded["payment_day"] = self.payment_day
+        return loaded
+
+    def _split_cold(self, snapshot):
+        """
+        Separa de um snapshot os meses anteriores à janela que vieram do Drive (de uma
+        réplica que ainda não os arquivou). Retorna (snapshot sem eles, registros do arquivo).
+        """
+        before = self._archive_before()
+        hot, cold = dict(snapshot, members={}), []
+        for user_id, info in snapshot["members"].items():
+            late = set(info["late"])
+            payments = {}
+            for month, paid in info["payments"].items():
+                if before is not None and month < before:
+                    cold.append((user_id, month, int(paid), int(month in late)))
+                else:
+                    payments[month] = paid
+            hot["members"][user_id] = {
+                "username": info["username"],
+                "payments": payments,
+                "late": [month for month in info["late"] if month in payments],
+            }
+        return hot, cold
+
+    @staticmethod
+    def _combine(base, local, remote):
+        """Versão remota se não houve alterações locais desde a base; senão o merge de três vias."""
+        if base is None or local == base:
+            return remote, 0
+        return merge_snapshots(base, local, remote)
+
+    def _merge_remote(self, metadata, remote, schedule=True, base=None):
+        """
+        Incorpora a versão remota `remote` (snapshot de `metadata`). Sem alterações locais
+        desde a última sincronização ela substitui os dados; caso contrário é combinada com
+        eles por merge_snapshots. Retorna o snapshot resultante, já aplicado e gravado.
+        O _lock só é mantido para trocar os dados em memória: o merge é calculado antes e
+        o workbook, o arquivo e o backend são gravados depois, com _save_lock. Sem base
+        gravada vale `base` (None: a versão remota substitui os dados locais).
+        """
+        with self._sync_lock, self._save_lock, self._batch_lock:
+            base = self._read_sync_base() or base
+            with self._lock:
+                local, generation = self._snapshot(), self._generation
+            merged, conflicts = self._combine(base, local, remote)
+            with self._lock:
+                if self._generation != generation:
+                    # Os dados mudaram durante o merge: refaz com os atuais (raro)
+                    merged, conflicts = self._combine(base, self._snapshot(), remote)
+                hot, cold = self._split_cold(merged)
+                self._restore(hot)
+                self._dirty = False
+                self._deferred = []
+            try:
+                if cold:
+                    self.archive.store(cold)
+                self._write_workbook(hot)
+                # O snapshot local foi substituído: o backend descarta/recarrega seu estado
+                self.storage.reset(self)
+            finally:
+                with self._lock:
+                    deferred, self._deferred = self._deferred, None
+                    for op, payload in deferred:
+                        self.storage.record(op, payload)
+            self._mark_synced(metadata, remote)
+        if merged != remote:
+            print(f"🔀 Alterações locais combinadas com o Google Drive ({conflicts} conflitos): {self.filename}")
+            if schedule:
+                self.schedule_upload()
+        return merged
+
+    @metrics.instrument("sync")
+    def load_from_google_drive(self):
+        """
+        Baixa os dados mais recentes do Google Drive ou cria o arquivo se não existir.
+        O download só acontece se o arquivo remoto mudou desde a última sincronização
+        (md5Checksum/modifiedTime/headRevisionId). Alterações locais ainda não enviadas
+        são combinadas com as remotas em vez de descartadas. Retorna True se os dados
+        foram recarregados.
+        """
+        with self._sync_lock:
+            return self._load_from_google_drive()
+
+    def _load_from_google_drive(self):
+        self._pull_archive()
+        file_id = self._drive_file_id or self.drive.find_file(os.path.basename(self.filename))
+        metadata = None
+        if file_id:
+            try:
+                metadata = self.drive.metadata(file_id)
+            except FileNotFoundError:
+                self._drive_file_id = None
+        if metadata is None:
+            print("❌ Arquivo não encontrado no Google Drive. Criando novo arquivo...")
+            self.create_file_in_drive()
+            return False
+
+        if remote_version(metadata) == self._remote_version:
+            print(f"✅ Arquivo no Google Drive sem alterações, mantendo os dados locais: {self.filename}")
+            return False
+
+        self._merge_remote(metadata, self._download_snapshot(file_id))
+        print(f"✅ Arquivo carregado com sucesso do Google Drive: {self.filename}")
+        return True
+
+    def _export_snapshot(self):
+        """Snapshot dos dados em memória e um workbook gerado a partir dele, para envio ao Drive."""
+        with self._batch_lock, self._lock:
+            snapshot = self._snapshot()
+        path = unique_temp_path(self.filename, ".upload")
+        try:
+            self._write_workbook(snapshot, path)
+        except Exception:
+            os.remove(path)
+            raise
+        return snapshot, path
+
+    def create_file_in_drive(self, parents=None):
+        """Cria o arquivo no Google Drive"""
+        with self._sync_lock:
+            snapshot, path = self._export_snapshot()
+            try:
+                file = self.drive.create_from_path(path, os.path.basename(self.filename), XLSX_MIMETYPE, parents)
+            finally:
+                os.remove(path)
+            self._mark_synced(file, snapshot)
+        print(f"✅ Arquivo criado com sucesso no Google Drive. Acesse em: https://drive.google.com/file/d/{self._drive_file_id}")
+
+    def _snapshot(self):
+        """Copia rasa dos dados para gravação fora do lock (deve ser chamada com o lock)."""
+        return {
+            "members": {user_id: member.snapshot() for user_id, member in list(self.data["members"].items())},
+            "account_links": dict(self.data["account_links"]),
+            "auto_paid_members": list(self.data["auto_paid_members"]),
+            "payment_day": self.payment_day,
+            "notification_channel": self.notification_channel,
+        }
+
+    @metrics.instrument("workbook")
+    def save_data(self):
+        """Salva os dados no arquivo Excel imediatamente, incluindo o dia de pagamento."""
+        with self._save_lock:
+            with self._batch_lock, self._lock:
+                self._dirty = False
+                snapshot = self._snapshot()
+            self._write_workbook(snapshot)
+
+    def _write_workbook(self, snapshot, filename=None):
+        """Reescreve o arquivo Excel (padrão: o arquivo local) a partir de um snapshot dos dados."""
+        filename = filename or self.filename
+        from openpyxl import Workbook
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.title = "Payments"
+        sheet.append(["UserID", "Username", "Payments", "Late"])  # Cabeçalhos
+
+        # Salva todos os membros com seus registros de pagamentos (e os meses pagos com atraso)
+        for user_id, info in snapshot["members"].items():
+            sheet.append([user_id, info["username"], str(info["payments"]), ",".join(info["late"]) or None])
+
+        # Salva o dia de pagamento em uma aba separada
+        config_sheet = workbook.create_sheet("Config")
+        config_sheet.append(["PaymentDay", "NotificationChannel"])
+        config_sheet.append([snapshot["payment_day"], snapshot["notification_channel"]])
+
+        if snapshot["auto_paid_members"]:
+            auto_paid_sheet = workbook.create_sheet("AutoPaid")
+            auto_paid_sheet.append(["UserID"])  # Cabeçalho
+            for user_id in snapshot["auto_paid_members"]:
+                auto_paid_sheet.append([user_id])
+
+        if snapshot["account_links"]:
+            links_sheet = workbook.create_sheet("AccountLinks")
+            links_sheet.append(["SecondaryID", "MainID"])  # Cabeçalhos
+            for secondary_id, main_id in snapshot["account_links"].items():
+                links_sheet.append([secondary_id, main_id])
+
+        # Grava em arquivo temporário e substitui atomicamente para não corromper o snapshot
+        temp_filename = unique_temp_path(filename)
+        try:
+            workbook.save(temp_filename)
+            os.replace(temp_filename, filename)
+        finally:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+        print(f"✅ Dados salvos com sucesso no arquivo {filename}.")
+
+
+    def schedule_upload(self):
+        """Agenda a sincronização com o Google Drive; pedidos próximos viram um único upload."""
+        self.uploader.request()
+
+    def _find_drive_file_id(self):
+        """ID do arquivo Excel na pasta do Drive, consultado uma vez e mantido em cache."""
+        with self._sync_lock:
+            if self._drive_file_id is None:
+                self._drive_file_id = self.drive.find_file(os.path.basename(self.filename), folder_id)
+            return self._drive_file_id
+
+    @metrics.instrument("sync")
+    def upload_to_google_drive(self):
+        """
+        Envia os dados ao Google Drive com controle de concorrência otimista: o arquivo
+        só é substituído se ainda estiver na versão da última sincronização. O arquivo de
+        meses arquivados é enviado junto, só quando mudou desde o último envio. Se outra
+        instância (ou alguém editando a planilha) alterou o arquivo, a versão remota é
+        combinada com a local (merge de três vias) e o envio é repetido.
+        Retorna True se o upload foi concluído.
+        """
+        with self._sync_lock:
+            return self._upload_to_google_drive()
+
+    def _upload_to_google_drive(self):
+        # Garante que alterações pendentes estejam gravadas localmente antes do envio
+        self.flush()
+        name = os.path.basename(self.filename)
+        snapshot, path = self._export_snapshot()
+        try:
+            # Os meses arquivados vão antes: quem receber a planilha sem eles já os encontra no Drive
+            if not self._push_archive():
+                return False
+            for _ in range(SYNC_ATTEMPTS):
+                file_id = self._find_drive_file_id()
+                if file_id is None:
+                    # Cria um novo arquivo na pasta especificada
+                    file = self.drive.create_from_path(path, name, XLSX_MIMETYPE, [folder_id])
+                    self._mark_synced(file, snapshot)
+                    print(f"✅ Arquivo criado no Google Drive na pasta especificada: {name}")
+                    return True
+                try:
+                    # Sem versão conhecida (primeira sincronização) o arquivo remoto é sempre combinado antes
+                    file = self.drive.update_file(file_id, path, XLSX_MIMETYPE, expected=self._remote_version or ())
+                except FileNotFoundError:
+                    # O arquivo foi apagado no Drive: descarta o ID em cache e cria de novo
+                    self._drive_file_id = None
+                    continue
+                except DriveConflict as conflict:
+                    print(f"⚠️ {name} foi alterado no Google Drive desde a última sincronização, combinando as alterações...")
+                    self._pull_archive()
+                    remote = self._download_snapshot(file_id)
+                    # Primeira sincronização: sem base, as alterações locais são mantidas no merge
+                    snapshot = self._merge_remote(conflict.metadata, remote, schedule=False, base=EMPTY_SNAPSHOT)
+                    self._write_workbook(snapshot, path)
+                    continue
+                # Guarda a versão enviada para não baixar de volta os próprios dados
+                self._mark_synced(file, snapshot)
+                print(f"✅ Arquivo atualizado no Google Drive: {name}")
+                return True
+            print(f"❌ {name} mudou no Google Drive durante {SYNC_ATTEMPTS} tentativas de envio.")
+            return False
+        except Exception as e:
+            print(f"❌ Erro durante o upload para o Google Drive: {e}")
+            return False
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def payment_month(self, user_id, today=None):
+        """
+        Mês a que o pagamento do próprio membro se refere e se ele está atrasado.
+        Após o vencimento, o pagamento conta para o próximo mês; mas um membro que ainda
+        não pagou o mês corrente está pagando esse mês, com atraso. Retorna (mês, atrasado).
+        """
+        today = today or datetime.now()
+        billing = self.billing_month(today)
+        current = today.strftime("%Y-%m")
+        member = self.data["members"].get(str(user_id))
+        if member is not None and billing != current and not member.get_payment(current):
+            return current, True
+        return billing, False
+
+    def register_payment(self, user_id, username, allow_late=True):
+        """
+        Registra o pagamento do usuário, considerando o vencimento. Com allow_late=False
+        (pagamentos automáticos), conta sempre para o mês de cobrança vigente, em dia.
+        Retorna (mês, atrasado).
+        """
+        user_id_str = str(user_id)
+        with self._lock:
+            if allow_late:
+                payment_month, late = self.payment_month(user_id_str)
+            else:
+                payment_month, late = self.billing_month(), False
+
+            # Registrar o pagamento (cria o membro se ainda não estiver registrado)
+            self._mutate(
+                "payment", user_id=user_id_str, username=username, month=payment_month, paid=True, late=late,
+            )
+        return payment_month, late
+
+    def register_auto_payments(self, members=None):
+        """
+        Registra, em uma única transação, o pagamento dos membros com pagamento automático.
+        `members` mapeia user_id -> username (ex.: membros presentes no servidor); por padrão
+        usa os membros já registrados no sistema.
+        """
+        with self.batch():
+            for user_id in list(self.data["auto_paid_members"]):
+                if members is not None:
+                    if user_id not in members:
+                        continue
+                    username = members[user_id]
+                elif user_id in self.data["members"]:
+                    username = self.data["members"][user_id]["username"]
+                else:
+                    continue
+                self.register_payment(user_id, username, allow_late=False)
+
+    def set_payment(self, user_id, username, month, paid=True):
+        """
+        Define o status de pagamento de um membro para um mês específico (uso administrativo,
+        inclusive em lote). Não marca atraso, já que quem registra não é o membro pagando;
+        um atraso já registrado no mês é mantido.
+        """
+        user_id = str(user_id)
+        with self._lock:
+            member = self.data["members"].get(user_id)
+            status = member.status(month) if member is not None else None
+            self._mutate(
+                "payment", user_id=user_id, username=username, month=month, paid=paid,
+                late=bool(paid and status and status[1]),
+            )
+
+    def remove_member(self, user_id):
+        """Remove um membro e os vínculos em que ele é a conta principal"""
+        self._mutate("member_remove", user_id=str(user_id))
+
+    def bulk_set_payments(self, entries, lines=None):
+        """
+        Define o status de várias entradas (user_id, username, mês, pago) em uma única
+        transação: uma gravação e uma sincronização com o Drive no final. Tudo é validado
+        antes (validate_payment_entries); havendo erros, nada é aplicado. Meses que já
+        têm o status pedido não geram mutação. Retorna um resumo com os contadores e os erros.
+        """
+        entries = [(str(user_id), username, month, bool(paid)) for user_id, username, month, paid in entries]
+        summary = {"paid": 0, "unpaid": 0, "unchanged": 0, "members_added": 0}
+        summary["errors"] = validate_payment_entries(entries, lines)
+        if summary["errors"]:
+            return summary
+        with self.batch():
+            for user_id, username, month, paid in entries:
+                member = self.data["members"].get(user_id)
+                if member is None:
+                    summary["members_added"] += 1
+                elif member.get_payment(month) == paid:
+                    summary["unchanged"] += 1
+                    continue
+                self.set_payment(user_id, username or (member.username if member else user_id), month, paid)
+                summary["paid" if paid else "unpaid"] += 1
+        return summary
+
+    def add_members(self, members):
+        """Adiciona vários membros (user_id -> username) em uma transação; retorna os IDs adicionados."""
+        added = []
+        with self.batch():
+            for user_id, username in members.items():
+                if str(user_id) not in self.data["members"]:
+                    self.register_initial_payment(user_id, username)
+                    added.append(str(user_id))
+        return added
+
+    def remove_members(self, user_ids):
+        """Remove vários membros em uma transação; retorna os IDs removidos."""
+        removed = []
+        with self.batch():
+            for user_id in map(str, user_ids):
+                if user_id in self.data["members"]:
+                    self.remove_member(user_id)
+                    removed.append(user_id)
+        return removed
+
+    def add_auto_paid(self, user_id):
+        """Adiciona um membro à lista de pagamento automático"""
+        self._mutate("auto_paid_add", user_id=str(user_id))
+
+
+    def billing_month(self, today=None):
+        """Mês de cobrança vigente para o dia de pagamento deste servidor"""
+        return billing_month(self.payment_day, today)
+
+    def due_date(self, today=None):
+        """Data de vencimento do mês de cobrança vigente"""
+        return due_date(self.payment_day, today)
+
+    def paid_members(self, month=None):
+        """IDs dos membros que pagaram no mês (padrão: mês de cobrança vigente)"""
+        month = month or self.billing_month()
+        with self._lock:
+            entry = self._month_index.get(month)
+            return set(entry["paid"]) if entry else set()
+
+    def pending_members(self, month=None):
+        """
+        IDs dos membros que ainda não pagaram no mês (padrão: mês de cobrança vigente).
+        Contas vinculadas contam como pagas quando a conta principal pagou.
+        """
+        month = month or self.billing_month()
+        with self._lock:
+            entry = self._month_index.get(month)
+            paid = entry["paid"] if entry else ()
+            return [
+                user_id for user_id in self.data["members"]
+                if user_id not in paid and self.links.root(user_id) not in paid
+            ]
+
+    def month_counts(self, month=None):
+        """
+        Quantidade de membros pagos e pendentes no mês, a partir do índice. Como em
+        pending_members, contas vinculadas contam como pagas quando a conta principal pagou.
+        """
+        month = month or self.billing_month()
+        with self._lock:
+            entry = self._month_index.get(month)
+            covered = set()
+            for user_id in entry["paid"] if entry else ():
+                # Só quem é a raiz da cadeia paga pelas contas vinculadas a ela
+                covered.update(self.links.accounts(user_id) if self.links.root(user_id) == user_id else (user_id,))
+            paid = len(covered & self.data["members"].keys())
+            return {"paid": paid, "pending": len(self.data["members"]) - paid}
+
+    def _archive_before(self, today=None):
+        """Primeiro mês mantido em memória (os anteriores ficam no arquivo); None sem arquivamento."""
+        if self.history_window <= 0:
+            return None
+        return month_label(month_offset(self.billing_month(today)) - self.history_window + 1)
+
+    def _archivable(self, before):
+        """Registros (user_id, month, paid, late) anteriores a `before` (deve ser chamada com o lock)."""
+        cutoff = month_offset(before)
+        rows = []
+        for user_id, member in self.data["members"].items():
+            if member.known and member.base < cutoff:
+                for month in member.months():
+                    if month >= before:
+                        break
+                    paid, late = member.status(month)
+                    rows.append((user_id, month, int(paid), int(late)))
+        return rows
+
+    def archive_history(self, today=None):
+        """
+        Move para o arquivo os meses anteriores à janela de HISTORY_WINDOW meses
+        (contados a partir do mês de cobrança vigente). Retorna quantos registros saíram.
+        """
+        before = self._archive_before(today)
+        if before is None:
+            return 0
+        with self._lock:
+            rows = self._archivable(before)
+        if not rows:
+            return 0
+        # Grava no arquivo antes de remover da memória (uma queda no meio não perde meses),
+        # fora do lock: as escritas no SQLite não bloqueiam as leituras do event loop
+        self.archive.store(rows)
+        with self._lock:
+            # Meses alterados ou criados enquanto o arquivo era gravado também vão para ele
+            changed = sorted(set(self._archivable(before)) - set(rows))
+            if changed:
+                self.archive.store(changed)
+                rows += changed
+            self._mutate("archive", before=before)
+        print(f"🗄️ {len(rows)} registros anteriores a {before} arquivados em {self.archive.path}.")
+        # O arquivo mudou: os meses arquivados vão ao Drive no próximo envio
+        self.schedule_upload()
+        return len(rows)
+
+    def history_page(self, user_id, page=1, page_size=HISTORY_PAGE_SIZE):
+        """
+        Página do histórico de um pagador (todas as contas vinculadas juntas), do mês mais
+        recente ao mais antigo. Os meses em memória vêm primeiro; o arquivo só é lido
+        quando a página chega neles. Retorna ([(month, paid)], total de páginas).
+        """
+        accounts = self.linked_accounts(user_id)
+        with self._lock:
+            live = {}
+            for account in accounts:
+                member = self.data["members"].get(account)
+                if member is not None:
+                    for month, paid in member.payments.items():
+                        live[month] = live.get(month, False) or paid
+        live = sorted(live.items(), reverse=True)
+        archived = self.archive.count(accounts)
+        pages = max(1, -(-(len(live) + archived) // page_size))
+        start = (page - 1) * page_size
+        entries = live[start:start + page_size]
+        if len(entries) < page_size and archived:
+            offset = max(0, start - len(live))
+            entries += self.archive.page(accounts, offset, page_size - len(entries))
+        return entries, pages
+
+    def report(self, exchange_rate=None):
+        """
+        Resumo para o !relatorio, montado a partir do índice por mês e dos agregados
+        (sem varrer o histórico dos membros).
+        """
+        month = self.billing_month()
+        counts = self.month_counts(month)
+        if self.analytics.archived is None:
+            archived = self.archive.totals()
+            with self._lock:
+                if self.analytics.archived is None:
+                    self.analytics.archived = archived
+        with self._lock:
+            stats = self.analytics
+            history = stats.totals()
+            total = counts["paid"] + counts["pending"]
+            entries = history["paid_entries"] + history["unpaid_entries"]
+            summary = {
+                "month": month,
+                "members": total,
+                "paid": counts["paid"],
+                "pending": counts["pending"],
+                "delinquency": counts["pending"] / total if total else 0.0,
+                "history_paid_ratio": history["paid_entries"] / entries if entries else 0.0,
+                "on_time": history["on_time"],
+                "late": history["late"],
+                "on_time_ratio": history["on_time"] / history["paid_entries"] if history["paid_entries"] else 0.0,
+                "top_streaks": [
+                    (self.data["members"][user_id].username, streak)
+                    for user_id, streak in stats.top_streaks()
+                    if streak
+                ],
+            }
+        if exchange_rate is not None:
+            price_per_person = SUBSCRIPTION_PRICE_USD * exchange_rate / SUBSCRIPTION_SPLIT
+            summary["price_per_person"] = price_per_person
+            summary["revenue"] = counts["paid"] * price_per_person
+            summary["expected_revenue"] = total * price_per_person
+        return summary
+
+    def get_payment_status(self, month=None):
+        """Retorna o status de pagamento de todos os membros no mês (padrão: mês de cobrança vigente)"""
+        paid = self.paid_members(month)
+        with self._lock:
+            return [
+                {
+                    "user_id": user_id,
+                    "username": info["username"],
+                    "paid": user_id in paid or self.links.root(user_id) in paid,
+                    "main_id": self.links.root(user_id),
+                }
+                for user_id, info in self.data["members"].items()
+            ]
+
+    def register_initial_payment(self, user_id, username):
+        """Registra um novo membro no sistema com status de pagamento pendente."""
+        current_month = datetime.now().strftime("%Y-%m")
+        user_id_str = str(user_id)  # Garantir que o ID está como string
+
+        # Adiciona o usuário ao sistema
+        self._mutate("member_add", user_id=user_id_str, username=username)
+
+        # Garante que o status do mês atual seja 'pendente'
+        if current_month not in self.data["members"][user_id_str]["payments"]:
+            self._mutate("payment", user_id=user_id_str, username=username, month=current_month, paid=False)
+
+    def has_paid(self, user_id, month=None):
+        """Verifica se o usuário já pagou no mês (padrão: mês de cobrança vigente)"""
+        return str(user_id) in self.paid_members(month)
+
+    def unregister_payment(self, user_id):
+        """Remove o pagamento do usuário considerando o vencimento"""
+        user_id_str = str(user_id)
+
+        # Após o vencimento, remove do próximo mês
+        payment_month = self.billing_month()
+
+        # Verificar e remover o pagamento
+        if user_id_str in self.data["members"]:
+            payments = self.data["members"][user_id_str].get("payments", {})
+            current = datetime.now().strftime("%Y-%m")
+            if payment_month not in payments and self.data["members"][user_id_str].status(current) == (True, True):
+                # O último !paguei quitou o mês corrente com atraso
+                payment_month = current
+
+            if payment_month in payments:
+                self._mutate(
+                    "payment", user_id=user_id_str, username=self.data["members"][user_id_str]["username"],
+                    month=payment_month, paid=False,
+                )
+                print(f"✅ Pagamento removido para o usuário {user_id_str} no mês {payment_month}.")
+                return True
+            else:
+                print(f"❌ Nenhum pagamento encontrado para o usuário {user_id_str} no mês {payment_month}.")
+                return False
+        else:
+            print(f"❌ Usuário {user_id_str} não está registrado.")
+            return False
+
+class AsyncPaymentManager:
+    """
+    Fachada assíncrona do PaymentManager de um servidor, para uso nos comandos do bot.
+    Chamadas ao Google Drive e ao disco (workbook/journal/banco) rodam em pools de
+    threads compartilhados, sem travar o event loop. O lock do servidor mantém as
+    mutações e sincronizações na ordem em que foram pedidas sem bloquear os outros
+    servidores. Leituras em memória (data, payment_day, get_main_account...) continuam síncronas.
+
+    Em FAST_START, o gerenciador é entregue com o snapshot local e `ready` só é
+    sinalizado após warmup() (sincronização com o Drive e pagamentos automáticos):
+    as leituras são atendidas na hora e as mutações aguardam o warmup.
+    """
+
+    def __init__(self, manager, drive_pool, disk_pool, lock=None):
+        self.manager = manager
+        self.drive_pool = drive_pool
+        self.disk_pool = disk_pool
+        self.lock = lock or asyncio.Lock()
+        self.ready = asyncio.Event()
+        self.ready.set()
+
+    def __getattr__(self, name):
+        return getattr(self.manager, name)
+
+    async def _run(self, pool, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+
+    async def _run_locked(self, pool, func, *args, **kwargs):
+        await self.ready.wait()
+        async with self.lock:
+            return await self._run(pool, func, *args, **kwargs)
+
+    async def sync(self, members):
+        """
+        Sincroniza com o Google Drive, registra os pagamentos automáticos de `members`
+        e arquiva o histórico antigo (quem chama deve ter o lock do servidor).
+        """
+        try:
+            await self._run(self.drive_pool, self.manager.load_from_google_drive)
+        except Exception as e:
+            print(f"❌ Não foi possível sincronizar {self.manager.filename} com o Google Drive, usando os dados locais: {e}")
+        await self._run(self.disk_pool, self.manager.register_auto_payments, members)
+        await self._run(self.disk_pool, self.manager.archive_history)
+
+    async def warmup(self, members):
+        """Executa sync() com o lock do servidor e sinaliza `ready` ao final, mesmo em caso de erro."""
+        try:
+            async with self.lock:
+                await self.sync(members)
+        finally:
+            self.ready.set()
+
+    # Google Drive
+    async def load_from_google_drive(self):
+        return await self._run_locked(self.drive_pool, self.manager.load_from_google_drive)
+
+    async def upload_to_google_drive(self):
+        return await self._run(self.drive_pool, self.manager.upload_to_google_drive)
 
-load_dotenv()
+    # Disco
+    async def flush(self):
+        return await self._run_locked(self.disk_pool, self.manager.flush)
 
-TOKEN = os.getenv("DISCORD_TOKEN")
-GOOGLE_CREDENTIALS = 'credentials.json'
-NOTIFICATION_CHANNEL = int(os.getenv("NOTIFICATION_CHANNEL"))
-folder_id = "xxxxxxxxxxxxxxxx"
-user_images = {}
+    async def load_data(self):
+        return await self._run_locked(self.disk_pool, self.manager.load_data)
 
+    async def register_payment(self, user_id, username):
+        return await self._run_locked(self.disk_pool, self.manager.register_payment, user_id, username)
 
-intents = discord.Intents.all()
-intents.message_content = True
-intents.members = True
+    async def register_auto_payments(self, members=None):
+        return await self._run_locked(self.disk_pool, self.manager.register_auto_payments, members)
 
-def get_dollar_exchange_rate():
-    """Obtém a cotação atual do dólar em relação ao BRL."""
-    API_URL = "https://api.exchangerate-api.com/v4/latest/USD"  
-    try:
-        response = requests.get(API_URL)
-        response.raise_for_status()
-        data = response.json()
-        return data["rates"].get("BRL", None)  
-    except Exception as e:
-        print(f"❌ Erro ao buscar cotação do dólar: {e}")
-        return None
-    
-# Inicializar o bot
-bot = commands.Bot(
-    command_prefix="!",
-    intents=intents,
-    description="Bot para gerenciamento de pagamentos",
-    help_command=commands.DefaultHelpCommand()
-)
+    async def batch(self, func, *args, **kwargs):
+        """Executa func(manager, ...) dentro de PaymentManager.batch(), no pool de disco."""
+        def run():
+            with self.manager.batch():
+                return func(self.manager, *args, **kwargs)
+        return await self._run_locked(self.disk_pool, run)
 
-# Classe para gerenciamento de pagamentos
-import io
-from googleapiclient.http import MediaIoBaseDownload
+    async def set_payment(self, user_id, username, month, paid=True):
+        return await self._run_locked(self.disk_pool, self.manager.set_payment, user_id, username, month, paid)
 
-class PaymentManager:
-    def __init__(self, filename="payments.xlsx"):
-        self.filename = filename
-        self.payment_day = 15
-        self.data = {"members": {}, "account_links": {}, "auto_paid_members": []}
-        if not os.path.exists(self.filename):
-            self.create_empty_file()
-        self.load_data()
+    async def unregister_payment(self, user_id):
+        return await self._run_locked(self.disk_pool, self.manager.unregister_payment, user_id)
 
-    def link_account(self, secondary_id, main_id):
-        """Vincula uma conta secundária a uma principal"""
-        self.data["account_links"][str(secondary_id)] = str(main_id)
-        self.save_data()
+    async def register_initial_payment(self, user_id, username):
+        return await self._run_locked(self.disk_pool, self.manager.register_initial_payment, user_id, username)
 
-    def get_main_account(self, user_id):
-        """Retorna a conta principal associada a um usuário, ou o próprio ID se não houver vínculo"""
-        return self.data["account_links"].get(str(user_id), str(user_id))
+    async def link_account(self, secondary_id, main_id):
+        return await self._run_locked(self.disk_pool, self.manager.link_account, secondary_id, main_id)
 
-    def set_payment_day(self, day: int):
-        """Define o dia de pagamento e salva no arquivo"""
-        if day < 1 or day > 31:
-            print("❌ O dia de pagamento deve ser entre 1 e 31.")
-            return
-        self.payment_day = day
-        self.save_data()
-        print(f"✅ Dia de pagamento atualizado para {day}.")
+    async def unlink_account(self, secondary_id):
+        return await self._run_locked(self.disk_pool, self.manager.unlink_account, secondary_id)
 
+    async def archive_history(self):
+        return await self._run_locked(self.disk_pool, self.manager.archive_history)
 
+    async def history_page(self, user_id, page=1):
+        return await self._run(self.disk_pool, self.manager.history_page, user_id, page)
 
-    def create_empty_file(self):
-        """Cria um arquivo Excel vazio"""
-        workbook = Workbook()
-        sheet = workbook.active
-        sheet.append(["UserID", "Username", "Payments"])  
-        workbook.save(self.filename)
-        print(f"✅ Arquivo vazio criado localmente: {self.filename}")
+    async def report(self, exchange_rate=None):
+        return await self._run(self.disk_pool, self.manager.report, exchange_rate)
 
+    async def set_payment_day(self, day):
+        return await self._run_locked(self.disk_pool, self.manager.set_payment_day, day)
 
-    def load_data(self):
-        """Carrega dados do arquivo Excel, incluindo o dia de pagamento."""
-        if os.path.exists(self.filename):
-            workbook = load_workbook(self.filename, data_only=True)
-            sheet = workbook.active
+    async def set_notification_channel(self, channel_id):
+        return await self._run_locked(self.disk_pool, self.manager.set_notification_channel, channel_id)
 
-            self.data["members"] = {
-                str(row[0]): {"username": row[1], "payments": eval(row[2])}
-                for row in sheet.iter_rows(min_row=2, values_only=True)
-                if row[0] is not None
-            }
+    async def remove_member(self, user_id):
+        return await self._run_locked(self.disk_pool, self.manager.remove_member, user_id)
 
-            if "Config" in workbook.sheetnames:
-                config_sheet = workbook["Config"]
-                self.payment_day = int(config_sheet.cell(row=2, column=1).value) 
-            else:
-                config_sheet = workbook.create_sheet("Config")
-                config_sheet.append(["PaymentDay"])
-                config_sheet.append([int(self.payment_day)])
-                workbook.save(self.filename)
+    async def bulk_set_payments(self, entries, lines=None):
+        return await self._run_locked(self.disk_pool, self.manager.bulk_set_payments, entries, lines)
 
-            if "AutoPaid" in workbook.sheetnames:
-                auto_paid_sheet = workbook["AutoPaid"]
-                self.data["auto_paid_members"] = [
-                    str(row[0]) for row in auto_paid_sheet.iter_rows(min_row=2, values_only=True) if row[0]
-                ]
-            else:
-                self.data["auto_paid_members"] = []
+    async def add_members(self, members):
+        return await self._run_locked(self.disk_pool, self.manager.add_members, members)
 
-            if "AccountLinks" in workbook.sheetnames:
-                links_sheet = workbook["AccountLinks"]
-                self.data["account_links"] = {
-                    str(row[0]): str(row[1])
-                    for row in links_sheet.iter_rows(min_row=2, values_only=True)
-                    if row[0] and row[1]
-                }
-            else:
-                self.data["account_links"] = {}
+    async def remove_members(self, user_ids):
+        return await self._run_locked(self.disk_pool, self.manager.remove_members, user_ids)
+
+    async def add_auto_paid(self, user_id):
+        return await self._run_locked(self.disk_pool, self.manager.add_auto_paid, user_id)
+
+
+class GuildRegistry:
+    """
+    Um PaymentManager por servidor, cada um com seu arquivo de dados (e arquivo no Drive)
+    e configuração. Os gerenciadores são carregados no primeiro comando do servidor,
+    no máximo max_resident ficam em memória e os ociosos são gravados e descarregados.
+    Comandos e tarefas agendadas fixam (pin) o servidor enquanto usam o gerenciador,
+    para que ele não seja descarregado no meio do uso.
+    """
+
+    MIN_RESIDENCY = 30  # segundos em que um gerenciador recém-usado não é descarregado
+
+    def __init__(self, max_resident=MAX_RESIDENT_GUILDS, idle_timeout=GUILD_IDLE_TIMEOUT):
+        self.max_resident = max_resident
+        self.idle_timeout = idle_timeout
+        self.drive_pool = ThreadPoolExecutor(max_workers=DRIVE_WORKERS, thread_name_prefix="drive")
+        self.disk_pool = ThreadPoolExecutor(max_workers=DISK_WORKERS, thread_name_prefix="disk")
+        self._managers = OrderedDict()  # guild_id -> AsyncPaymentManager, do menos ao mais recente
+        self._last_used = {}
+        self._locks = {}
+        self._evictor = None
+        self._warmups = {}  # guild_id -> tarefa de warmup em andamento
+        self._pins = {}  # guild_id -> comandos/tarefas em andamento que usam o gerenciador
+        self.stats = {"loaded": 0, "warming": 0, "warmup_errors": 0, "warmup_seconds_max": 0.0}
+
+    @staticmethod
+    def filename_for(guild_id):
+        if LEGACY_GUILD_ID and str(guild_id) == LEGACY_GUILD_ID:
+            return "payments.xlsx"
+        return GUILD_FILE_TEMPLATE.format(guild_id=guild_id)
+
+    def lock(self, guild_id):
+        """Lock do servidor: serializa carga, mutações e descarga sem afetar os outros."""
+        return self._locks.setdefault(guild_id, asyncio.Lock())
+
+    def pin(self, guild_id):
+        """Impede que o gerenciador do servidor seja descarregado até o unpin correspondente."""
+        self._pins[guild_id] = self._pins.get(guild_id, 0) + 1
+
+    def unpin(self, guild_id):
+        count = self._pins.get(guild_id, 0) - 1
+        if count > 0:
+            self._pins[guild_id] = count
         else:
-            self.save_data()
+            self._pins.pop(guild_id, None)
+
+    @contextmanager
+    def pinned(self, guild_id):
+        self.pin(guild_id)
+        try:
+            yield
+        finally:
+            self.unpin(guild_id)
+
+    async def get(self, guild):
+        """
+        Retorna o gerenciador do servidor, carregando-o na primeira vez. Quem usa o
+        gerenciador depois de um await deve fixar o servidor antes (pin/pinned).
+        """
+        manager = self._managers.get(guild.id)
+        if manager is None:
+            lock = self.lock(guild.id)
+            async with lock:
+                manager = self._managers.get(guild.id)
+                if manager is None:
+                    manager = await self._load(guild, lock)
+                    self._managers[guild.id] = manager
+        self._managers.move_to_end(guild.id)
+        self._last_used[guild.id] = time.monotonic()
+        await self._enforce_limit()
+        return manager
 
+    @property
+    def ready(self):
+        """True quando nenhum servidor carregado está sincronizando com o Drive."""
+        return not self._warmups
 
+    async def _load(self, guild, lock):
+        """
+        Carrega os dados do servidor (com o lock já adquirido) a partir do snapshot local.
+        A sincronização com o Drive e os pagamentos automáticos rodam em segundo plano
+        (FAST_START) ou antes de retornar.
+        """
+        loop = asyncio.get_running_loop()
+        filename = self.filename_for(guild.id)
+        manager = await loop.run_in_executor(self.disk_pool, PaymentManager, filename)
+        facade = AsyncPaymentManager(manager, self.drive_pool, self.disk_pool, lock)
+        metrics.register(self.uploader_component(guild.id), manager.uploader.stats)
+        members = {str(member.id): member.name for member in guild.members if not member.bot}
+        self.stats["loaded"] += 1
+        if not FAST_START:
+            await facade.sync(members)
+            print(f"✅ Servidor {guild.name} carregado de {filename}.")
+            return facade
 
+        facade.ready.clear()
+        task = asyncio.create_task(self._warmup(guild, facade, members))
+        self._warmups[guild.id] = task
+        self.stats["warming"] = len(self._warmups)
+        print(f"✅ Servidor {guild.name} carregado de {filename} (sincronizando com o Drive em segundo plano).")
+        return facade
 
-    def load_from_google_drive(self):
-        """Baixa os dados mais recentes do Google Drive ou cria o arquivo se não existir"""
-        SCOPES = ['https://www.googleapis.com/auth/drive']
-        creds = Credentials.from_authorized_user_file(GOOGLE_CREDENTIALS, SCOPES)
-        service = build('drive', 'v3', credentials=creds)
-
-       
-        query = f"name='{os.path.basename(self.filename)}'"
-        response = service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
-        files = response.get('files', [])
+    @staticmethod
+    def uploader_component(guild_id):
+        """Nome, nas métricas, da fila de uploads para o Drive do servidor."""
+        return f"uploader:{guild_id}"
 
-        if files:
-            file_id = files[0]['id']
-            request = service.files().get_media(fileId=file_id)
-            with open(self.filename, 'wb') as file:
-                downloader = MediaIoBaseDownload(file, request)
-                done = False
-                while not done:
-                    status, done = downloader.next_chunk()
-            print(f"✅ Arquivo carregado com sucesso do Google Drive: {self.filename}")
+    async def _warmup(self, guild, facade, members):
+        started = time.perf_counter()
+        try:
+            await facade.warmup(members)
+        except Exception as e:
+            self.stats["warmup_errors"] += 1
+            print(f"❌ Erro ao sincronizar o servidor {guild.name}: {e}")
         else:
-            print("❌ Arquivo não encontrado no Google Drive. Criando novo arquivo...")
-            self.create_file_in_drive(service)
+            print(f"✅ Servidor {guild.name} sincronizado em {time.perf_counter() - started:.2f}s.")
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stats["warmup_seconds_max"] = round(max(self.stats["warmup_seconds_max"], elapsed), 3)
+            self._warmups.pop(guild.id, None)
+            self.stats["warming"] = len(self._warmups)
+        if self.ready and "connected_seconds" in startup:
+            mark_startup("ready_seconds")
 
-        self.load_data()
+    async def _evict(self, guild_id, min_idle=0):
+        """Grava e descarrega o gerenciador de um servidor, se ele continuar ocioso com o lock adquirido."""
+        lock = self.lock(guild_id)
+        async with lock:
+            # O servidor pode ter voltado a ser usado enquanto o lock era aguardado
+            if guild_id not in self._managers or not self._idle(guild_id, min_idle):
+                return
+            # Sai do registro antes do primeiro await: um get() a partir daqui carrega de novo
+            manager = self._managers.pop(guild_id, None)
+            self._last_used.pop(guild_id, None)
+            metrics.unregister(self.uploader_component(guild_id))
+            if manager is not None:
+                await manager._run(self.disk_pool, manager.manager.close)
+                print(f"🗑️ Servidor {guild_id} descarregado da memória.")
 
-    def create_file_in_drive(self, service):
-        """Cria o arquivo no Google Drive"""
-        file_metadata = {'name': os.path.basename(self.filename)}
-        media = MediaFileUpload(self.filename, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    def _idle(self, guild_id, min_idle):
+        if guild_id in self._warmups or self._pins.get(guild_id):
+            return False
+        return time.monotonic() - self._last_used.get(guild_id, 0) >= min_idle
 
-        # Criação do arquivo no Google Drive
-        file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-        file_id = file.get('id')
-        print(f"✅ Arquivo criado com sucesso no Google Drive. Acesse em: https://drive.google.com/file/d/{file_id}")
+    def _evictable(self, guild_id, min_idle):
+        return not self.lock(guild_id).locked() and self._idle(guild_id, min_idle)
 
+    async def _enforce_limit(self):
+        """Descarrega os servidores usados há mais tempo acima do limite em memória."""
+        while len(self._managers) > self.max_resident:
+            candidate = next(
+                (guild_id for guild_id in self._managers if self._evictable(guild_id, self.MIN_RESIDENCY)), None
+            )
+            if candidate is None:
+                break  # todos em uso agora; tenta de novo no próximo acesso
+            await self._evict(candidate, self.MIN_RESIDENCY)
 
-    def save_data(self):
-        """Salva os dados no arquivo Excel, incluindo o dia de pagamento."""
-        workbook = Workbook()
-        sheet = workbook.active
-        sheet.title = "Payments"
-        sheet.append(["UserID", "Username", "Payments"])  # Cabeçalhos
+    async def evict_idle(self):
+        for guild_id in list(self._managers):
+            if guild_id in self._managers and self._evictable(guild_id, self.idle_timeout):
+                await self._evict(guild_id, self.idle_timeout)
 
-        # Salva todos os membros com seus registros de pagamentos
-        for user_id, info in self.data["members"].items():
-            sheet.append([user_id, info["username"], str(info["payments"])])
+    def start(self):
+        """Inicia a tarefa que descarrega servidores ociosos."""
+        if self._evictor is None or self._evictor.done():
+            self._evictor = asyncio.create_task(self._evict_loop())
 
-        # Salva o dia de pagamento em uma aba separada
-        config_sheet = workbook.create_sheet("Config")
-        config_sheet.append(["PaymentDay"])
-        config_sheet.append([self.payment_day])
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(min(60, self.idle_timeout))
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                print(f"❌ Erro ao descarregar servidores ociosos: {e}")
 
-        if self.data["auto_paid_members"]:
-            auto_paid_sheet = workbook.create_sheet("AutoPaid")
-            auto_paid_sheet.append(["UserID"])  # Cabeçalho
-            for user_id in self.data["auto_paid_members"]:
-                auto_paid_sheet.append([user_id])
+    async def run_on_disk(self, func, *args):
+        """Executa uma operação de disco fora do event loop, no pool de threads de disco."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.disk_pool, functools.partial(func, *args))
 
-        if self.data["account_links"]:
-            links_sheet = workbook.create_sheet("AccountLinks")
-            links_sheet.append(["SecondaryID", "MainID"])  # Cabeçalhos
-            for secondary_id, main_id in self.data["account_links"].items():
-                links_sheet.append([secondary_id, main_id])
+    async def upload_receipt(self, stream, name, mimetype):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.drive_pool, functools.partial(upload_receipt, drive_client, stream, name, mimetype)
+        )
 
-        workbook.save(self.filename)
-        print(f"✅ Dados salvos com sucesso no arquivo {self.filename}.")
+    def close(self):
+        """Grava e fecha todos os gerenciadores e aguarda as tarefas pendentes."""
+        for guild_id, manager in self._managers.items():
+            metrics.unregister(self.uploader_component(guild_id))
+            manager.manager.close()
+        self._managers.clear()
+        for pool in (self.drive_pool, self.disk_pool):
+            pool.shutdown(wait=True)
+
+
+guild_managers = GuildRegistry()
+metrics.executor = guild_managers.disk_pool
+metrics.register("guilds", guild_managers.stats)
+receipts = ReceiptPipeline(ReceiptStore(guild_managers))
+metrics.register("receipts", receipts.stats)
+metrics.register("receipt_store", receipts.store.stats)
 
 
-    def upload_image_to_google_drive(self, image_path, image_name):
+class JobScheduler:
+    """
+    Agendador das tarefas de cada servidor (lembretes, pagamentos automáticos) em
+    horários exatos. Os próximos disparos ficam em um heap e uma única tarefa dorme
+    até o mais próximo, sem acordar entre eventos. Os horários e o último disparo de
+    cada tarefa são gravados em SCHEDULE_FILE, então um reinício não repete disparos
+    já feitos e executa os que foram perdidos há menos de SCHEDULE_GRACE segundos.
+    O dia de pagamento de cada servidor também fica na agenda, para calcular os
+    disparos sem carregar o gerenciador de pagamentos do servidor.
+    """
+
+    def __init__(self, path=SCHEDULE_FILE, grace=SCHEDULE_GRACE):
+        self.path = path
+        self.grace = grace
+        self._kinds = {}   # tipo -> (next_fire, action)
+        self._next = {}    # (tipo, guild_id) -> próximo disparo (datetime)
+        self._heap = []    # (timestamp, tipo, guild_id); entradas obsoletas são descartadas ao sair
+        self._wakeup = asyncio.Event()
+        self._runner = None
+        self._running = set()
+        # async (guild) -> dia de pagamento; só é usado para servidores ainda sem dia na agenda
+        self.payment_day_source = None
+        self.state = self._load_state()  # "tipo:guild_id" -> {"next": iso, "fired": iso, "payment_day": dia}
+
+    def register(self, kind, next_fire, action):
         """
-        Faz upload de uma imagem para o Google Drive na pasta especificada e exclui o arquivo local após o upload.
+        Registra um tipo de tarefa. `next_fire(payment_day, after)` retorna o próximo
+        disparo depois de `after`; `action(guild, fire_at)` (async) executa a tarefa.
         """
-        SCOPES = ['https://www.googleapis.com/auth/drive']
-        creds = Credentials.from_authorized_user_file(GOOGLE_CREDENTIALS, SCOPES)
-        service = build('drive', 'v3', credentials=creds)
+        self._kinds[kind] = (next_fire, action)
 
-        file_metadata = {
-            'name': image_name,  # Nome do arquivo no formato username - datapagamento
-            'parents': [folder_id]  # Especifica a pasta onde o arquivo será armazenado
-        }
-        media = MediaFileUpload(image_path, mimetype='image/jpeg')  # Assumindo imagens no formato JPEG
+    async def _payment_day(self, guild, entry, payment_day=None):
+        """Dia de pagamento para os disparos: o informado, o gravado na agenda ou o do gerenciador do servidor."""
+        if payment_day is None:
+            payment_day = entry.get("payment_day")
+        if payment_day is None:
+            payment_day = await self.payment_day_source(guild)
+        entry["payment_day"] = payment_day
+        return payment_day
 
+    def _load_state(self):
+        if not os.path.exists(self.path):
+            return {}
         try:
-            # Upload do arquivo para o Google Drive
-            file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-            print(f"✅ Imagem enviada para o Google Drive: {image_name}")
+            with open(self.path, "r", encoding="utf-8") as state_file:
+                return json.load(state_file)
+        except (OSError, ValueError) as e:
+            print(f"❌ Agenda {self.path} ilegível, recalculando os disparos: {e}")
+            return {}
 
-            # Exclui o arquivo local após o upload bem-sucedido
-            os.remove(image_path)
-            print(f"🗑️ Arquivo local {image_path} excluído com sucesso.")
-        except Exception as e:
-            print(f"❌ Falha ao enviar ou excluir o arquivo {image_path}: {e}")
+    def _save_state(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as state_file:
+            json.dump(self.state, state_file, indent=1)
+        os.replace(temp_path, self.path)
 
-    def upload_to_google_drive(self):
+    def _push(self, kind, guild_id, fire_at):
+        self._next[(kind, guild_id)] = fire_at
+        self.state.setdefault(f"{kind}:{guild_id}", {})["next"] = fire_at.isoformat()
+        heapq.heappush(self._heap, (fire_at.timestamp(), kind, guild_id))
+        if self._heap[0][1:] == (kind, guild_id):
+            self._wakeup.set()  # o novo disparo é o mais próximo: acorda o loop para reajustar a espera
+
+    async def schedule(self, guild, reset=False, payment_day=None):
         """
-        Faz upload do arquivo Excel para o Google Drive, substituindo o arquivo existente.
-        Também exclui arquivos locais temporários após o upload bem-sucedido.
+        Agenda as tarefas de um servidor. Usa o horário gravado na agenda, se houver;
+        com reset=True (ex.: mudança do dia de pagamento, informado em `payment_day`)
+        recalcula a partir de agora.
         """
-        SCOPES = ['https://www.googleapis.com/auth/drive']
-        creds = Credentials.from_authorized_user_file(GOOGLE_CREDENTIALS, SCOPES)
-        service = build('drive', 'v3', credentials=creds)
+        now = datetime.now()
+        for kind, (next_fire, _) in self._kinds.items():
+            entry = self.state.setdefault(f"{kind}:{guild.id}", {})
+            if entry.get("next") and not reset:
+                fire_at = datetime.fromisoformat(entry["next"])
+            else:
+                after = now
+                if entry.get("fired"):
+                    after = max(now, datetime.fromisoformat(entry["fired"]))
+                payment_day = await self._payment_day(guild, entry, payment_day)
+                fire_at = next_fire(payment_day, after)
+            self._push(kind, guild.id, fire_at)
+        self._save_state()
 
-        # Verifica se o arquivo Excel já existe na pasta especificada
-        query = f"name='{os.path.basename(self.filename)}' and '{folder_id}' in parents"
-        response = service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
-        files = response.get('files', [])
-        print(f"Debug: Arquivos encontrados: {files}")
+    async def update_payment_day(self, guild, payment_day):
+        """Reagenda o servidor se o dia gravado na agenda ficou desatualizado (ex.: alterado via Google Drive)."""
+        if any(self.state.get(f"{kind}:{guild.id}", {}).get("payment_day") != payment_day for kind in self._kinds):
+            await self.schedule(guild, reset=True, payment_day=payment_day)
 
-        try:
-            if files:
-                # Atualiza o arquivo existente
-                file_id = files[0]['id']
-                file_metadata = {'name': os.path.basename(self.filename)}
-                media = MediaFileUpload(self.filename, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-                updated_file = service.files().update(fileId=file_id, body=file_metadata, media_body=media).execute()
-                print(f"✅ Arquivo atualizado no Google Drive: {os.path.basename(self.filename)}")
-            else:
-                # Cria um novo arquivo na pasta especificada
-                file_metadata = {
-                    'name': os.path.basename(self.filename),
-                    'parents': [folder_id]  # Especifica a pasta onde o arquivo será armazenado
-                }
-                media = MediaFileUpload(self.filename, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-                file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-                print(f"✅ Arquivo criado no Google Drive na pasta especificada: {os.path.basename(self.filename)}")
-
-            # Listar todos os arquivos na pasta especificada para depuração
-            response = service.files().list(
-                q=f"'{folder_id}' in parents",
-                spaces='drive',
-                fields='files(id, name)'
-            ).execute()
-            print(f"Arquivos na pasta do Google Drive: {response.get('files', [])}")
-
-            # Exclui o arquivo local após o upload (apenas se o upload foi bem-sucedido)
+    def unschedule(self, guild_id):
+        """Remove as tarefas de um servidor (as entradas no heap viram obsoletas)."""
+        for kind in self._kinds:
+            self._next.pop((kind, guild_id), None)
+            self.state.pop(f"{kind}:{guild_id}", None)
+        self._save_state()
+
+    async def start(self, guilds):
+        """Agenda os servidores conectados e inicia o loop do agendador."""
+        for guild in guilds:
             try:
-                os.remove(self.filename)
-                print(f"🗑️ Arquivo local {self.filename} excluído com sucesso.")
+                await self.schedule(guild)
             except Exception as e:
-                print(f"❌ Falha ao excluir o arquivo local {self.filename}: {e}")
+                print(f"❌ Erro ao agendar as tarefas do servidor {guild.name}: {e}")
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run_loop())
+
+    async def _run_loop(self):
+        while True:
+            # Descarta entradas substituídas por um reagendamento
+            while self._heap:
+                timestamp, kind, guild_id = self._heap[0]
+                fire_at = self._next.get((kind, guild_id))
+                if fire_at is not None and fire_at.timestamp() == timestamp:
+                    break
+                heapq.heappop(self._heap)
+
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
 
+            _, kind, guild_id = heapq.heappop(self._heap)
+            fire_at = self._next.pop((kind, guild_id))
+            await self._fire(kind, guild_id, fire_at)
+
+    async def _fire(self, kind, guild_id, fire_at):
+        """Registra o disparo, agenda o próximo e executa a tarefa em segundo plano."""
+        guild = bot.get_guild(guild_id)
+        if guild is None:
+            self.unschedule(guild_id)
+            return
+        next_fire, action = self._kinds[kind]
+        # O disparo é gravado antes de executar: após um reinício ele não se repete
+        entry = self.state.setdefault(f"{kind}:{guild_id}", {})
+        entry["fired"] = fire_at.isoformat()
+        try:
+            self._push(kind, guild_id, next_fire(await self._payment_day(guild, entry), fire_at))
         except Exception as e:
-            print(f"❌ Erro durante o upload para o Google Drive: {e}")
+            print(f"❌ Erro ao calcular o próximo disparo de {kind} no servidor {guild.name}: {e}")
+        self._save_state()
 
+        late = time.time() - fire_at.timestamp()
+        if late > self.grace:
+            print(f"⏭️ Disparo de {kind} em {fire_at:%d/%m/%Y %H:%M} perdido no servidor {guild.name}, ignorando.")
+            return
+        task = asyncio.create_task(self._execute(action, kind, guild, fire_at))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
 
+    async def _execute(self, action, kind, guild, fire_at):
+        try:
+            with guild_managers.pinned(guild.id):
+                await action(guild, fire_at)
+        except Exception as e:
+            print(f"❌ Erro ao executar {kind} no servidor {guild.name}: {e}")
 
-    def register_payment(self, user_id, username):
-        """Registra o pagamento do usuário, considerando o vencimento"""
-        today = datetime.now()
-        user_id_str = str(user_id)
 
-        # Determinar o mês de registro do pagamento
-        if today.day > self.payment_day:
-            # Caso a data de vencimento já tenha passado, registre no próximo mês
-            first_day_next_month = today.replace(day=28) + timedelta(days=4)
-            payment_month = first_day_next_month.replace(day=1).strftime("%Y-%m")
-        else:
-            # Caso contrário, registre no mês atual
-            payment_month = today.strftime("%Y-%m")
-
-        # Garantir que o usuário está registrado
-        if user_id_str not in self.data["members"]:
-            self.data["members"][user_id_str] = {"username": username, "payments": {}}
-
-        # Registrar o pagamento
-        self.data["members"][user_id_str]["payments"][payment_month] = True
-        self.save_data()
-
-
-    def get_payment_status(self):
-        """Retorna o status de pagamento de todos os membros"""
-        today = datetime.now()
-        current_month = today.strftime("%Y-%m")
-        
-        # Verifica se o dia atual é depois do vencimento
-        if today.day > self.payment_day:
-            payment_month = (today.replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+scheduler = JobScheduler()
+
+
+def chunk_lines(lines, header="", limit=MESSAGE_LIMIT, separator="\n"):
+    """
+    Junta as linhas em mensagens de no máximo `limit` caracteres, sem quebrar uma linha
+    ao meio. O cabeçalho vai só na primeira mensagem, seguido de uma quebra de linha.
+    """
+    chunks = []
+    current, has_lines = header, False
+    for line in lines:
+        line = line[:limit]
+        joiner = separator if has_lines else ("\n" if current else "")
+        if current and len(current) + len(joiner) + len(line) > limit:
+            chunks.append(current)
+            current = line
         else:
-            payment_month = current_month
-        
-        return [
-            {"username": info["username"], "paid": info["payments"].get(payment_month, False)}
-            for info in self.data["members"].values()
-        ]
+            current += joiner + line
+        has_lines = True
+    if current:
+        chunks.append(current)
+    return chunks
 
-    def register_initial_payment(self, user_id, username):
-        """Registra um novo membro no sistema com status de pagamento pendente."""
-        current_month = datetime.now().strftime("%Y-%m")
-        user_id_str = str(user_id)  # Garantir que o ID está como string
 
-        if user_id_str not in self.data["members"]:
-            # Adiciona o usuário ao sistema
-            self.data["members"][user_id_str] = {"username": username, "payments": {}}
+class RateBucket:
+    """Limite de `rate` envios a cada `per` segundos em uma rota (janela deslizante)."""
 
-        # Garante que o status do mês atual seja 'pendente'
-        if current_month not in self.data["members"][user_id_str]["payments"]:
-            self.data["members"][user_id_str]["payments"][current_month] = False  # Pendente
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self._sent = []
+        self._lock = asyncio.Lock()
+        self.blocked_until = 0.0  # definido ao receber um 429 da rota
 
-        # Salva no arquivo Excel
-        self.save_data()
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._sent = [moment for moment in self._sent if now - moment < self.per]
+                wait = self.blocked_until - now
+                if wait <= 0 and len(self._sent) < self.rate:
+                    self._sent.append(now)
+                    return
+                if wait <= 0:
+                    wait = self.per - (now - self._sent[0])
+                await asyncio.sleep(wait)
 
-    def has_paid(self, user_id):
-        """Verifica se o usuário já pagou no mês atual"""
-        current_month = datetime.now().strftime("%Y-%m")
-        return user_id in self.data["members"] and current_month in self.data["members"][user_id]["payments"]
 
-    def unregister_payment(self, user_id):
-        """Remove o pagamento do usuário considerando o vencimento"""
-        today = datetime.now()
-        user_id_str = str(user_id)
+class NotificationDispatcher:
+    """
+    Envio dos lembretes: mensagens diretas personalizadas com concorrência limitada e
+    resumos no canal divididos no limite de caracteres do Discord. Cada rota (DM de um
+    usuário, canal) tem seu próprio balde de limite de envios, além de um limite global;
+    respostas 429 bloqueiam a rota pelo retry_after e erros temporários são repetidos
+    com backoff exponencial.
+    """
 
-        # Determinar o mês relevante para remoção
-        if today.day > self.payment_day:
-            # Após o vencimento, remove do próximo mês
-            first_day_next_month = today.replace(day=28) + timedelta(days=4)
-            payment_month = first_day_next_month.replace(day=1).strftime("%Y-%m")
-        else:
-            # Antes ou no vencimento, remove do mês atual
-            payment_month = today.strftime("%Y-%m")
+    GLOBAL_RATE = (45, 1.0)   # abaixo do limite global de 50 requisições/s do Discord
+    ROUTE_RATE = (5, 5.0)     # limite de mensagens por canal
 
-        # Verificar e remover o pagamento
-        if user_id_str in self.data["members"]:
-            payments = self.data["members"][user_id_str].get("payments", {})
-            
-            if payment_month in payments:
-                payments[payment_month] = False
-                self.save_data()  
-                self.upload_to_google_drive()
-                print(f"✅ Pagamento removido para o usuário {user_id_str} no mês {payment_month}.")
+    def __init__(self, concurrency=NOTIFY_CONCURRENCY, retries=3, backoff=1.0):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self._global = RateBucket(*self.GLOBAL_RATE)
+        self._routes = {}
+        self.stats = {"sent": 0, "failed": 0, "retries": 0, "rate_limited": 0, "last_run": None}
+
+    def _bucket(self, route):
+        bucket = self._routes.get(route)
+        if bucket is None:
+            bucket = self._routes[route] = RateBucket(*self.ROUTE_RATE)
+        return bucket
+
+    @metrics.instrument("discord")
+    async def send(self, route, destination, content=None, embed=None):
+        """Envia uma mensagem respeitando os limites da rota. Retorna True se foi entregue."""
+        bucket = self._bucket(route)
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            await bucket.acquire()
+            await self._global.acquire()
+            try:
+                await destination.send(content=content, embed=embed)
+                self.stats["sent"] += 1
                 return True
-            else:
-                print(f"❌ Nenhum pagamento encontrado para o usuário {user_id_str} no mês {payment_month}.")
-                return False
-        else:
-            print(f"❌ Usuário {user_id_str} não está registrado.")
-            return False
+            except discord.Forbidden:
+                break  # DMs fechadas ou sem permissão no canal: não adianta repetir
+            except discord.HTTPException as e:
+                if attempt == self.retries:
+                    print(f"❌ Falha ao enviar mensagem para {route}: {e}")
+                    break
+                self.stats["retries"] += 1
+                if e.status == 429:
+                    self.stats["rate_limited"] += 1
+                    bucket.blocked_until = time.monotonic() + float(getattr(e, "retry_after", None) or delay)
+                else:
+                    await asyncio.sleep(delay)
+                    delay *= 2
+        self.stats["failed"] += 1
+        return False
+
+    async def post_chunks(self, channel, lines, header="", separator="\n"):
+        """Publica as linhas no canal em quantas mensagens forem necessárias."""
+        results = []
+        for chunk in chunk_lines(lines, header, separator=separator):
+            results.append(await self.send(("channel", channel.id), channel, chunk))
+        return all(results)
+
+    async def direct_messages(self, users, render):
+        """
+        Envia a cada usuário a mensagem `render(user)` com no máximo `concurrency` envios
+        simultâneos. Retorna {"sent", "failed", "seconds", "per_second"} desta rodada.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.monotonic()
+
+        async def deliver(user):
+            async with semaphore:
+                try:
+                    return await self.send(("dm", user.id), user, render(user))
+                except Exception as e:
+                    print(f"❌ Erro ao enviar mensagem direta para {user}: {e}")
+                    self.stats["failed"] += 1
+                    return False
+
+        delivered = await asyncio.gather(*(deliver(user) for user in users))
+        seconds = time.monotonic() - started
+        result = {
+            "sent": sum(delivered),
+            "failed": len(delivered) - sum(delivered),
+            "seconds": seconds,
+            "per_second": sum(delivered) / seconds if seconds else 0.0,
+        }
+        self.stats["last_run"] = result
+        return result
+
+
+notifier = NotificationDispatcher()
+metrics.register("notifier", notifier.stats)
+
+
+@bot.check
+async def guild_only(ctx):
+    """Os comandos dependem dos dados do servidor, então não funcionam por mensagem direta."""
+    if ctx.guild is None:
+        raise commands.NoPrivateMessage()
+    return True
 
-payment_manager = PaymentManager()
 
 @bot.event
 async def on_ready():
     print(f"✅ Bot conectado como {bot.user}")
-    guild = bot.guilds[0]
-    payment_manager.load_from_google_drive()
-    for member in guild.members:
-        if not member.bot:
-            user_id = str(member.id)
-            if user_id in payment_manager.data["auto_paid_members"]:
-                payment_manager.register_payment(user_id, member.name)
-    check_payments.start()
+    mark_startup("connected_seconds")
+    metrics.start()
+    guild_managers.start()
+    await scheduler.start(bot.guilds)
+    if guild_managers.ready:
+        mark_startup("ready_seconds")
+
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    """Marca o início do comando e fixa o gerenciador do servidor até o fim dele."""
+    ctx.started_at = time.perf_counter()
+    if ctx.guild is not None:
+        guild_managers.pin(ctx.guild.id)
+        ctx.pinned_guild = ctx.guild.id
+
+
+@bot.after_invoke
+async def record_command_latency(ctx):
+    """Registra a latência de todo comando executado (inclusive os que falharam) e libera o servidor."""
+    if getattr(ctx, "pinned_guild", None) is not None:
+        guild_managers.unpin(ctx.pinned_guild)
+        ctx.pinned_guild = None
+    started_at = getattr(ctx, "started_at", None)
+    if started_at is not None:
+        metrics.observe("command", ctx.command.qualified_name, time.perf_counter() - started_at, ctx.command_failed)
+        mark_startup("first_command_seconds")
+
+
+@bot.event
+async def on_guild_join(guild):
+    await scheduler.schedule(guild)
+
+
+@bot.event
+async def on_guild_remove(guild):
+    scheduler.unschedule(guild.id)
 
 @bot.event
 async def on_message(message):
-    if message.attachments:
+    # Comprovantes só valem no servidor em que foram enviados (mensagens diretas são ignoradas)
+    if message.attachments and message.guild is not None:
         for attachment in message.attachments:
-            if attachment.filename.lower().endswith(('jpg', 'jpeg', 'png', 'pdf')):
-                # Baixa o arquivo e salva localmente
-                save_path = f"temp_{message.author.id}_{attachment.filename}"
-                await attachment.save(save_path)
-                user_images[message.author.id] = save_path
+            if ReceiptPipeline.accepts(attachment):
+                # Guarda o comprovante até o membro usar o !paguei neste servidor
+                await receipts.add(message.guild.id, message.author.id, attachment)
                 await message.channel.send(f"📸 Comprovante recebido! Agora você pode usar o comando `!paguei` para finalizar o registro.")
     await bot.process_commands(message)
 
@@ -398,28 +4029,35 @@ async def on_message(message):
 @bot.command(name='paguei', help='Registra seu pagamento para o mês atual e envia o comprovante')
 async def register_payment(ctx):
     """Registra o pagamento do membro, sincroniza com o Google Drive e faz upload do comprovante"""
+    payment_manager = await guild_managers.get(ctx.guild)
     user_id = payment_manager.get_main_account(ctx.author.id)
-    payment_manager.register_payment(user_id, ctx.author.name)
+    month, late = await payment_manager.register_payment(user_id, ctx.author.name)
+    if late:
+        await ctx.send(f"⚠️ {ctx.author.name}, o pagamento quitou {month} após o vencimento e foi registrado como atrasado.")
 
     # Verifica se o usuário enviou um comprovante de pagamento
-    if ctx.author.id in user_images:
-        image_path = user_images.pop(ctx.author.id)  # Remove a entrada após usar
+    pending_receipts = receipts.take(ctx.guild.id, ctx.author.id)
+    if pending_receipts:
         date_str = datetime.now().strftime("%d-%m-%Y")  # Data do pagamento no formato desejado
-        image_name = f"{ctx.author.name} - {date_str}.jpg"  # Formata o nome como username - datapagamento
-        payment_manager.upload_image_to_google_drive(image_path, image_name)
-        await ctx.send(f"✅ Pagamento registrado com sucesso e comprovante enviado para {ctx.author.name}!")
+        uploaded = await receipts.upload(pending_receipts, f"{ctx.author.name} - {date_str}")  # username - datapagamento
+        if uploaded:
+            await ctx.send(f"✅ Pagamento registrado com sucesso e comprovante enviado para {ctx.author.name}!")
+        else:
+            await ctx.send(f"✅ Pagamento registrado para {ctx.author.name}, mas não foi possível enviar o comprovante.")
     else:
         await ctx.send(f"✅ Pagamento registrado com sucesso para {ctx.author.name}, mas nenhum comprovante foi encontrado.")
 
     # Sincroniza os dados com o Google Drive
-    payment_manager.upload_to_google_drive()
+    payment_manager.schedule_upload()
 
 
 @bot.command(name='naopaguei', help='Remove seu registro de pagamento do mês atual ou próximo, dependendo do vencimento')
 async def unregister_payment(ctx):
     """Desfaz o pagamento do membro"""
+    payment_manager = await guild_managers.get(ctx.guild)
     user_id = payment_manager.get_main_account(ctx.author.id)
-    if payment_manager.unregister_payment(user_id):
+    if await payment_manager.unregister_payment(user_id):
+        payment_manager.schedule_upload()
         await ctx.send(f"🔄 {ctx.author.name}, seu pagamento foi removido com sucesso.")
     else:
         await ctx.send(f"❌ {ctx.author.name}, você não tem um pagamento registrado para o período atual ou próximo.")
@@ -432,6 +4070,7 @@ async def mark_as_paid(ctx, member: discord.Member, month: str = None):
     Permite que um administrador registre o pagamento de outro membro para um mês específico.
     Se o mês não for especificado, usa o mês atual ou próximo.
     """
+    payment_manager = await guild_managers.get(ctx.guild)
     user_id = payment_manager.get_main_account(member.id)
     username = member.name
 
@@ -444,76 +4083,163 @@ async def mark_as_paid(ctx, member: discord.Member, month: str = None):
             await ctx.send("❌ Formato de mês inválido. Use o formato: `YYYY-MM` (ex: 2025-01).")
             return
     else:
-        # Usar a lógica padrão para determinar o mês
-        today = datetime.now()
-        if today.day > payment_manager.payment_day:
-            # Após o vencimento, registrar no próximo mês
-            first_day_next_month = today.replace(day=28) + timedelta(days=4)
-            payment_month = first_day_next_month.replace(day=1).strftime("%Y-%m")
-        else:
-            # Antes ou no vencimento, registrar no mês atual
-            payment_month = today.strftime("%Y-%m")
+        # Usar o mês de cobrança vigente (após o vencimento, o próximo mês)
+        payment_month = payment_manager.billing_month()
 
-    # Garantir que o usuário está registrado
-    if user_id not in payment_manager.data["members"]:
-        payment_manager.data["members"][user_id] = {"username": username, "payments": {}}
-
-    # Registrar o pagamento para o mês correto
-    payment_manager.data["members"][user_id]["payments"][payment_month] = True
+    # Registrar o pagamento para o mês correto (cria o membro se necessário)
+    await payment_manager.set_payment(user_id, username, payment_month, True)
 
-    # Salvar e sincronizar os dados
-    payment_manager.save_data()
-    payment_manager.upload_to_google_drive()
+    # Sincronizar os dados
+    payment_manager.schedule_upload()
 
     await ctx.send(f"✅ Pagamento registrado para {member.mention} no mês {payment_month}.")
 
 
+@bot.command(name='pagos', help='Marca vários membros como pagos em um intervalo de meses. Ex.: !pagos @a @b 2025-01 2025-12')
+@commands.has_permissions(administrator=True)
+async def bulk_mark_paid(ctx, members: commands.Greedy[discord.Member], start: str = None, end: str = None):
+    """
+    Registra o pagamento de vários membros de `start` a `end` (padrão: só o mês de
+    cobrança vigente) com uma única gravação e uma única sincronização.
+    """
+    if not members:
+        await ctx.send("❌ Mencione pelo menos um membro. Exemplo: `!pagos @a @b 2025-01 2025-12`")
+        return
+    payment_manager = await guild_managers.get(ctx.guild)
+    start = start or payment_manager.billing_month()
+    try:
+        months = months_between(start, end or start)
+    except ValueError:
+        await ctx.send("❌ Formato de mês inválido. Use o formato: `YYYY-MM` (ex: 2025-01).")
+        return
+    if not months:
+        await ctx.send("❌ O mês final deve ser igual ou posterior ao inicial.")
+        return
+
+    # Os pagamentos ficam na conta principal de cada membro
+    payers = {payment_manager.get_main_account(member.id): member.name for member in members}
+    entries = [(user_id, username, month, True) for user_id, username in payers.items() for month in months]
+    summary = await payment_manager.bulk_set_payments(entries)
+    header = f"📋 **Pagamentos de {len(payers)} membros de {months[0]} a {months[-1]}:**"
+    for chunk in chunk_lines(bulk_summary_lines(summary), header):
+        await ctx.send(chunk)
+
+
+@bot.command(name='importar', help='Importa pagamentos de um arquivo CSV/XLSX anexado (colunas user_id, mes e, opcionalmente, pago e username)')
+@commands.has_permissions(administrator=True)
+async def import_payments(ctx):
+    """
+    Importa pagamentos de um CSV/XLSX anexado à mensagem. O arquivo inteiro é validado
+    antes de aplicar: com qualquer erro nada é alterado; sem erros, tudo é gravado e
+    sincronizado de uma vez.
+    """
+    attachment = next(
+        (attachment for attachment in ctx.message.attachments if attachment.filename.lower().endswith(IMPORT_EXTENSIONS)),
+        None,
+    )
+    if attachment is None:
+        await ctx.send(
+            "❌ Anexe um arquivo `.csv` ou `.xlsx` com as colunas `user_id`, `mes` (YYYY-MM) e, "
+            "opcionalmente, `pago` (sim/não) e `username`."
+        )
+        return
+
+    payment_manager = await guild_managers.get(ctx.guild)
+    content = await attachment.read()
+    entries, lines, errors = await guild_managers.run_on_disk(read_payment_import, attachment.filename, content)
+    if not errors:
+        members = payment_manager.data["members"]
+        resolved = []
+        for user_id, username, month, paid in entries:
+            # Pagamentos de contas vinculadas vão para a conta principal
+            main_id = payment_manager.get_main_account(user_id)
+            if username is None or main_id != user_id:
+                guild_member = ctx.guild.get_member(int(main_id))
+                username = members[main_id].username if main_id in members else (
+                    guild_member.name if guild_member else main_id
+                )
+            resolved.append((main_id, username, month, paid))
+        summary = await payment_manager.bulk_set_payments(resolved, lines)
+        errors = summary["errors"]
+
+    if errors:
+        header = f"❌ **{attachment.filename}: {len(errors)} erros, nenhuma alteração foi aplicada.**"
+        for chunk in chunk_lines(errors, header):
+            await ctx.send(chunk)
+        return
+    header = f"📥 **{attachment.filename}: {len(entries)} linhas importadas.**"
+    for chunk in chunk_lines(bulk_summary_lines(summary), header):
+        await ctx.send(chunk)
+
+
 @bot.command(name='status', help='Mostra o status dos pagamentos de todos os membros')
 async def payment_status(ctx):
     """Exibe o status de pagamento de todos os membros"""
-    today = datetime.now()
-    if today.day > payment_manager.payment_day:
-        # Após o dia do vencimento, mova para o próximo mês
-        first_day_next_month = today.replace(day=28) + timedelta(days=4)
-        relevant_month = first_day_next_month.replace(day=1).strftime("%Y-%m")
-    else:
-        # Antes ou no dia do vencimento, use o mês atual
-        relevant_month = today.strftime("%Y-%m")
-    
-    status = [
-        {"username": info["username"], "paid": info["payments"].get(relevant_month, False)}
-        for info in payment_manager.data["members"].values()
-    ]
-    
+    payment_manager = await guild_managers.get(ctx.guild)
+    relevant_month = payment_manager.billing_month()
+    status = payment_manager.get_payment_status(relevant_month)
+
+    # Contas vinculadas aparecem junto da conta principal (quando ela está registrada)
+    by_id = {member["user_id"]: member for member in status}
+    linked = {}
+    for member in status:
+        if member["main_id"] != member["user_id"] and member["main_id"] in by_id:
+            linked.setdefault(member["main_id"], []).append(member["username"])
+
     message = f"📊 **Status dos Pagamentos de {relevant_month}**\n\n"
     for member in status:
+        if member["main_id"] != member["user_id"] and member["main_id"] in by_id:
+            continue
         emoji = "✅" if member["paid"] else "❌"
-        message += f"{emoji} {member['username']} {'(Pendente)' if not member['paid'] else ''}\n"
+        accounts = f" (+ {', '.join(linked[member['user_id']])})" if member["user_id"] in linked else ""
+        message += f"{emoji} {member['username']}{accounts} {'(Pendente)' if not member['paid'] else ''}\n"
+    await ctx.send(message)
+
+
+@bot.command(name='relatorio', help='Mostra um resumo dos pagamentos: inadimplência, pontualidade e arrecadação')
+async def payment_report(ctx):
+    """Exibe o relatório agregado de pagamentos do servidor"""
+    payment_manager = await guild_managers.get(ctx.guild)
+    exchange_rate = await exchange_rates.get()
+    report = await payment_manager.report(exchange_rate)
+
+    message = (
+        f"📈 **Relatório de Pagamentos — {report['month']}**\n\n"
+        f"👥 Membros: **{report['members']}** "
+        f"(✅ {report['paid']} pagos, ❌ {report['pending']} pendentes)\n"
+        f"📉 Inadimplência no mês: **{report['delinquency']:.0%}**\n"
+        f"📚 Meses pagos no histórico: **{report['history_paid_ratio']:.0%}**\n"
+        f"⏰ Pagamentos em dia: **{report['on_time']}** | com atraso: **{report['late']}** "
+        f"({report['on_time_ratio']:.0%} em dia)\n"
+    )
+    if "revenue" in report:
+        message += (
+            f"💵 Arrecadado no mês: **R${report['revenue']:.2f}** "
+            f"de **R${report['expected_revenue']:.2f}** previstos "
+            f"(R${report['price_per_person']:.2f} por pessoa)\n"
+        )
+    else:
+        message += "❌ Não foi possível obter a cotação do dólar para calcular a arrecadação.\n"
+    if report["top_streaks"]:
+        streaks = "\n".join(f"🔥 {username}: {streak} meses seguidos" for username, streak in report["top_streaks"])
+        message += f"\n🏆 **Maiores sequências de pagamentos:**\n{streaks}"
     await ctx.send(message)
 
 
 @bot.command(name='preco', help='Exibe o preço atual da assinatura em BRL e por pessoa')
 async def show_price(ctx):
     """Calcula e exibe o preço da assinatura com base na cotação do dólar, considerando o mês correto"""
-    exchange_rate = get_dollar_exchange_rate()
+    payment_manager = await guild_managers.get(ctx.guild)
+    exchange_rate = await exchange_rates.get()
     if exchange_rate is None:
         await ctx.send("❌ Não foi possível obter a cotação atual do dólar. Tente novamente mais tarde.")
         return
 
-    total_price = 20 * exchange_rate
-    price_per_person = total_price / 5
-
-    today = datetime.now()
-    if today.day > payment_manager.payment_day:
-        # Após o vencimento, defina a data de vencimento do próximo mês
-        first_day_next_month = today.replace(day=28) + timedelta(days=4)
-        due_date = first_day_next_month.replace(day=payment_manager.payment_day)
-    else:
-        # Antes ou no vencimento, mantenha a data atual
-        due_date = today.replace(day=payment_manager.payment_day)
+    total_price = SUBSCRIPTION_PRICE_USD * exchange_rate
+    price_per_person = total_price / SUBSCRIPTION_SPLIT
 
-    due_date_str = due_date.strftime('%d/%m/%Y')
-    pix_key = "146.980.396-81"  
+    due_date_str = payment_manager.due_date().strftime('%d/%m/%Y')
+    pix_key = PIX_KEY
 
     await ctx.send(
         f"💵 Cotação atual do dólar: **R${exchange_rate:.2f}**.\n"
@@ -524,61 +4250,105 @@ async def show_price(ctx):
     )
 
 
-@tasks.loop(hours=24)
-async def check_payments():
-    """Tarefa automática para verificar pagamentos e notificar membros pendentes."""
-    channel = bot.get_channel(NOTIFICATION_CHANNEL)
+async def guild_payment_day(guild):
+    """Dia de pagamento de um servidor ainda sem dia gravado na agenda (carrega o gerenciador)."""
+    payment_manager = await guild_managers.get(guild)
+    return payment_manager.payment_day
+
+
+async def register_guild_auto_payments(guild, fire_at):
+    """Na virada do mês de cobrança, registra os pagamentos automáticos do servidor (uma única gravação)."""
+    payment_manager = await guild_managers.get(guild)
+    await scheduler.update_payment_day(guild, payment_manager.payment_day)
+    await payment_manager.register_auto_payments()
+    # Os meses que saíram da janela de histórico vão para o arquivo
+    await payment_manager.archive_history()
+
+
+def guild_notification_channel(guild, payment_manager):
+    """
+    Canal de lembretes do servidor: o definido com !setcanal ou, se ele for deste mesmo
+    servidor, o NOTIFICATION_CHANNEL padrão. Um canal de outro servidor nunca é usado,
+    para não expor os membros pendentes de um servidor em outro. Retorna None sem canal.
+    """
+    channel = bot.get_channel(payment_manager.notification_channel or NOTIFICATION_CHANNEL)
     if not channel:
-        print("❌ Canal de notificações não encontrado.")
+        print(f"❌ Canal de notificações não encontrado para o servidor {guild.name}.")
+        return None
+    if channel.guild.id != guild.id:
+        print(
+            f"⚠️ O canal de notificações {channel.id} é de outro servidor; lembrete de {guild.name} não enviado. "
+            "Defina o canal do servidor com !setcanal."
+        )
+        return None
+    return channel
+
+
+async def send_payment_reminder(guild, fire_at):
+    """Sincroniza com o Google Drive e envia o lembrete de pagamento de um servidor."""
+    payment_manager = await guild_managers.get(guild)
+    await scheduler.update_payment_day(guild, payment_manager.payment_day)
+    channel = guild_notification_channel(guild, payment_manager)
+    if channel is None:
         return
 
-    today = datetime.now()
-    payment_date = datetime(today.year, today.month, int(payment_manager.payment_day))
-    days_until_payment = (payment_date - today).days
+    days_until_payment = (payment_manager.due_date(fire_at).date() - fire_at.date()).days
+    if days_until_payment not in REMINDER_DAYS:
+        # O dia de pagamento mudou depois do agendamento
+        return
 
-    # Processa pagamentos automáticos
-    for user_id in payment_manager.data["auto_paid_members"]:
-        if user_id in payment_manager.data["members"]:
-            payment_manager.register_payment(user_id, payment_manager.data["members"][user_id]["username"])
+    # Carrega dados do Google Drive antes de verificar o status (download só se o arquivo mudou)
+    await payment_manager.load_from_google_drive()
 
-    if days_until_payment in [2, 0]:
-        # Carrega dados do Google Drive antes de verificar o status
-        payment_manager.load_from_google_drive()
-        status = payment_manager.get_payment_status()
+    # Membros pendentes no mês de cobrança
+    billing = payment_manager.billing_month(fire_at)
+    pending_ids = payment_manager.pending_members(billing)
 
-        # Lista de membros pendentes
-        pending_members = [
-            f"<@{user_id}>" for user_id, info in payment_manager.data["members"].items()
-            if not info["payments"].get(datetime.now().strftime("%Y-%m"), False)
-        ]
+    # Cotação do dólar
+    exchange_rate = await exchange_rates.get()
+    price_per_person = None
+    if exchange_rate is not None:
+        total_price = SUBSCRIPTION_PRICE_USD * exchange_rate
+        price_per_person = total_price / SUBSCRIPTION_SPLIT
+        price_message = (
+            f"💵 O preço total da assinatura de $20 é **R${total_price:.2f}**.\n"
+            f"👥 Dividido por 5 pessoas, cada uma deve pagar **R${price_per_person:.2f}**."
+        )
+    else:
+        price_message = "❌ Não foi possível obter a cotação do dólar no momento."
 
-        # Cotação do dólar
-        exchange_rate = get_dollar_exchange_rate()
-        if exchange_rate is not None:
-            total_price = 20 * exchange_rate
-            price_per_person = total_price / 5
-            price_message = (
-                f"\n💵 O preço total da assinatura de $20 é **R${total_price:.2f}**."
-                f"\n👥 Dividido por 5 pessoas, cada uma deve pagar **R${price_per_person:.2f}**."
-            )
-        else:
-            price_message = "\n❌ Não foi possível obter a cotação do dólar no momento."
+    header = "🔔 **Lembrete de Pagamento**\n"
+    if days_until_payment == 2:
+        header += "Faltam 2 dias para o pagamento!\n\n"
+    else:
+        header += "O pagamento vence hoje!\n\n"
 
-        message = "🔔 **Lembrete de Pagamento**\n"
-        if days_until_payment == 2:
-            message += "Faltam 2 dias para o pagamento!\n\n"
-        else:
-            message += "O pagamento vence hoje!\n\n"
+    # O resumo no canal é dividido em mensagens dentro do limite de caracteres
+    if pending_ids:
+        lines = [f"<@{user_id}>" for user_id in pending_ids]
+        await notifier.post_chunks(channel, lines, header + "📋 **Membros pendentes:**", separator=", ")
+    else:
+        await notifier.send(("channel", channel.id), channel, header + "🎉 Todos os membros estão com os pagamentos em dia!")
+    await notifier.send(("channel", channel.id), channel, price_message)
 
-        if pending_members:
-            message += f"📋 **Membros pendentes:**\n{', '.join(pending_members)}"
-        else:
-            message += "🎉 Todos os membros estão com os pagamentos em dia!"
+    if REMINDER_DM and pending_ids:
+        due = payment_manager.due_date(fire_at).strftime("%d/%m/%Y")
+        when = "em 2 dias" if days_until_payment == 2 else "hoje"
+        amount = f" de **R${price_per_person:.2f}**" if price_per_person is not None else ""
 
-        message += price_message
+        def render(user):
+            return (
+                f"🔔 Olá, {user.display_name}! Seu pagamento{amount} de {billing} no servidor "
+                f"**{guild.name}** vence {when} ({due}).\n"
+                f"💳 Chave PIX: **{PIX_KEY}**. Depois de pagar, use `!paguei` no servidor."
+            )
 
-        # Envia a mensagem
-        await channel.send(message)
+        users = [member for member in map(guild.get_member, map(int, pending_ids)) if member is not None]
+        result = await notifier.direct_messages(users, render)
+        print(
+            f"📨 Lembretes diretos em {guild.name}: {result['sent']} enviados, {result['failed']} falhas "
+            f"em {result['seconds']:.1f}s ({result['per_second']:.1f}/s)."
+        )
 
 
 @bot.command(name='setdatapgamento', help='Define o dia de pagamento do mês')
@@ -591,39 +4361,63 @@ async def set_payment_day(ctx, day: int):
         await ctx.send("❌ O dia de pagamento deve ser entre 1 e 31.")
         return
 
-    # Atualiza o dia de pagamento e salva
-    payment_manager.set_payment_day(day)
-    payment_manager.upload_to_google_drive()
+    payment_manager = await guild_managers.get(ctx.guild)
+
+    # Atualiza o dia de pagamento, salva e reagenda lembretes e pagamentos automáticos
+    await payment_manager.set_payment_day(day)
+    payment_manager.schedule_upload()
+    await scheduler.schedule(ctx.guild, reset=True, payment_day=day)
     # Confirmação para o usuário
     await ctx.send(f"✅ O dia de pagamento foi atualizado para o dia {day} do mês.")
 
 
-@bot.command(name='historico', help='Exibe o histórico de pagamentos de um usuário específico')
-async def payment_history(ctx, member: discord.Member = None):
-    """Exibe o histórico de pagamentos de um membro específico"""
+@bot.command(name='setcanal', help='Define o canal onde os lembretes de pagamento são enviados')
+@commands.has_permissions(administrator=True)
+async def set_notification_channel(ctx, channel: discord.TextChannel):
+    """Define o canal de lembretes de pagamento deste servidor"""
+    payment_manager = await guild_managers.get(ctx.guild)
+    await payment_manager.set_notification_channel(channel.id)
+    payment_manager.schedule_upload()
+    await ctx.send(f"✅ Os lembretes de pagamento serão enviados em {channel.mention}.")
+
+
+@bot.command(name='historico', help='Exibe o histórico de pagamentos de um usuário específico (com página opcional)')
+async def payment_history(ctx, member: discord.Member = None, page: int = 1):
+    """Exibe o histórico de pagamentos de um membro, do mês mais recente ao mais antigo, em páginas"""
+    payment_manager = await guild_managers.get(ctx.guild)
     if member is None:
         await ctx.send("❌ Você precisa mencionar um membro. Exemplo: `!historico @usuario`")
         return
 
-    user_id = str(member.id)
-    if user_id not in payment_manager.data["members"]:
+    # Os pagamentos ficam na conta principal; o histórico junta todas as contas vinculadas
+    accounts = payment_manager.linked_accounts(member.id)
+    if not any(user_id in payment_manager.data["members"] for user_id in accounts):
         await ctx.send(f"❌ Nenhum histórico encontrado para {member.name}.")
         return
 
-    payments = payment_manager.data["members"][user_id]["payments"]
-    if not payments:
-        await ctx.send(f"📋 {member.name} não tem nenhum pagamento registrado.")
+    # Meses antigos ficam no arquivo e só são lidos quando a página chega neles
+    entries, pages = await payment_manager.history_page(member.id, max(1, page))
+    if not entries:
+        if page > 1:
+            await ctx.send(f"❌ Página inválida. O histórico de {member.name} tem {pages} página(s).")
+        else:
+            await ctx.send(f"📋 {member.name} não tem nenhum pagamento registrado.")
         return
 
-    history = "\n".join(
-        [f"📅 {month}: {'✅ Pago' if paid else '❌ Não Pago'}" for month, paid in sorted(payments.items())]
-    )
+    history = "\n".join(f"📅 {month}: {'✅ Pago' if paid else '❌ Não Pago'}" for month, paid in entries)
 
-    await ctx.send(f"📊 **Histórico de pagamentos de {member.name}:**\n{history}")
+    linked = ""
+    if len(accounts) > 1:
+        linked = f"🔗 Contas vinculadas: {', '.join(f'<@{user_id}>' for user_id in accounts)}\n"
+    footer = ""
+    if pages > 1:
+        footer = f"\n📄 Página {page} de {pages}. Use `!historico @{member.name} <página>` para ver mais."
+    await ctx.send(f"📊 **Histórico de pagamentos de {member.name}:**\n{linked}{history}{footer}")
 
 @bot.command(name='linkcontas', help='Vincula uma conta secundária a uma conta principal.')
 async def link_accounts(ctx, main_user: discord.Member, secondary_user: discord.Member):
     """Vincula uma conta secundária a uma principal"""
+    payment_manager = await guild_managers.get(ctx.guild)
     main_id = str(main_user.id)
     secondary_id = str(secondary_user.id)
 
@@ -631,13 +4425,26 @@ async def link_accounts(ctx, main_user: discord.Member, secondary_user: discord.
         await ctx.send("❌ A conta secundária já está vinculada a outra principal.")
         return
 
-    payment_manager.link_account(secondary_id, main_id)
-    payment_manager.upload_to_google_drive()
+    if not await payment_manager.link_account(secondary_id, main_id):
+        await ctx.send("❌ Esse vínculo formaria um ciclo: a conta principal já depende da secundária.")
+        return
+    payment_manager.schedule_upload()
     await ctx.send(f"✅ Conta {secondary_user.mention} foi vinculada à principal {main_user.mention}.")
 
+@bot.command(name='desvincular', help='Desfaz o vínculo de uma conta secundária.')
+async def unlink_account(ctx, secondary_user: discord.Member):
+    """Desfaz o vínculo de uma conta secundária com a sua principal"""
+    payment_manager = await guild_managers.get(ctx.guild)
+    if not await payment_manager.unlink_account(secondary_user.id):
+        await ctx.send(f"❌ A conta {secondary_user.mention} não está vinculada a nenhuma principal.")
+        return
+    payment_manager.schedule_upload()
+    await ctx.send(f"✅ Conta {secondary_user.mention} foi desvinculada.")
+
 @bot.command(name='addmembro', help='Adiciona um novo membro ao sistema de pagamentos')
 async def add_member(ctx, member: discord.Member):
     """Adiciona um novo membro ao sistema de pagamentos."""
+    payment_manager = await guild_managers.get(ctx.guild)
     user_id = str(member.id)
     username = member.name
 
@@ -647,14 +4454,15 @@ async def add_member(ctx, member: discord.Member):
         return
 
     # Adiciona o membro ao sistema com o status inicial de pagamento pendente
-    payment_manager.register_initial_payment(user_id, username)
-    payment_manager.upload_to_google_drive()
+    await payment_manager.register_initial_payment(user_id, username)
+    payment_manager.schedule_upload()
 
     await ctx.send(f"✅ O membro {member.mention} foi adicionado ao sistema com o status de pagamento pendente.")
 
 @bot.command(name='removemembro', help='Remove um membro do sistema de pagamentos')
 async def remove_member(ctx, member: discord.Member):
     """Remove um membro do sistema de pagamentos."""
+    payment_manager = await guild_managers.get(ctx.guild)
     user_id = str(member.id)
 
     # Verifica se o membro está registrado
@@ -662,19 +4470,45 @@ async def remove_member(ctx, member: discord.Member):
         await ctx.send(f"❌ O membro {member.mention} não está registrado no sistema.")
         return
 
-    # Remove o membro do sistema
-    del payment_manager.data["members"][user_id]
+    # Remove o membro do sistema e os links relacionados a ele
+    await payment_manager.remove_member(user_id)
+    payment_manager.schedule_upload()
 
-    # Remove links relacionados a este membro (se houver)
-    payment_manager.data["account_links"] = {
-        sec_id: main_id for sec_id, main_id in payment_manager.data["account_links"].items() if main_id != user_id
-    }
+    await ctx.send(f"✅ O membro {member.mention} foi removido do sistema de pagamentos.")
 
-    # Salva as alterações no arquivo Excel
-    payment_manager.save_data()
-    payment_manager.upload_to_google_drive()
+@bot.command(name='addmembros', help='Adiciona vários membros ao sistema de pagamentos. Ex.: !addmembros @a @b @c')
+@commands.has_permissions(administrator=True)
+async def add_members(ctx, members: commands.Greedy[discord.Member]):
+    """Adiciona vários membros de uma vez, com uma única gravação e sincronização."""
+    if not members:
+        await ctx.send("❌ Mencione pelo menos um membro. Exemplo: `!addmembros @a @b`")
+        return
+    payment_manager = await guild_managers.get(ctx.guild)
+    added = set(await payment_manager.add_members({str(member.id): member.name for member in members}))
+    lines = [
+        f"{'✅' if str(member.id) in added else '➖'} {member.mention}"
+        + ("" if str(member.id) in added else " já estava registrado")
+        for member in members
+    ]
+    for chunk in chunk_lines(lines, f"👥 **{len(added)} membros adicionados com pagamento pendente:**"):
+        await ctx.send(chunk)
 
-    await ctx.send(f"✅ O membro {member.mention} foi removido do sistema de pagamentos.")
+@bot.command(name='removemembros', help='Remove vários membros do sistema de pagamentos. Ex.: !removemembros @a @b')
+@commands.has_permissions(administrator=True)
+async def remove_members(ctx, members: commands.Greedy[discord.Member]):
+    """Remove vários membros de uma vez, com uma única gravação e sincronização."""
+    if not members:
+        await ctx.send("❌ Mencione pelo menos um membro. Exemplo: `!removemembros @a @b`")
+        return
+    payment_manager = await guild_managers.get(ctx.guild)
+    removed = set(await payment_manager.remove_members([member.id for member in members]))
+    lines = [
+        f"{'✅' if str(member.id) in removed else '➖'} {member.mention}"
+        + ("" if str(member.id) in removed else " não estava registrado")
+        for member in members
+    ]
+    for chunk in chunk_lines(lines, f"👥 **{len(removed)} membros removidos:**"):
+        await ctx.send(chunk)
 
 @bot.command(name='limpar', help='Limpa todas as mensagens do canal atual.')
 @commands.has_permissions(manage_messages=True)
@@ -692,17 +4526,24 @@ async def clear_channel(ctx):
 @commands.has_permissions(administrator=True)
 async def set_auto_payment(ctx, member: discord.Member):
     """Adiciona um membro à lista de pagamento automático."""
+    payment_manager = await guild_managers.get(ctx.guild)
     user_id = str(member.id)
     
     if user_id in payment_manager.data["auto_paid_members"]:
         await ctx.send(f"❌ O membro {member.mention} já está configurado para pagamento automático.")
         return
     
-    payment_manager.data["auto_paid_members"].append(user_id)
-    payment_manager.save_data()
-    payment_manager.upload_to_google_drive()
+    await payment_manager.add_auto_paid(user_id)
+    payment_manager.schedule_upload()
     await ctx.send(f"✅ O membro {member.mention} foi configurado para pagamento automático todos os meses.")
 
+@bot.command(name='metrics', help='Mostra as métricas de desempenho do bot (apenas administradores)')
+@commands.has_permissions(administrator=True)
+async def show_metrics(ctx):
+    """Exibe latência dos comandos, operações de I/O, travamentos do event loop e contadores"""
+    for chunk in chunk_lines(metrics.summary_lines(), "📊 **Métricas do bot**"):
+        await ctx.send(chunk)
+
 @bot.command(name='arquivos', help='Envia o link da pasta do Google Drive onde os arquivos estão sendo salvos')
 async def send_drive_folder_link(ctx):
     """Envia o link da pasta no Google Drive onde os arquivos estão sendo salvos"""
@@ -710,9 +4551,10 @@ async def send_drive_folder_link(ctx):
     await ctx.send(f"📂 Aqui está o link para a pasta no Google Drive: {folder_link}")
 
 
-@check_payments.before_loop
-async def before_check_payments():
-    await bot.wait_until_ready()
+scheduler.register("reminder", next_reminder, send_payment_reminder)
+scheduler.register("auto_paid", next_rollover, register_guild_auto_payments)
+scheduler.payment_day_source = guild_payment_day
 
 if __name__ == "__main__":
     bot.run(TOKEN)
+    guild_managers.close()
@@ -0,0 +1,50 @@
+import threading
+
+import main
+
+
+def manager(tmp_path, window=12):
+    path = str(tmp_path / "payments_1.xlsx")
+    payments = main.PaymentManager(
+        path, save_interval=3600, storage=main.create_storage("workbook", path),
+        drive=main.FakeDrive(str(tmp_path / "drive")),
+    )
+    payments.history_window = window
+    return payments
+
+
+def test_archive_history_writes_sqlite_outside_the_lock(tmp_path):
+    payments = manager(tmp_path)
+    payments.set_payment("1", "alice", "2020-01", True)
+    store = payments.archive.store
+    calls = []
+
+    def slow_store(rows):
+        if not calls:
+            # Outra thread consegue usar o gerenciador durante a gravação e altera um mês arquivável
+            writer = threading.Thread(target=payments.set_payment, args=("2", "bob", "2020-02", True))
+            writer.start()
+            writer.join(timeout=5)
+            assert not writer.is_alive()
+        calls.append(list(rows))
+        store(rows)
+
+    payments.archive.store = slow_store
+    assert payments.archive_history() == 2
+    assert calls == [[("1", "2020-01", 1, 0)], [("2", "2020-02", 1, 0)]]
+    assert sorted(payments.archive.rows()) == [("1", "2020-01", 1, 0), ("2", "2020-02", 1, 0)]
+    assert not payments.data["members"]["2"].payments
+    payments.close()
+
+
+def test_archive_generation_tracks_changes(tmp_path):
+    archive = main.PaymentArchive(str(tmp_path / "a.archive.db"))
+    assert archive.generation() == 0
+    archive.store([("1", "2020-01", 1, 0)])
+    assert archive.generation() == 1
+    assert archive.merge([("1", "2020-01", 0, 0)]) == 0
+    assert archive.generation() == 1
+    assert archive.merge([("2", "2020-01", 1, 1)]) == 1
+    assert archive.generation() == 2
+    assert sorted(archive.rows()) == [("1", "2020-01", 1, 0), ("2", "2020-01", 1, 1)]
+    archive.close()
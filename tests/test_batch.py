@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+import main
+
+
+def manager(tmp_path, backend="workbook"):
+    path = str(tmp_path / "payments_1.xlsx")
+    return main.PaymentManager(
+        path, save_interval=3600, storage=main.create_storage(backend, path),
+        drive=main.FakeDrive(str(tmp_path / "drive")),
+    )
+
+
+def in_thread(func, *args):
+    """Executa func em outra thread e falha se ela ficar bloqueada."""
+    results = []
+    worker = threading.Thread(target=lambda: results.append(func(*args)))
+    worker.start()
+    worker.join(timeout=5)
+    assert not worker.is_alive()
+    return results[0]
+
+
+@pytest.mark.parametrize("backend", ["workbook", "journal", "sqlite"])
+def test_batch_commits_once_and_survives_reopen(tmp_path, backend):
+    payments = manager(tmp_path, backend)
+    payments.schedule_upload = lambda: None
+    assert payments.bulk_set_payments([("1", "alice", "2026-01", True), ("2", "bob", "2026-01", False)])["paid"] == 1
+    payments.close()
+
+    reopened = manager(tmp_path, backend)
+    assert reopened.data["members"]["1"].get_payment("2026-01") is True
+    assert reopened.data["members"]["2"].get_payment("2026-01") is False
+    reopened.close()
+
+
+@pytest.mark.parametrize("backend", ["workbook", "journal", "sqlite"])
+def test_batch_rollback_restores_memory_and_storage(tmp_path, backend):
+    payments = manager(tmp_path, backend)
+    payments.set_payment("1", "alice", "2026-01", True)
+    payments.flush()
+
+    with pytest.raises(RuntimeError):
+        with payments.batch():
+            payments.set_payment("1", "alice", "2026-01", False)
+            payments.add_members({"2": "bob"})
+            raise RuntimeError("falha no meio do lote")
+
+    assert set(payments.data["members"]) == {"1"}
+    assert payments.data["members"]["1"].get_payment("2026-01") is True
+    assert payments.paid_members("2026-01") == {"1"}
+    payments.close()
+
+    reopened = manager(tmp_path, backend)
+    assert set(reopened.data["members"]) == {"1"}
+    assert reopened.data["members"]["1"].get_payment("2026-01") is True
+    reopened.close()
+
+
+def test_batch_body_does_not_block_readers(tmp_path):
+    payments = manager(tmp_path)
+    payments.schedule_upload = lambda: None
+    payments.link_account("2", "1")
+    with payments.batch():
+        payments.set_payment("1", "alice", "2026-01", True)
+        assert in_thread(payments.get_main_account, "2") == "1"
+        assert in_thread(payments.month_counts, "2026-01")["paid"] == 1
+    payments.close()
+
+
+def test_batch_rollback_keeps_mutations_from_other_threads(tmp_path):
+    payments = manager(tmp_path)
+    with pytest.raises(RuntimeError):
+        with payments.batch():
+            payments.set_payment("1", "alice", "2026-01", True)
+            in_thread(payments.set_payment, "9", "zoe", "2026-01", True)
+            raise RuntimeError("falha no meio do lote")
+    assert set(payments.data["members"]) == {"9"}
+    assert payments.paid_members("2026-01") == {"9"}
+    payments.close()
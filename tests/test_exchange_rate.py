@@ -0,0 +1,61 @@
+import asyncio
+
+import main
+
+
+class CountingSource:
+    """Fonte de cotação que espera ser liberada e conta as chamadas."""
+
+    def __init__(self, rate=5.0):
+        self.rate = rate
+        self.calls = 0
+        self.fail = False
+        self.release = None
+
+    async def __call__(self):
+        self.calls += 1
+        if self.release is not None:
+            await self.release.wait()
+        if self.fail:
+            raise ConnectionError("API fora do ar")
+        return self.rate
+
+
+def test_concurrent_requests_share_one_fetch():
+    source = CountingSource()
+    provider = main.ExchangeRateProvider(source=source, ttl=60, timeout=5)
+
+    async def run():
+        source.release = asyncio.Event()
+        pending = [asyncio.create_task(provider.get()) for _ in range(5)]
+        await asyncio.sleep(0)
+        source.release.set()
+        return await asyncio.gather(*pending)
+
+    assert asyncio.run(run()) == [5.0] * 5
+    assert source.calls == 1
+    assert provider.stats["coalesced"] == 4
+    assert asyncio.run(provider.get()) == 5.0
+    assert source.calls == 1 and provider.stats["hits"] == 1
+
+
+def test_failed_refresh_serves_the_last_known_rate():
+    source = CountingSource()
+    provider = main.ExchangeRateProvider(source=source, ttl=0, timeout=5)
+    assert asyncio.run(provider.get()) == 5.0
+
+    source.fail = True
+    assert asyncio.run(provider.get()) == 5.0
+    assert provider.stats["stale_served"] == 1 and provider.stats["errors"] == 1
+
+
+def test_timeout_without_a_previous_rate_returns_none():
+    source = CountingSource()
+    provider = main.ExchangeRateProvider(source=source, ttl=60, timeout=0.01)
+
+    async def run():
+        source.release = asyncio.Event()  # nunca liberado: estoura o timeout
+        return await provider.get()
+
+    assert asyncio.run(run()) is None
+    assert provider.stats["errors"] == 1 and provider._inflight is None
@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+import main
+
+
+class FakeFacade:
+    def __init__(self):
+        self.closed = False
+        self.manager = self
+
+    def close(self):
+        self.closed = True
+
+    async def _run(self, pool, func):
+        return func()
+
+
+def registry(*guild_ids):
+    guilds = main.GuildRegistry(max_resident=1, idle_timeout=60)
+    for guild_id in guild_ids:
+        guilds._managers[guild_id] = FakeFacade()
+        guilds._last_used[guild_id] = 0
+    return guilds
+
+
+def test_pinned_guilds_are_not_evicted():
+    guilds = registry(1, 2)
+    first, second = guilds._managers[1], guilds._managers[2]
+    with guilds.pinned(1):
+        asyncio.run(guilds.evict_idle())
+    assert list(guilds._managers) == [1]
+    assert not first.closed and second.closed
+    assert guilds._pins == {}
+    guilds.close()
+
+
+def test_eviction_rechecks_pins_under_the_guild_lock():
+    guilds = registry(1)
+    manager = guilds._managers[1]
+
+    async def run():
+        lock = guilds.lock(1)
+        async with lock:
+            # Um comando em andamento: o descarregamento espera o lock e encontra o servidor fixado
+            eviction = asyncio.create_task(guilds._evict(1, 60))
+            await asyncio.sleep(0)
+            guilds.pin(1)
+        await eviction
+
+    asyncio.run(run())
+    assert guilds._managers == {1: manager} and not manager.closed
+    guilds.unpin(1)
+    asyncio.run(guilds._evict(1, 60))
+    assert manager.closed and not guilds._managers
+    guilds.close()
+
+
+def test_default_notification_channel_is_not_used_by_other_guilds(monkeypatch):
+    guild_a, guild_b = SimpleNamespace(id=1, name="a"), SimpleNamespace(id=2, name="b")
+    channels = {10: SimpleNamespace(id=10, guild=guild_a), 20: SimpleNamespace(id=20, guild=guild_b)}
+    monkeypatch.setattr(main.bot, "get_channel", channels.get)
+    monkeypatch.setattr(main, "NOTIFICATION_CHANNEL", 10)
+
+    unset = SimpleNamespace(notification_channel=None)
+    assert main.guild_notification_channel(guild_a, unset) is channels[10]
+    assert main.guild_notification_channel(guild_b, unset) is None
+    assert main.guild_notification_channel(guild_b, SimpleNamespace(notification_channel=20)) is channels[20]
+    assert main.guild_notification_channel(guild_b, SimpleNamespace(notification_channel=10)) is None
+
+
+def test_uploader_gauges_follow_the_loaded_guilds(tmp_path, monkeypatch):
+    original = main.PaymentManager
+
+    def payment_manager(filename):
+        path = str(tmp_path / filename)
+        return original(
+            path, save_interval=3600, storage=main.create_storage("workbook", path),
+            drive=main.FakeDrive(str(tmp_path / "drive")),
+        )
+
+    monkeypatch.setattr(main, "PaymentManager", payment_manager)
+    monkeypatch.setattr(main, "FAST_START", False)
+    guilds = main.GuildRegistry(max_resident=2, idle_timeout=60)
+    guild = SimpleNamespace(id=7, name="g", members=[])
+    component = guilds.uploader_component(guild.id)
+
+    async def run():
+        manager = await guilds.get(guild)
+        manager.manager.uploader.request()
+        assert main.metrics.components[component] is manager.manager.uploader.stats
+        assert "queue_depth" in manager.manager.uploader.stats
+        assert any(line.startswith(f"`{component}`") for line in main.metrics.summary_lines())
+        await guilds._evict(guild.id)
+
+    asyncio.run(run())
+    assert component not in main.metrics.components
+    guilds.close()
@@ -0,0 +1,18 @@
+import main
+
+
+def test_chunk_lines_keeps_lines_whole_and_under_the_limit():
+    lines = [f"membro {index:02d}" for index in range(20)]
+    chunks = main.chunk_lines(lines, "📋 Pendentes", limit=40)
+
+    assert all(len(chunk) <= 40 for chunk in chunks)
+    assert chunks[0].startswith("📋 Pendentes\nmembro 00")
+    assert not any(chunk.startswith("📋") for chunk in chunks[1:])
+    assert "\n".join(chunks).split("\n")[1:] == lines
+
+
+def test_chunk_lines_truncates_oversized_lines_and_uses_the_separator():
+    assert main.chunk_lines(["x" * 50], limit=10) == ["x" * 10]
+    assert main.chunk_lines(["<@1>", "<@2>", "<@3>"], "Lembrete:", limit=20, separator=" ") == ["Lembrete:\n<@1> <@2>", "<@3>"]
+    assert main.chunk_lines([], "Cabeçalho") == ["Cabeçalho"]
+    assert main.chunk_lines([]) == []
@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import main
+
+
+def manager(tmp_path):
+    path = str(tmp_path / "payments_1.xlsx")
+    payments = main.PaymentManager(
+        path, save_interval=3600, storage=main.create_storage("workbook", path),
+        drive=main.FakeDrive(str(tmp_path / "drive")),
+    )
+    payments.payment_day = 10
+    return payments
+
+
+def test_payment_month_is_late_only_when_current_month_is_open(tmp_path):
+    payments = manager(tmp_path)
+    payments.set_payment("1", "alice", "2026-02", True)
+
+    assert payments.payment_month("1", datetime(2026, 3, 5)) == ("2026-03", False)
+    assert payments.payment_month("1", datetime(2026, 3, 20)) == ("2026-03", True)
+    assert payments.payment_month("2", datetime(2026, 3, 20)) == ("2026-04", False)
+
+    payments.set_payment("1", "alice", "2026-03", True)
+    assert payments.payment_month("1", datetime(2026, 3, 20)) == ("2026-04", False)
+
+
+def test_admin_payments_are_not_late(tmp_path):
+    payments = manager(tmp_path)
+    payments.set_payment("1", "alice", "2020-01", True)
+    payments.bulk_set_payments([("2", "bob", "2020-01", True)])
+
+    assert payments.data["members"]["1"].status("2020-01") == (True, False)
+    assert payments.data["members"]["2"].status("2020-01") == (True, False)
+
+
+def test_admin_payment_keeps_existing_late_flag(tmp_path):
+    payments = manager(tmp_path)
+    payments._mutate("payment", user_id="1", username="alice", month="2020-01", paid=True, late=True)
+    payments.set_payment("1", "alice", "2020-01", True)
+
+    assert payments.data["members"]["1"].status("2020-01") == (True, True)
+
+
+def test_month_counts_agree_with_payment_status_for_linked_accounts(tmp_path):
+    payments = manager(tmp_path)
+    month = "2026-03"
+    for user_id, name in [("1", "main"), ("2", "alt"), ("3", "alt2"), ("4", "other"), ("5", "alt3")]:
+        payments.set_payment(user_id, name, month, False)
+    payments.link_account("2", "1")
+    payments.link_account("3", "2")
+    payments.link_account("5", "4")
+    payments.set_payment("1", "main", month, True)
+    payments.set_payment("5", "alt3", month, True)
+
+    status = payments.get_payment_status(month)
+    counts = payments.month_counts(month)
+    assert counts == {"paid": 4, "pending": 1}
+    assert counts["paid"] == sum(entry["paid"] for entry in status)
+    assert counts["pending"] == len(payments.pending_members(month))
+
+
+def test_month_index_matches_a_full_scan_after_mutations(tmp_path):
+    payments = manager(tmp_path)
+
+    def scanned(month):
+        return {
+            user_id for user_id, member in payments.data["members"].items()
+            if member.get_payment(month) is True
+        }
+
+    payments.set_payment("1", "alice", "2026-01", True)
+    payments.set_payment("2", "bob", "2026-01", True)
+    payments.set_payment("2", "bob", "2026-01", False)
+    payments.set_payment("3", "carol", "2026-02", True)
+    payments.add_members({"4": "dave"})
+    payments.remove_member("3")
+
+    for month in ("2026-01", "2026-02", "2026-03"):
+        assert payments.paid_members(month) == scanned(month)
+    assert payments.pending_members("2026-01") == ["2", "4"]
+    assert payments.month_counts("2026-02") == {"paid": 0, "pending": 3}
+
+    # O índice reconstruído na carga é igual ao mantido incrementalmente (sem os meses que ficaram vazios)
+    def index():
+        return {month: dict(entry) for month, entry in payments._month_index.items() if any(entry.values())}
+
+    incremental = index()
+    with payments._lock:
+        payments._rebuild_index()
+    assert index() == incremental
@@ -0,0 +1,94 @@
+import asyncio
+
+import main
+
+
+class FakeAttachment:
+    def __init__(self, filename, content, content_type=None):
+        self.filename = filename
+        self.content = content
+        self.content_type = content_type
+
+    async def read(self):
+        return self.content
+
+    async def save(self, fp):
+        # Como o discord.py: objetos que não são io.BufferedIOBase são tratados como caminho
+        with open(fp, "wb") as output:
+            output.write(self.content)
+
+
+def test_add_stores_attachment_content():
+    pipeline = main.ReceiptPipeline(store=None)
+    content = b"%PDF-1.4 comprovante"
+    receipt = asyncio.run(pipeline.add(10, 1, FakeAttachment("recibo.pdf", content, "application/pdf")))
+
+    assert receipt.mimetype == "application/pdf"
+    assert receipt.stream.read() == content
+    assert pipeline.take(10, 1) == [receipt]
+    receipt.close()
+
+
+def test_add_spills_large_receipts_to_disk():
+    pipeline = main.ReceiptPipeline(store=None)
+    content = b"x" * (main.RECEIPT_SPILL_SIZE + 1)
+    receipt = asyncio.run(pipeline.add(10, 1, FakeAttachment("recibo.png", content)))
+
+    assert receipt.stream._rolled
+    assert receipt.stream.read() == content
+    receipt.close()
+
+
+def test_receipts_are_only_taken_in_the_guild_they_were_sent():
+    pipeline = main.ReceiptPipeline(store=None)
+    receipt = asyncio.run(pipeline.add(10, 1, FakeAttachment("recibo.pdf", b"%PDF-1.4")))
+
+    assert pipeline.take(20, 1) == []
+    assert pipeline.take(10, 1) == [receipt]
+    receipt.close()
+
+
+class FakeRegistry(main.GuildRegistry):
+    """Registro real (pool de disco), com o upload para o Drive simulado."""
+
+    def __init__(self):
+        super().__init__()
+        self.uploads = []
+
+    async def upload_receipt(self, stream, name, mimetype):
+        await asyncio.sleep(0)
+        self.uploads.append(name)
+        return f"file-{len(self.uploads)}"
+
+
+def receipt(content, filename="recibo.pdf"):
+    stored = main.Receipt(filename, "application/pdf")
+    stored.stream.write(content)
+    stored.stream.seek(0)
+    return stored
+
+
+def test_store_uploads_each_content_once(tmp_path):
+    registry = FakeRegistry()
+    index_path = str(tmp_path / "receipts_index.json")
+    store = main.ReceiptStore(registry, index_path=index_path)
+
+    async def run():
+        # O mesmo arquivo anexado duas vezes ao mesmo tempo, e depois reenviado
+        first, second = await asyncio.gather(
+            store.save(receipt(b"comprovante"), "alice"), store.save(receipt(b"comprovante"), "alice (2)")
+        )
+        third = await store.save(receipt(b"comprovante"), "alice")
+        other = await store.save(receipt(b"outro comprovante"), "bob")
+        return first, second, third, other
+
+    first, second, third, other = asyncio.run(run())
+    assert first == second == third == "file-1" and other == "file-2"
+    assert registry.uploads == ["alice", "bob"]
+    assert store.stats["duplicates"] == 2 and store.stats["uploaded"] == 2
+
+    # O índice gravado em disco evita o reenvio depois de reiniciar
+    restarted = main.ReceiptStore(registry, index_path=index_path)
+    assert asyncio.run(restarted.save(receipt(b"comprovante"), "alice")) == "file-1"
+    assert len(registry.uploads) == 2
+    registry.close()
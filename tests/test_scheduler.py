@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import main
+
+
+def scheduler(tmp_path, days):
+    jobs = main.JobScheduler(str(tmp_path / "schedule.json"))
+    loads = []
+
+    async def payment_day(guild):
+        loads.append(guild.id)
+        return days[guild.id]
+
+    async def action(guild, fire_at):
+        pass
+
+    jobs.payment_day_source = payment_day
+    jobs.register("reminder", main.next_reminder, action)
+    jobs.register("auto_paid", main.next_rollover, action)
+    return jobs, loads
+
+
+def test_payment_day_is_persisted_and_managers_are_not_loaded_again(tmp_path, monkeypatch):
+    guild = SimpleNamespace(id=1, name="guild")
+    monkeypatch.setattr(main.bot, "get_guild", lambda guild_id: guild)
+    jobs, loads = scheduler(tmp_path, {1: 10})
+    asyncio.run(jobs.schedule(guild))
+    assert loads == [1]
+
+    # Após um reinício, agendar e disparar usam o dia gravado na agenda
+    jobs, loads = scheduler(tmp_path, {1: 10})
+    assert jobs.state["reminder:1"]["payment_day"] == 10
+
+    async def restart():
+        await jobs.schedule(guild)
+        await jobs._fire("auto_paid", 1, datetime(2026, 3, 11))
+        await asyncio.gather(*jobs._running)
+
+    asyncio.run(restart())
+    assert loads == []
+    assert jobs._next[("auto_paid", 1)] == datetime(2026, 4, 11)
+
+
+def test_update_payment_day_reschedules_only_on_change(tmp_path):
+    guild = SimpleNamespace(id=1, name="guild")
+    jobs, loads = scheduler(tmp_path, {1: 10})
+
+    async def run():
+        await jobs.schedule(guild)
+        before = dict(jobs._next)
+        await jobs.update_payment_day(guild, 10)
+        assert jobs._next == before
+        await jobs.update_payment_day(guild, 20)
+
+    asyncio.run(run())
+    assert all(jobs.state[f"{kind}:1"]["payment_day"] == 20 for kind in ("reminder", "auto_paid"))
+    assert jobs._next[("auto_paid", 1)].day == 21
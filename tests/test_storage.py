@@ -0,0 +1,127 @@
+import os
+
+import pytest
+
+import main
+
+
+def manager(tmp_path, backend):
+    path = str(tmp_path / "payments_1.xlsx")
+    payments = main.PaymentManager(
+        path, save_interval=3600, storage=main.create_storage(backend, path),
+        drive=main.FakeDrive(str(tmp_path / "drive")),
+    )
+    payments.schedule_upload = lambda: None
+    return payments
+
+
+def test_journal_is_replayed_over_the_snapshot_after_a_crash(tmp_path):
+    payments = manager(tmp_path, "journal")
+    payments.set_payment("1", "alice", "2026-01", True)
+    payments.set_payment("2", "bob", "2026-01", False)
+    payments.flush()
+    # Queda antes da compactação: só o journal tem as mutações
+    payments.storage.close()
+
+    reopened = manager(tmp_path, "journal")
+    assert reopened.data["members"]["1"].get_payment("2026-01") is True
+    assert reopened.data["members"]["2"].get_payment("2026-01") is False
+    reopened.close()
+
+
+def test_journal_replay_ignores_a_truncated_last_record(tmp_path):
+    payments = manager(tmp_path, "journal")
+    payments.set_payment("1", "alice", "2026-01", True)
+    payments.flush()
+    payments.storage.close()
+    with open(payments.storage.path, "a", encoding="utf-8") as journal:
+        journal.write('{"op": "payment", "user_id": "2", "usern')
+
+    reopened = manager(tmp_path, "journal")
+    assert set(reopened.data["members"]) == {"1"}
+    reopened.close()
+
+
+def test_compaction_writes_the_snapshot_and_empties_the_journal(tmp_path):
+    payments = manager(tmp_path, "journal")
+    payments.set_payment("1", "alice", "2026-01", True)
+    payments.flush()
+    payments.storage.compact(payments)
+
+    assert os.path.getsize(payments.storage.path) == 0
+    assert not os.path.exists(f"{payments.storage.path}.old")
+    payments.storage.close()
+
+    reopened = manager(tmp_path, "journal")
+    assert reopened.data["members"]["1"].get_payment("2026-01") is True
+    reopened.close()
+
+
+def test_compaction_triggers_after_compact_records(tmp_path):
+    payments = manager(tmp_path, "journal")
+    payments.storage.compact_records = 2
+    payments.set_payment("1", "alice", "2026-01", True)
+    payments.set_payment("1", "alice", "2026-02", True)
+    payments.flush()
+
+    assert os.path.getsize(payments.storage.path) == 0
+    payments.close()
+
+
+def test_sqlite_backend_migrates_the_workbook_once(tmp_path):
+    payments = manager(tmp_path, "workbook")
+    payments.set_payment("1", "alice", "2026-01", True)
+    payments._mutate("payment", user_id="2", username="bob", month="2026-01", paid=True, late=True)
+    payments.add_members({"3": "carol"})
+    payments.link_account("3", "1")
+    payments.add_auto_paid("2")
+    payments.set_payment_day(15)
+    expected = payments._snapshot()
+    payments.close()
+
+    migrated = manager(tmp_path, "sqlite")
+    assert migrated._snapshot() == expected
+    assert migrated.payment_day == 15
+    migrated.set_payment("1", "alice", "2026-02", True)
+    migrated.close()
+
+    # Depois da migração o banco é a fonte: o workbook não é lido de novo
+    os.remove(str(tmp_path / "payments_1.xlsx"))
+    reopened = manager(tmp_path, "sqlite")
+    assert reopened.data["members"]["1"].get_payment("2026-02") is True
+    assert reopened.data["members"]["2"].get_payment("2026-01") is True
+    assert reopened.get_main_account("3") == "1"
+    reopened.close()
+
+
+def test_parse_payments_reads_the_legacy_repr_without_eval():
+    assert main.parse_payments("{'2025-01': True, '2025-02': False}") == {"2025-01": True, "2025-02": False}
+    assert main.parse_payments('{"2025-03": 1}') == {"2025-03": True}
+    assert main.parse_payments(None) == {}
+    assert main.parse_payments({"2025-01": True}) == {"2025-01": True}
+    assert main.parse_payments("__import__('os').getcwd()") == {}
+    with pytest.raises(ValueError):
+        main.parse_payments("{'2025-01': __import__('os').getcwd()}")
+    with pytest.raises(ValueError):
+        main.parse_payments("['2025-01: True']")
+
+
+def test_workbook_loader_streams_legacy_files_without_config(tmp_path):
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["ID", "Username", "Payments"])
+    sheet.append([1, "alice", "{'2025-01': True, '2025-02': False}"])
+    sheet.append([2, "bob", None])
+    sheet.append([None, None, None])
+    path = str(tmp_path / "legacy.xlsx")
+    workbook.save(path)
+
+    payments = manager(tmp_path, "workbook")
+    loaded = payments._read_workbook(path)
+    assert set(loaded["members"]) == {"1", "2"}
+    assert loaded["members"]["1"].get_payment("2025-01") is True
+    assert loaded["members"]["1"].get_payment("2025-02") is False
+    assert loaded["payment_day"] is None and loaded["account_links"] == {}
+    payments.close()
@@ -0,0 +1,255 @@
+import json
+import os
+import threading
+
+import main
+
+
+def replica(tmp_path, name, drive, window=0, backend="workbook"):
+    directory = tmp_path / name
+    directory.mkdir(exist_ok=True)
+    path = str(directory / "payments_1.xlsx")
+    manager = main.PaymentManager(path, save_interval=3600, storage=main.create_storage(backend, path), drive=drive)
+    manager.history_window = window
+    return manager
+
+
+def history(manager):
+    """Histórico completo: os meses em memória mais os arquivados."""
+    with manager._lock:
+        payments = {user_id: dict(member.payments) for user_id, member in manager.data["members"].items()}
+    for user_id, month, paid, _ in manager.archive.rows():
+        payments.setdefault(user_id, {}).setdefault(month, bool(paid))
+    return payments
+
+
+def test_archived_months_survive_sync_between_replicas(tmp_path):
+    drive = main.FakeDrive(str(tmp_path / "drive"))
+    current = main.billing_month(15)
+    a = replica(tmp_path, "a", drive)
+    a.set_payment("1", "alice", "2020-01", True)
+    a.set_payment("1", "alice", current, False)
+    assert a.upload_to_google_drive()
+    b = replica(tmp_path, "b", drive)
+    assert b.load_from_google_drive()
+
+    # A arquiva 2020-01 e envia uma alteração; B envia outra e precisa combinar as duas
+    a.history_window = 12
+    assert a.archive_history() == 1
+    assert "2020-01" not in a.data["members"]["1"].payments
+    a.set_payment("1", "alice", current, True)
+    assert a.upload_to_google_drive()
+    b.set_payment("2", "bob", current, True)
+    assert b.upload_to_google_drive()
+
+    c = replica(tmp_path, "c", drive)
+    assert c.load_from_google_drive()
+    assert a.load_from_google_drive()
+    expected = {"1": {"2020-01": True, current: True}, "2": {current: True}}
+    for manager in (a, b, c):
+        assert history(manager) == expected
+    # A planilha no Drive só tem os meses em memória; os arquivados ficam no arquivo separado
+    remote = a._download_snapshot(a._drive_file_id)
+    assert "2020-01" not in remote["members"]["1"]["payments"]
+    # Em A o mês continua só no arquivo local
+    assert "2020-01" not in a.data["members"]["1"].payments
+    assert a.history_page("1", 1)[0] == [(current, True), ("2020-01", True)]
+    for manager in (a, b, c):
+        manager.close()
+
+
+def test_concurrent_upload_and_download_keep_sync_state_consistent(tmp_path):
+    drive = main.FakeDrive(str(tmp_path / "drive"))
+    current = main.billing_month(15)
+    other = replica(tmp_path, "other", drive)
+    a = replica(tmp_path, "a", drive)
+    a.set_payment("1", "alice", current, True)
+    assert a.upload_to_google_drive()
+
+    errors = []
+
+    def run(action, times=10):
+        try:
+            for _ in range(times):
+                action()
+        except Exception as e:
+            errors.append(e)
+
+    def remote_change():
+        other.load_from_google_drive()
+        other.set_payment("2", "bob", current, not other.data["members"].get("2", {}).get("payments", {}).get(current))
+        other.upload_to_google_drive()
+
+    threads = [
+        threading.Thread(target=run, args=(a.upload_to_google_drive,)),
+        threading.Thread(target=run, args=(a.load_from_google_drive,)),
+        threading.Thread(target=run, args=(remote_change,)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert a.upload_to_google_drive()
+    assert a._remote_version == main.remote_version(drive.metadata(a._drive_file_id))
+    leftovers = [name for name in os.listdir(tmp_path / "a") if name.endswith((".tmp", ".upload"))]
+    assert leftovers == []
+    for manager in (a, other):
+        manager.close()
+
+
+def test_unique_temp_path_is_fresh_and_beside_target(tmp_path):
+    target = str(tmp_path / "payments_1.xlsx")
+    first, second = main.unique_temp_path(target, ".upload"), main.unique_temp_path(target, ".upload")
+    assert first != second
+    assert os.path.dirname(first) == str(tmp_path) and first.endswith(".upload")
+
+
+def test_archive_is_uploaded_only_when_it_changes(tmp_path):
+    drive = main.FakeDrive(str(tmp_path / "drive"))
+    a = replica(tmp_path, "a", drive, window=12)
+    a.set_payment("1", "alice", "2020-01", True)
+    assert a.archive_history() == 1
+    assert a.upload_to_google_drive()
+    archive_id = drive.find_file("payments_1.archive.db")
+    revision = drive.metadata(archive_id)["headRevisionId"]
+
+    a.set_payment("1", "alice", main.billing_month(15), True)
+    assert a.upload_to_google_drive()
+    assert drive.metadata(archive_id)["headRevisionId"] == revision
+    a.close()
+
+
+def test_merge_persists_outside_the_lock_and_keeps_concurrent_mutations(tmp_path):
+    drive = main.FakeDrive(str(tmp_path / "drive"))
+    current = main.billing_month(15)
+    a = replica(tmp_path, "a", drive, backend="journal")
+    a.set_payment("1", "alice", current, True)
+    assert a.upload_to_google_drive()
+    b = replica(tmp_path, "b", drive)
+    assert b.load_from_google_drive()
+    b.set_payment("2", "bob", current, True)
+    assert b.upload_to_google_drive()
+
+    write_workbook = a._write_workbook
+    seen = []
+
+    def slow_write(snapshot, filename=None):
+        if filename is None and not seen:
+            # Durante a gravação do merge o event loop continua lendo e alterando os dados
+            worker = threading.Thread(target=lambda: seen.append(
+                (a.get_main_account("1"), a.set_payment("3", "carol", current, True))
+            ))
+            worker.start()
+            worker.join(timeout=5)
+            assert not worker.is_alive()
+        write_workbook(snapshot, filename)
+
+    a._write_workbook = slow_write
+    assert a.load_from_google_drive()
+    assert seen == [("1", None)]
+    a.close()
+
+    reopened = replica(tmp_path, "a", drive, backend="journal")
+    assert set(reopened.data["members"]) == {"1", "2", "3"}
+    reopened.close()
+    b.close()
+
+
+def test_merge_base_stays_on_disk_and_is_read_only_for_remote_changes(tmp_path):
+    drive = main.FakeDrive(str(tmp_path / "drive"))
+    current = main.billing_month(15)
+    a = replica(tmp_path, "a", drive)
+    a.set_payment("1", "alice", current, True)
+    assert a.upload_to_google_drive()
+    assert not hasattr(a, "_sync_base")
+    assert os.path.exists(a._base_path)
+
+    reads = []
+    read_sync_base = a._read_sync_base
+    a._read_sync_base = lambda: reads.append(1) or read_sync_base()
+    assert not a.load_from_google_drive()
+    assert reads == []
+
+    b = replica(tmp_path, "b", drive)
+    assert b.load_from_google_drive()
+    b.set_payment("2", "bob", current, True)
+    assert b.upload_to_google_drive()
+    a.set_payment("3", "carol", current, True)
+    assert a.load_from_google_drive()
+    assert reads == [1]
+    assert set(a.data["members"]) == {"1", "2", "3"}
+    a.close()
+    b.close()
+
+
+def test_legacy_sync_state_moves_the_base_out_of_memory(tmp_path):
+    drive = main.FakeDrive(str(tmp_path / "drive"))
+    a = replica(tmp_path, "a", drive)
+    base = dict(main.EMPTY_SNAPSHOT, payment_day=15)
+    main.write_json(a._sync_path, {"file_id": "x", "version": ["1", "2", "3"], "base": base})
+    a.close()
+
+    a = replica(tmp_path, "a", drive)
+    assert a._read_sync_base() == base
+    with open(a._sync_path, encoding="utf-8") as state_file:
+        assert "base" not in json.load(state_file)
+    a.close()
+
+
+def snapshot(members=None, **fields):
+    return {**main.EMPTY_SNAPSHOT, "members": members or {}, **fields}
+
+
+def member(username, payments=None, late=()):
+    return {"username": username, "payments": payments or {}, "late": list(late)}
+
+
+def test_merge_keeps_changes_from_both_sides():
+    base = snapshot({"1": member("alice", {"2026-01": False})}, payment_day=10)
+    local = snapshot({"1": member("alice", {"2026-01": True})}, payment_day=10, auto_paid_members=["1"])
+    remote = snapshot(
+        {"1": member("alice", {"2026-01": False, "2026-02": True}), "2": member("bob")},
+        payment_day=15, account_links={"2": "1"},
+    )
+
+    merged, conflicts = main.merge_snapshots(base, local, remote)
+    assert conflicts == 0
+    assert merged["members"] == {"1": member("alice", {"2026-01": True, "2026-02": True}), "2": member("bob")}
+    assert merged["payment_day"] == 15
+    assert merged["account_links"] == {"2": "1"}
+    assert merged["auto_paid_members"] == ["1"]
+
+
+def test_merge_conflicts_prefer_the_recorded_payment_and_local_values():
+    base = snapshot({"1": member("alice", {"2026-01": False})}, payment_day=10)
+    local = snapshot({"1": member("alice-local", {"2026-01": False}, late=["2026-01"])}, payment_day=12)
+    remote = snapshot({"1": member("alice-remote", {"2026-01": True}, late=["2026-01"])}, payment_day=20)
+    # Os dois lados mudaram o nome, o mês 2026-01 (local: atraso; Drive: pago com atraso) e o dia
+
+    merged, conflicts = main.merge_snapshots(base, local, remote)
+    assert merged["members"]["1"] == member("alice-local", {"2026-01": True}, late=["2026-01"])
+    assert merged["payment_day"] == 12
+    assert conflicts == 3
+
+
+def test_merge_keeps_members_removed_on_one_side_and_changed_on_the_other():
+    base = snapshot({"1": member("alice"), "2": member("bob")}, auto_paid_members=["1", "2"])
+    local = snapshot({"1": member("alice", {"2026-01": True})}, auto_paid_members=["1"])
+    remote = snapshot({"2": member("bob")}, auto_paid_members=["1", "2"])
+
+    merged, conflicts = main.merge_snapshots(base, local, remote)
+    # alice: removida no Drive mas paga localmente (mantida, com conflito); bob: removido localmente
+    assert merged["members"] == {"1": member("alice", {"2026-01": True})}
+    assert conflicts == 1
+    assert merged["auto_paid_members"] == ["1"]
+
+
+def test_merge_without_base_treats_everything_as_added():
+    local = snapshot({"1": member("alice", {"2026-01": True})})
+    remote = snapshot({"1": member("alice", {"2026-01": False, "2026-02": True})})
+
+    merged, conflicts = main.merge_snapshots(None, local, remote)
+    assert merged["members"]["1"]["payments"] == {"2026-01": True, "2026-02": True}
+    assert conflicts == 1